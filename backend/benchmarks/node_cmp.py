@@ -0,0 +1,75 @@
+"""Benchmark comparison data engines
+
+$ python benchmarks/node_cmp.py
+"""
+
+import random
+import time
+from typing import List, Tuple
+
+from otgpt_hft.data_model.cmp import DB_ResponseCmp
+from otgpt_hft.data_model.dialogue.node import DialogueNodeCmp, NodeCmpFactory
+from otgpt_hft.data_model.dialogue.node_bitset import BitsetDialogueNodeCmp
+from otgpt_hft.data_model.dialogue.testing import random_rank, ranked_cmp
+from otgpt_hft.data_model.source import UserSource
+
+ENGINES: List[Tuple[str, NodeCmpFactory]] = [
+    ("set", DialogueNodeCmp),
+    ("bitset", BitsetDialogueNodeCmp),
+]
+N_NODES = [4, 16, 64, 256]
+N_REPEAT = 3
+SOURCE = UserSource(uname="bench")
+
+
+def make_cmps(nodes: List[str], seed: int) -> List[DB_ResponseCmp]:
+    """comparisons consistent with a random ranking, until all pairs are covered"""
+    rng = random.Random(seed)
+    # pairs are picked with the global random
+    random.seed(seed)
+    rank = random_rank(rng, nodes, len(nodes))
+    # rank all nodes like an annotator would, one unrelated pair at a time
+    cmp = BitsetDialogueNodeCmp(nodes)
+    cmps: List[DB_ResponseCmp] = []
+    while True:
+        cmp.coverage_cache = None
+        _, _, pair = cmp.compute_coverage()
+        if pair is None:
+            return cmps
+        cmp_data = ranked_cmp(rank, *pair, SOURCE)
+        cmp.add_cmp_data(cmp_data)
+        cmps.append(cmp_data)
+
+
+def run(factory: NodeCmpFactory, nodes: List[str], cmps: List[DB_ResponseCmp]):
+    cmp = factory(nodes)
+    for cmp_data in cmps:
+        cmp.add_cmp_data(cmp_data)
+        cmp.compute_coverage()
+    for node_a in nodes:
+        for node_b in nodes:
+            cmp.get_cmp(node_a, node_b)
+    assert not cmp.find_issues(inspect=False)
+
+
+def main():
+    print(f"{'nodes':>6} {'cmps':>6} " + " ".join(f"{n:>10}" for n, _ in ENGINES))
+    for n_nodes in N_NODES:
+        nodes = [f"n{i}" for i in range(n_nodes)]
+        cmps = make_cmps(nodes, seed=n_nodes)
+        timings: List[float] = []
+        for _, factory in ENGINES:
+            best = float("inf")
+            for _ in range(N_REPEAT):
+                start = time.perf_counter()
+                run(factory, nodes, cmps)
+                best = min(best, time.perf_counter() - start)
+            timings.append(best)
+        print(
+            f"{n_nodes:>6} {len(cmps):>6} "
+            + " ".join(f"{t * 1000:>8.2f}ms" for t in timings)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Simulate annotators ranking nodes with each pair selection strategy
+
+Reports the average number of comparisons until a node is fully ordered.
+
+$ python benchmarks/pair_selection.py
+"""
+
+import math
+import random
+
+from otgpt_hft.data_model.dialogue.node import DialogueNodeCmp
+from otgpt_hft.data_model.dialogue.pair_selection import PAIR_SELECTORS, PairSelector
+from otgpt_hft.data_model.dialogue.testing import random_rank, ranked_cmp
+from otgpt_hft.data_model.source import UserSource
+
+N_NODES = [3, 4, 6, 8, 12, 16]
+N_TRIALS = 200
+SOURCE = UserSource(uname="bench")
+
+
+def simulate(pair_selector: PairSelector, n_nodes: int, seed: int) -> int:
+    """number of comparisons until all pairs are related"""
+    rng = random.Random(seed)
+    random.seed(seed)
+    nodes = [f"n{i}" for i in range(n_nodes)]
+    # hidden ranking of the annotator, with ties
+    rank = random_rank(rng, nodes, n_nodes)
+
+    cmp = DialogueNodeCmp(nodes)
+    n_cmps = 0
+    while True:
+        _, _, pair = cmp.compute_coverage(pair_selector=pair_selector)
+        if pair is None:
+            return n_cmps
+        cmp.add_cmp_data(ranked_cmp(rank, *pair, SOURCE))
+        n_cmps += 1
+
+
+def main():
+    print(
+        f"{'nodes':>6} {'pairs':>6} {'log2(n!)':>9} "
+        + " ".join(f"{name:>10}" for name in PAIR_SELECTORS)
+    )
+    for n_nodes in N_NODES:
+        averages = [
+            sum(
+                simulate(pair_selector, n_nodes, seed=trial)
+                for trial in range(N_TRIALS)
+            )
+            / N_TRIALS
+            for pair_selector in PAIR_SELECTORS.values()
+        ]
+        print(
+            f"{n_nodes:>6} {n_nodes * (n_nodes - 1) // 2:>6} "
+            f"{math.log2(math.factorial(n_nodes)):>9.2f} "
+            + " ".join(f"{average:>10.2f}" for average in averages)
+        )
+
+
+if __name__ == "__main__":
+    main()
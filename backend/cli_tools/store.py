@@ -95,6 +95,35 @@ async def validate_stores():
                 print(split_dir, "ok")
 
 
+@app.command(name="snapshot")
+@async_to_sync
+async def snapshot_stores():
+    """build binary snapshots of all splits for fast startup"""
+    for dataset_name in os.listdir(DATA_STORE_PATH):
+        dataset_dir = DATA_STORE_PATH / dataset_name
+
+        # list all splits in the dataset
+        for split_name in os.listdir(dataset_dir):
+            split_dir = dataset_dir / split_name
+
+            if not os.path.isdir(split_dir):
+                continue
+
+            # load split data
+            store = Store(
+                SerializedEntry,
+                split_dir,
+            )
+
+            if await store.load_snapshot():
+                print(split_dir, "up to date")
+                continue
+
+            await store.load_chunks()
+            await store.save_snapshot()
+            print(split_dir, "ok")
+
+
 @app.command(name="inspect")
 @async_to_sync
 async def inspect_store(dataset_name: str, split_name: str, entry_id: str):
@@ -109,7 +138,7 @@ async def inspect_store(dataset_name: str, split_name: str, entry_id: str):
 
     await store.load_chunks()
 
-    entry = store.get(entry_id)
+    entry = await store.get_view(entry_id)
 
     if entry is None:
         print("entry not found")
@@ -0,0 +1,115 @@
+"""Annotation assignment bookkeeping"""
+
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from ..data_model.abs import InstanceId
+from ..data_model.source import SourceName
+
+# entry id, node id
+AnnoUnit = Tuple[InstanceId, InstanceId]
+
+
+class AnnoUnitIndex:
+    """Annotation units of all entries in a single split
+
+    An entry's units are its branching nodes, which have two or more next utterances.
+    Entries are kept in split order (new entries last), and re-indexed when they change.
+    """
+
+    def __init__(self) -> None:
+        # entry id -> ids of branching nodes
+        self._entry_nodes: Dict[InstanceId, List[InstanceId]] = {}
+        # entry id -> sources with comparisons on the entry
+        self._entry_sources: Dict[InstanceId, Set[SourceName]] = {}
+        self._n_units = 0
+        self.last_unit: Optional[AnnoUnit] = None
+
+    def __len__(self) -> int:
+        return self._n_units
+
+    def __iter__(self) -> Iterator[AnnoUnit]:
+        """units in split order"""
+        for entry_id, node_ids in self._entry_nodes.items():
+            for node_id in node_ids:
+                yield entry_id, node_id
+
+    def set_entry(
+        self,
+        entry_id: InstanceId,
+        node_ids: List[InstanceId],
+        src_names: Set[SourceName],
+    ) -> List[AnnoUnit]:
+        """Index (or re-index) the entry
+
+        Args:
+            entry_id (InstanceId): entry
+            node_ids (List[InstanceId]): ids of branching nodes of the entry
+            src_names (Set[SourceName]): sources with comparisons on the entry
+
+        Returns:
+            List[AnnoUnit]: units which are new to the index
+        """
+        self._entry_sources[entry_id] = src_names
+        prev_node_ids = self._entry_nodes.get(entry_id, [])
+        # utterances are only added, so a node never stops branching
+        new_node_ids = [
+            node_id for node_id in node_ids if node_id not in prev_node_ids
+        ]
+        if len(new_node_ids) == 0:
+            return []
+
+        self._entry_nodes[entry_id] = [*prev_node_ids, *new_node_ids]
+        self._n_units += len(new_node_ids)
+        new_units = [(entry_id, node_id) for node_id in new_node_ids]
+        if entry_id == next(reversed(self._entry_nodes)):
+            self.last_unit = new_units[-1]
+        return new_units
+
+    def get_entry_ids(self) -> Iterator[InstanceId]:
+        """entries with units, in split order"""
+        return iter(self._entry_nodes)
+
+    def get_sources(self, entry_id: InstanceId) -> Set[SourceName]:
+        """sources with comparisons on the entry (do not modify)"""
+        return self._entry_sources.get(entry_id, set())
+
+
+class AssignmentIndex:
+    """Incomplete annotation units of a single user in a single split
+
+    Units are kept in split order, so the next unit to annotate is found in O(1),
+    and a completed unit is removed in O(1).
+    """
+
+    def __init__(
+        self, incomplete_units: Iterable[AnnoUnit], last_unit: Optional[AnnoUnit]
+    ):
+        """
+        Args:
+            incomplete_units (Iterable[AnnoUnit]): units the user has not completed, in split order
+            last_unit (Optional[AnnoUnit]): last annotatable unit of the split (complete or not)
+        """
+        self._incomplete: OrderedDict[AnnoUnit, None] = OrderedDict(
+            (unit, None) for unit in incomplete_units
+        )
+        self.last_unit = last_unit
+
+    def __len__(self) -> int:
+        return len(self._incomplete)
+
+    def __contains__(self, unit: AnnoUnit) -> bool:
+        """unit is incomplete"""
+        return unit in self._incomplete
+
+    def peek(self) -> Optional[AnnoUnit]:
+        """next incomplete unit, None if all units are completed"""
+        return next(iter(self._incomplete), None)
+
+    def complete(self, unit: AnnoUnit):
+        self._incomplete.pop(unit, None)
+
+    def add(self, unit: AnnoUnit):
+        """add a unit new to the split, as the last unit"""
+        self._incomplete[unit] = None
+        self.last_unit = unit
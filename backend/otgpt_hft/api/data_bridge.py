@@ -1,32 +1,82 @@
 from __future__ import annotations
 
 import asyncio
+import functools
 import logging
 import math
 import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
 from pathlib import Path
-from typing import Annotated, Any, Dict, List, Literal, Optional, Tuple, Union
+from typing import (
+    Annotated,
+    Any,
+    Awaitable,
+    Callable,
+    Collection,
+    Dict,
+    List,
+    Literal,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
+from urllib.parse import quote
 from uuid import uuid4
 
 import aiofiles
 import aiofiles.os
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 
 from otgpt_hft.auth import is_session_logged_in
 from otgpt_hft.data_model.abs import InstanceId
 from otgpt_hft.data_model.cmp import DB_ResponseCmp
 from otgpt_hft.data_model.dialogue.error import DataIntegrityError
-from otgpt_hft.data_model.dialogue.graph import DialogueGraph
-from otgpt_hft.data_model.source import UserSource
-from otgpt_hft.tooling.pub_sub.channel import Channel
+from otgpt_hft.data_model.dialogue.graph import (
+    DialogueGraph,
+    get_branching_node_ids,
+    get_completed_node_ids,
+)
+from otgpt_hft.data_model.dialogue.node import DialogueNodeCmp, NodeCmpFactory
+from otgpt_hft.data_model.dialogue.pair_selection import (
+    PairSelector,
+    select_random_pair,
+)
+from otgpt_hft.data_model.dialogue.state import GraphCmpState
+from otgpt_hft.data_model.source import SourceName, UserSource
+from otgpt_hft.tooling.pub_sub.channel import Channel, DeltaChannel
 from otgpt_hft.utils.bm.channel import wrap_channel_type
+from otgpt_hft.utils.file import safe_write_file
 from otgpt_hft.utils.min_bg_task import MinBGTasks
 
 from ..data_model.serial.entry import SerializedEntry
+from ..data_model.serial.save_scheduler import (
+    DEFAULT_SAVE_MAX_PENDING,
+    DEFAULT_SAVE_WINDOW_S,
+    SaveScheduler,
+)
 from ..data_model.serial.store import Store
-from ..tooling.pub_sub.base import ChannelName, SubscriptionAReq, SubscriptionARes
+from ..data_model.serial.wal import WriteAheadLog
+from ..tooling.client_exc import ClientException
+from ..tooling.pub_sub.base import (
+    BatchSubscriptionAReq,
+    ChannelName,
+    Subscriber,
+    SubscriptionAReq,
+    SubscriptionARes,
+    SubscriptionPatchARes,
+)
+from ..tooling.pub_sub.frame_cache import DEFAULT_FRAME_CACHE_MAX_SIZE, FrameCache
 from ..tooling.pub_sub.pub_sub_ex import ExtensiblePubSub, PChannel
+from ..tooling.pub_sub.sub_queue import (
+    DEFAULT_OVERFLOW_POLICY,
+    DEFAULT_SUB_QUEUE_SIZE,
+    OverflowPolicy,
+)
 from ..tooling.ws.connection import (
+    DEFAULT_MAX_CONCURRENT_FETCH,
     AbsTypedWebSocket,
     FPayloadBM,
     PSession,
@@ -34,6 +84,8 @@ from ..tooling.ws.connection import (
     TypedWebSocketHandler,
     combine_fa_req,
 )
+from .assignment import AnnoUnit, AnnoUnitIndex, AssignmentIndex
+from .scheduler import DEFAULT_ANNO_LEASE_S, DEFAULT_ANNO_OVERLAP, WorkScheduler
 
 logger = logging.getLogger(__name__)
 
@@ -44,6 +96,8 @@ class AnnoRefBM(BaseModel):
     entry: str
     idx: int
     cmpId: Optional[str]
+    # annotated (branching) node, root node if not given
+    node: Optional[str] = None
 
 
 class WhoAmIReq(FPayloadBM[Literal["whoami"]]):
@@ -109,21 +163,39 @@ IndexChannelName = Union[
     Tuple[Literal["index"], str, str, Literal["meta"]],
 ]
 
+# entry channels matching a pattern, `*` matches any segment (e.g. any entry id)
+# and a trailing `**` the remaining segments
+EntryPatternName = Union[
+    Tuple[Literal["entry"], Literal["**"]],
+    Tuple[Literal["entry"], str, Literal["**"]],
+    Tuple[Literal["entry"], str, str, Literal["**"]],
+]
+
 DBChannelName = Union[
     IndexChannelName,
     EntryChannelName,
+    EntryPatternName,
 ]
 WDBChannelName = wrap_channel_type(DBChannelName)
+CH = TypeVar("CH", IndexChannelName, EntryChannelName)
 
 
 class DBDatasetSubReq(SubscriptionAReq[WDBChannelName]):
     """DataBridge Dataset Subscription Request"""
 
 
+class DBDatasetBatchSubReq(BatchSubscriptionAReq[WDBChannelName]):
+    """DataBridge Dataset Batch Subscription Request"""
+
+
 class DBDatasetSubRes(SubscriptionARes[WDBChannelName]):
     """DataBridge Dataset Subscription Response"""
 
 
+class DBDatasetPatchRes(SubscriptionPatchARes[WDBChannelName]):
+    """DataBridge Dataset Subscription Patch Response"""
+
+
 FetchReq = Annotated[
     Union[WhoAmIReq, AssignedAnnoReq, AnnoCmpReq],
     Field(discriminator="type"),
@@ -132,12 +204,78 @@ FetchRes = Annotated[
     Union[WhoAmIRes, AssignedAnnoRes, AnnoCmpRes],
     Field(discriminator="type"),
 ]
-AsyncReq = DBDatasetSubReq
+AsyncReq = Annotated[
+    Union[DBDatasetSubReq, DBDatasetBatchSubReq],
+    Field(discriminator="type"),
+]
 AsyncRes = DBDatasetSubRes
 
 
 METADATA_FILENAME = "metadata.json"
+CMP_WAL_FILENAME = "cmp.wal"
+CMP_STATE_DIRNAME = "cmp_state"
 PAGE_SIZE = 10
+# entry fields left out of entry and index channel messages, see `_get_entry`
+UNPUBLISHED_ENTRY_FIELDS = frozenset({"cmps"})
+
+
+class CmpLogRecord(BaseModel):
+    """Comparison record in a split's write-ahead log"""
+
+    entry: InstanceId
+    cmp: DB_ResponseCmp
+
+
+def _append_cmp(cmp: DB_ResponseCmp, serial: SerializedEntry) -> Dict[str, Any]:
+    """`Store.update` callback for appending a comparison to an entry"""
+    return {"cmps": [*serial.cmps, cmp]}
+
+
+def _get_anno_node_id(dialogue_graph: DialogueGraph, ref: AnnoRefBM) -> InstanceId:
+    """node addressed by the reference, the root node if not given"""
+    node_id = ref.node if ref.node is not None else dialogue_graph.root.unit.id
+    if node_id not in dialogue_graph.branching_nodes:
+        raise ClientException(
+            "invalid node",
+            f"node id '{node_id}' is not a branching node of entry '{ref.entry}'",
+        )
+    return node_id
+
+
+def _plan_batch_sub(
+    sub_channels: List[ChannelName], reqs: List[SubscriptionAReq[Any]]
+) -> Optional[
+    Tuple[List[ChannelName], List[Tuple[ChannelName, Optional[int]]], List[ChannelName]]
+]:
+    """Validate a batch of subscription requests against the session's channels
+
+    A channel subscribed and then unsubscribed within the batch is left out, so it is
+    neither subscribed to nor sent its initial message.
+
+    Returns:
+        Optional[Tuple[...]]: channels of the session after the batch, channels (and
+        versions) to subscribe to and channels to unsubscribe from, None if invalid
+    """
+    sub_channels = list(sub_channels)
+    subs: List[Tuple[ChannelName, Optional[int]]] = []
+    unsubs: List[ChannelName] = []
+    for req in reqs:
+        if req.type == "sub":
+            if req.channel in sub_channels:
+                return None
+            sub_channels.append(req.channel)
+            subs.append((req.channel, req.version))
+        else:
+            if req.channel not in sub_channels:
+                return None
+            sub_channels.remove(req.channel)
+            batch_subs = [ch for ch, _ in subs]
+            if req.channel in batch_subs:
+                # cancels the subscription made earlier in the batch
+                subs.pop(batch_subs.index(req.channel))
+            else:
+                unsubs.append(req.channel)
+    return sub_channels, subs, unsubs
 
 
 class StoreMetadataBM(BaseModel):
@@ -190,8 +328,10 @@ class Session(PSession):
         self.logger = logging.LoggerAdapter(logger, {"session": session_name})
 
         self.sub_channels: List[ChannelName] = []
+        db.sessions[t_ws.send] = self
 
     def on_close(self):
+        self.db.sessions.pop(self.t_ws.send, None)
         for ch in self.sub_channels:
             self.db.pub_sub.unsubscribe(ch, self.t_ws.send)
 
@@ -200,28 +340,154 @@ DatasetName = str
 SplitName = str
 SplitAddress = Tuple[DatasetName, SplitName]
 
+# split annotated when no annotation reference is given
+DEFAULT_ANNO_SPLIT: SplitAddress = ("Thaweewat-oasst1_th", "dev")
+# maximum number of dialogue graphs kept in memory
+DEFAULT_GRAPH_CACHE_SIZE = 4096
+# maximum number of entry channels without subscribers kept for resuming subscribers
+DEFAULT_PARKED_CHANNELS = 256
+# close code of a connection whose subscriber was removed from a channel (e.g. fell behind
+# with "disconnect" overflow policy), the client reconnects and resumes its subscriptions
+SUB_DISCONNECT_CLOSE_CODE = 4001
+
 
 class DataBridge(
     TypedWebSocketHandler[Session, FetchReq, FetchRes, AsyncReq, AsyncRes]
 ):
     ReqType = combine_fa_req(FetchReq, AsyncReq)
 
-    def __init__(self) -> None:
-        super().__init__(logging.LoggerAdapter(logger, {"handler": "data-bridge"}))
+    def __init__(
+        self,
+        store_lazy: bool = False,
+        store_max_loaded_chunks: Optional[int] = None,
+        save_window_s: float = DEFAULT_SAVE_WINDOW_S,
+        save_max_pending: int = DEFAULT_SAVE_MAX_PENDING,
+        parse_workers: Optional[int] = None,
+        store_snapshot: bool = False,
+        frame_cache_max_size: int = DEFAULT_FRAME_CACHE_MAX_SIZE,
+        cmp_factory: NodeCmpFactory = DialogueNodeCmp,
+        anno_split: SplitAddress = DEFAULT_ANNO_SPLIT,
+        graph_cache_size: int = DEFAULT_GRAPH_CACHE_SIZE,
+        cmp_snapshot: bool = True,
+        pair_selector: PairSelector = select_random_pair,
+        anno_overlap: int = DEFAULT_ANNO_OVERLAP,
+        anno_lease_s: float = DEFAULT_ANNO_LEASE_S,
+        max_concurrent_fetch: int = DEFAULT_MAX_CONCURRENT_FETCH,
+        sub_queue_size: int = DEFAULT_SUB_QUEUE_SIZE,
+        sub_overflow_policy: OverflowPolicy = DEFAULT_OVERFLOW_POLICY,
+        parked_channels: int = DEFAULT_PARKED_CHANNELS,
+    ) -> None:
+        """
+        Args:
+            store_lazy (bool, optional): parse store chunks on first access instead of at startup. Defaults to False.
+            store_max_loaded_chunks (Optional[int], optional): maximum number of parsed chunks per split in lazy mode. Defaults to None (unbounded).
+            save_window_s (float, optional): seconds to coalesce annotations before folding a split's WAL into its store. Defaults to DEFAULT_SAVE_WINDOW_S.
+            save_max_pending (int, optional): number of pending annotations which triggers folding before the window ends. Defaults to DEFAULT_SAVE_MAX_PENDING.
+            parse_workers (Optional[int], optional): number of worker processes for parsing store chunks at startup. Defaults to None (parse in the event loop).
+            store_snapshot (bool, optional): load stores from binary snapshots when they are up to date, and write snapshots on close. Defaults to False.
+            frame_cache_max_size (int, optional): maximum total size of cached encoded channel messages. Defaults to DEFAULT_FRAME_CACHE_MAX_SIZE.
+            cmp_factory (NodeCmpFactory, optional): comparison data engine of dialogue nodes. Defaults to DialogueNodeCmp.
+            anno_split (SplitAddress, optional): split annotated when no annotation reference is given. Defaults to DEFAULT_ANNO_SPLIT.
+            graph_cache_size (int, optional): maximum number of dialogue graphs kept in memory. Defaults to DEFAULT_GRAPH_CACHE_SIZE.
+            cmp_snapshot (bool, optional): restore comparison data of dialogue graphs from states written at checkpoints, instead of replaying all comparisons. Defaults to True.
+            pair_selector (PairSelector, optional): strategy picking the next pair shown to annotators. Defaults to select_random_pair.
+            anno_overlap (int, optional): distinct annotators aimed for per annotation unit. Defaults to DEFAULT_ANNO_OVERLAP.
+            anno_lease_s (float, optional): seconds an annotator holds an assigned annotation unit. Defaults to DEFAULT_ANNO_LEASE_S.
+            max_concurrent_fetch (int, optional): maximum number of fetch requests of a connection handled at once. Defaults to DEFAULT_MAX_CONCURRENT_FETCH.
+            sub_queue_size (int, optional): maximum number of channel messages queued per subscriber. Defaults to DEFAULT_SUB_QUEUE_SIZE.
+            sub_overflow_policy (OverflowPolicy, optional): handling of channel messages published to a full subscriber queue. Defaults to DEFAULT_OVERFLOW_POLICY.
+            parked_channels (int, optional): maximum number of entry channels without subscribers kept up to date, so a resubscribing client only receives the patches it missed. Defaults to DEFAULT_PARKED_CHANNELS.
+        """
+        super().__init__(
+            logging.LoggerAdapter(logger, {"handler": "data-bridge"}),
+            max_concurrent_fetch=max_concurrent_fetch,
+        )
+
+        self.store_lazy = store_lazy
+        self.store_max_loaded_chunks = store_max_loaded_chunks
+        self.save_window_s = save_window_s
+        self.save_max_pending = save_max_pending
+        self.parse_workers = parse_workers
+        self.store_snapshot = store_snapshot and not store_lazy
+        self.cmp_factory = cmp_factory
+        self.anno_split = anno_split
+        self.graph_cache_size = graph_cache_size
+        self.cmp_snapshot = cmp_snapshot
+        self.pair_selector = pair_selector
+        self.anno_overlap = anno_overlap
+        self.anno_lease_s = anno_lease_s
+        self.sub_queue_size = sub_queue_size
+        self.sub_overflow_policy: OverflowPolicy = sub_overflow_policy
+        self.parked_channels = parked_channels
 
         self.pub_sub = ExtensiblePubSub()
         self.dataset_to_split: Dict[DatasetName, List[SplitName]] = {}
         self.dataset_meta: Dict[DatasetName, StoreMetadata] = {}
         self.split_meta: Dict[SplitAddress, StoreMetadata] = {}
         self.stores: Dict[SplitAddress, Store[SerializedEntry]] = {}
+        self.split_dirs: Dict[SplitAddress, Path] = {}
+        # comparison write-ahead log of each split
+        self.cmp_wals: Dict[SplitAddress, WriteAheadLog[CmpLogRecord]] = {}
+        # lock for appending to a WAL and folding it into its store
+        self.cmp_wal_locks: Dict[SplitAddress, asyncio.Lock] = {}
+        # group-commit scheduler folding a split's WAL into its store
+        self.save_schedulers: Dict[SplitAddress, SaveScheduler] = {}
         self.bg_tasks = MinBGTasks()
+        # dialogue graphs built on first access, least recently used first
+        self.dialogue_graphs: OrderedDict[
+            Tuple[SplitAddress, InstanceId], DialogueGraph
+        ] = OrderedDict()
+        # lock for building a split's dialogue graphs and annotating them
+        self.graph_locks: Dict[SplitAddress, asyncio.Lock] = {}
+        # entries whose dialogue graph got comparisons since its state was last written
+        self.dirty_graphs: Dict[SplitAddress, Set[InstanceId]] = {}
+        # states of dirty dialogue graphs evicted from the cache, written at the next checkpoint
+        self.evicted_cmp_states: Dict[SplitAddress, Dict[InstanceId, GraphCmpState]] = {}
+        # annotation units of each split, built on first assignment
+        self.anno_unit_indices: Dict[SplitAddress, AnnoUnitIndex] = {}
+        # entries set since they were indexed, re-indexed on next assignment
+        self.stale_anno_entries: Dict[SplitAddress, Set[InstanceId]] = {}
+        # annotation units handed out among users of each split
+        self.work_schedulers: Dict[SplitAddress, WorkScheduler] = {}
+        # incomplete annotation units of each user in each split
+        self.assignment_indices: Dict[
+            Tuple[SourceName, SplitAddress], AssignmentIndex
+        ] = {}
+        # encoded messages of index and entry channels
+        self.frame_cache = FrameCache(frame_cache_max_size)
+        # entry channels without subscribers, least recently used first
+        self.parked_entry_channels: OrderedDict[
+            EntryChannelName, DeltaChannel[DBDatasetSubRes, DBDatasetPatchRes]
+        ] = OrderedDict()
+        # session of each subscriber
+        self.sessions: Dict[Subscriber, Session] = {}
 
     def set_loop(self, loop: asyncio.AbstractEventLoop):
         self.bg_tasks.set_loop(loop)
 
+    async def close(self):
+        """fold pending WAL records into the stores"""
+        for save_scheduler in self.save_schedulers.values():
+            await save_scheduler.flush()
+
+        if self.store_snapshot:
+            # snapshot for fast startup
+            for split_address, store in self.stores.items():
+                try:
+                    await store.save_snapshot()
+                except (ValueError, OSError) as e:
+                    logger.error(
+                        {
+                            "msg": "cannot save snapshot",
+                            "split": split_address,
+                            "error": e,
+                        }
+                    )
+
     async def load_data(self, store_path: Path):
         """load and initialize DataBridge data"""
         start_time = time.perf_counter()
+        split_dirs: Dict[SplitAddress, Path] = {}
 
         # iterate over directory to load data
         for dataset_name in await aiofiles.os.listdir(store_path):
@@ -256,37 +522,31 @@ class DataBridge(
                         bm=StoreMetadataBM.model_validate_json(file.read()),
                     )
 
-                # load split data
-                store = Store(
-                    SerializedEntry,
-                    split_dir,
-                )
-                self.stores[dataset_name, split_name] = store
-                await store.load_chunks()
+                split_dirs[dataset_name, split_name] = split_dir
 
             self.dataset_to_split[dataset_name] = dataset_to_split
 
+        # load splits concurrently, chunks are parsed in worker processes if enabled
+        executor = (
+            ProcessPoolExecutor(self.parse_workers)
+            if self.parse_workers is not None
+            else None
+        )
+        try:
+            await asyncio.gather(
+                *(
+                    self._load_split(split_address, split_dir, executor)
+                    for split_address, split_dir in split_dirs.items()
+                )
+            )
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
         # NOTE: there is no good way to make typing work for channel prefix
         self.pub_sub.register_hook(("index",), self._index_hook)  # type: ignore
         self.pub_sub.register_hook(("entry",), self._entry_hook)  # type: ignore
 
-        # TODO lazily create DialogueGraph
-        DATA_TO_ANNO: List[SplitAddress] = [
-            ("Thaweewat-oasst1_th", "dev"),
-        ]
-
-        self.dialogue_graphs: Dict[SplitAddress, Dict[InstanceId, DialogueGraph]] = {}
-
-        for dataset_name, split_name in DATA_TO_ANNO:
-            store = self.stores[dataset_name, split_name]
-            entries = await store.get_entries(0, len(store))
-
-            dialogue_graphs: Dict[InstanceId, DialogueGraph] = {}
-            for entry in entries:
-                dialogue_graphs[entry.get_id()] = DialogueGraph(entry)
-
-            self.dialogue_graphs[dataset_name, split_name] = dialogue_graphs
-
         logger.info(
             {
                 "msg": "done loading data",
@@ -294,7 +554,209 @@ class DataBridge(
             }
         )
 
+    async def _load_split(
+        self,
+        split_address: SplitAddress,
+        split_dir: Path,
+        executor: Optional[Executor],
+    ):
+        # load split data
+        store = Store(
+            SerializedEntry,
+            split_dir,
+            lazy=self.store_lazy,
+            max_loaded_chunks=self.store_max_loaded_chunks,
+        )
+        self.stores[split_address] = store
+        self.split_dirs[split_address] = split_dir
+        self.dirty_graphs[split_address] = set()
+        self.evicted_cmp_states[split_address] = {}
+        store.add_set_listener(functools.partial(self._on_store_set, split_address))
+        if not (self.store_snapshot and await store.load_snapshot()):
+            await store.load_chunks(executor=executor)
+
+        # recover comparisons which have not been folded into the store
+        cmp_wal = WriteAheadLog(CmpLogRecord, split_dir / CMP_WAL_FILENAME)
+        self.cmp_wals[split_address] = cmp_wal
+        self.cmp_wal_locks[split_address] = asyncio.Lock()
+        self.graph_locks[split_address] = asyncio.Lock()
+        await self._replay_cmp_wal(store, cmp_wal)
+        self.save_schedulers[split_address] = SaveScheduler(
+            functools.partial(self.checkpoint, split_address),
+            window_s=self.save_window_s,
+            max_pending=self.save_max_pending,
+        )
+
+    async def _replay_cmp_wal(
+        self,
+        store: Store[SerializedEntry],
+        cmp_wal: WriteAheadLog[CmpLogRecord],
+    ):
+        records = await cmp_wal.read()
+        if len(records) == 0:
+            return
+
+        for record in records:
+            serial = await store.get_view(record.entry)
+            if serial is None:
+                logger.error(
+                    {"msg": "WAL record references a missing entry", "entry": record.entry}
+                )
+                continue
+            # a record may already be in the store, if the last checkpoint did not truncate the WAL
+            if any(cmp.id == record.cmp.id for cmp in serial.cmps):
+                continue
+            await store.update(record.entry, functools.partial(_append_cmp, record.cmp))
+
+        # the WAL is the only copy of the comparisons until the chunks are on disk
+        await store.save(durable=True)
+        await cmp_wal.truncate()
+        logger.info({"msg": "replayed WAL", "records": len(records)})
+
+    async def checkpoint(self, split_address: SplitAddress):
+        """fold the split's comparison WAL into the store's chunk files,
+        and write comparison states of dirty dialogue graphs"""
+        cmp_wal = self.cmp_wals[split_address]
+        async with self.cmp_wal_locks[split_address]:
+            if len(cmp_wal) > 0:
+                await self.stores[split_address].save(durable=True)
+                await cmp_wal.truncate()
+            # comparisons of the graphs are all saved to the store by now
+            cmp_states = self._collect_cmp_states(split_address)
+        if len(cmp_states) == 0:
+            return
+
+        await self._write_cmp_states(split_address, cmp_states)
+        logger.debug(
+            {
+                "msg": "checkpoint",
+                "split": split_address,
+                "stats": self.save_schedulers[split_address].stats,
+            }
+        )
+
+    def _collect_cmp_states(
+        self, split_address: SplitAddress
+    ) -> Dict[InstanceId, GraphCmpState]:
+        cmp_states = self.evicted_cmp_states[split_address]
+        self.evicted_cmp_states[split_address] = {}
+        for entry_id in self.dirty_graphs[split_address]:
+            dialogue_graph = self.dialogue_graphs.get((split_address, entry_id))
+            if dialogue_graph is not None:
+                cmp_states[entry_id] = dialogue_graph.get_cmp_states()
+        self.dirty_graphs[split_address].clear()
+        return cmp_states
+
+    def _get_cmp_state_path(
+        self, split_address: SplitAddress, entry_id: InstanceId
+    ) -> Path:
+        return (
+            self.split_dirs[split_address]
+            / CMP_STATE_DIRNAME
+            / f"{quote(entry_id, safe='')}.json"
+        )
+
+    async def _write_cmp_states(
+        self,
+        split_address: SplitAddress,
+        cmp_states: Dict[InstanceId, GraphCmpState],
+    ):
+        if not self.cmp_snapshot:
+            return
+        await aiofiles.os.makedirs(
+            self.split_dirs[split_address] / CMP_STATE_DIRNAME, exist_ok=True
+        )
+        for entry_id, cmp_state in cmp_states.items():
+            await safe_write_file(
+                self._get_cmp_state_path(split_address, entry_id),
+                cmp_state.model_dump_json(),
+            )
+
+    async def _read_cmp_state(
+        self, split_address: SplitAddress, entry_id: InstanceId
+    ) -> Optional[GraphCmpState]:
+        """comparison state of the entry written at a checkpoint, None if there is none"""
+        if not self.cmp_snapshot:
+            return None
+        path = self._get_cmp_state_path(split_address, entry_id)
+        if not await aiofiles.os.path.exists(path):
+            return None
+        async with aiofiles.open(path) as file:
+            content = await file.read()
+        try:
+            return GraphCmpState.model_validate_json(content)
+        except ValidationError as e:
+            # comparisons are replayed instead
+            logger.error(
+                {"msg": "cannot load comparison state", "path": path, "error": e}
+            )
+            return None
+
     # data bridge methods for preparing data
+    async def _publish_cached(
+        self,
+        ch: CH,
+        channel: Channel[DBDatasetSubRes],
+        get_msg: Callable[[CH], Awaitable[Any]],
+    ):
+        """publish the channel's message, encoded message is served from `frame_cache` if possible"""
+        frame = self.frame_cache.get(ch)
+        if frame is None:
+            generation = self.frame_cache.generation
+            frame = channel.encode(await get_msg(ch))
+            self.frame_cache.put(ch, frame, generation)
+        await channel.publish_encoded(frame)
+
+    def _on_store_set(
+        self,
+        split_address: SplitAddress,
+        entry_id: InstanceId,
+        created: bool,
+        fields: Optional[Collection[str]],
+    ):
+        """invalidate cached frames of channels affected by the entry,
+        and mark the entry for re-indexing its annotation units"""
+        if split_address in self.anno_unit_indices:
+            self.stale_anno_entries[split_address].add(entry_id)
+        if fields is not None and UNPUBLISHED_ENTRY_FIELDS.issuperset(fields):
+            # e.g. a comparison is appended, published messages are unchanged
+            return
+
+        dataset_name, split_name = split_address
+        entry_ch = "entry", dataset_name, split_name, entry_id
+        self.frame_cache.invalidate(entry_ch)
+        if (
+            entry_ch in self.pub_sub.ch_s
+            or entry_ch in self.parked_entry_channels
+            or self.pub_sub.is_followed(entry_ch)
+        ):
+            self.bg_tasks.run(self._publish_entry_change(entry_ch))
+
+        if created:
+            # entries may be allocated to any page when the store is saved
+            self.frame_cache.invalidate_matching(
+                lambda ch: ch[:3] == ("index", dataset_name, split_name)
+            )
+            return
+
+        position = self.stores[split_address].get_position(entry_id)
+        if position is not None:
+            page = position // PAGE_SIZE + 1
+            self.frame_cache.invalidate(("index", dataset_name, split_name, page))
+            if page == 1:
+                self.frame_cache.invalidate(("index", dataset_name, split_name))
+
+    def _on_sub_disconnect(self, sub: Subscriber):
+        """close the connection of a subscriber removed from a channel, its session then
+        unsubscribes from all channels"""
+        session = self.sessions.pop(sub, None)
+        if session is None:
+            return
+        session.logger.error({"msg": "subscriber removed from a channel, closing"})
+        self.bg_tasks.run(
+            session.t_ws.close(SUB_DISCONNECT_CLOSE_CODE, "subscriber disconnected")
+        )
+
     def _index_hook(self, ch: IndexChannelName) -> Channel[DBDatasetSubRes]:
         def _on_destroy_index_channel(channel: PChannel) -> None:
             # do nothing
@@ -304,13 +766,15 @@ class DataBridge(
             ch,
             SARType=DBDatasetSubRes,
             on_empty=_on_destroy_index_channel,
+            max_queue_size=self.sub_queue_size,
+            overflow_policy=self.sub_overflow_policy,
+            on_disconnect=self._on_sub_disconnect,
         )
 
         async def _publish_index_init_msg(
             ch: IndexChannelName, channel: Channel[DBDatasetSubRes]
         ):
-            msg = await self._get_index(ch)
-            await channel.publish(msg)
+            await self._publish_cached(ch, channel, self._get_index)
 
         self.bg_tasks.run(_publish_index_init_msg(ch, channel))
         return channel
@@ -368,38 +832,212 @@ class DataBridge(
                     "bad index channel, index channel must be `DBChannelName`"
                 )
 
-    def _entry_hook(self, ch: EntryChannelName) -> Channel[DBDatasetSubRes]:
-        def _on_destroy_entry_channel(channel: PChannel) -> None:
-            # do nothing
-            pass
+    def _entry_hook(
+        self, ch: EntryChannelName
+    ) -> DeltaChannel[DBDatasetSubRes, DBDatasetPatchRes]:
+        parked_channel = self.parked_entry_channels.pop(ch, None)
+        if parked_channel is not None:
+            return parked_channel
 
-        channel = Channel(
+        def _on_destroy_entry_channel(channel: PChannel) -> None:
+            # keep the channel and its patches for subscribers which come back
+            if self.parked_channels <= 0:
+                return
+            assert isinstance(channel, DeltaChannel)
+            self.parked_entry_channels[ch] = channel
+            while len(self.parked_entry_channels) > self.parked_channels:
+                self.parked_entry_channels.popitem(last=False)
+
+        channel = DeltaChannel(
             ch,
             SARType=DBDatasetSubRes,
+            SPRType=DBDatasetPatchRes,
             on_empty=_on_destroy_entry_channel,
+            max_queue_size=self.sub_queue_size,
+            overflow_policy=self.sub_overflow_policy,
+            on_disconnect=self._on_sub_disconnect,
         )
 
         async def _publish_entry_init_msg(
-            ch: EntryChannelName, channel: Channel[DBDatasetSubRes]
+            ch: EntryChannelName,
+            channel: DeltaChannel[DBDatasetSubRes, DBDatasetPatchRes],
         ):
-            msg = await self._get_entry(ch)
-            await channel.publish(msg)
+            await self._publish_cached(ch, channel, self._get_entry)
 
         self.bg_tasks.run(_publish_entry_init_msg(ch, channel))
         return channel
 
+    async def _publish_entry_change(self, ch: EntryChannelName):
+        """publish the changed entry, as a patch against the entry last published,
+        parked channels are kept up to date for resuming subscribers"""
+        channel = self.pub_sub.ch_s.get(ch)
+        if channel is None:
+            if self.pub_sub.is_followed(ch):
+                # pattern subscribers follow the entry from now on
+                channel = await self.pub_sub.open_channel(ch)
+            else:
+                channel = self.parked_entry_channels.get(ch)
+        if isinstance(channel, DeltaChannel):
+            await channel.publish(await self._get_entry(ch))
+
     async def _get_entry(self, ch: EntryChannelName) -> SerializedEntry:
         _, dataset_name, split_name, entry_id = ch
-        entry = self.stores[dataset_name, split_name].get(entry_id)
+        entry = await self.stores[dataset_name, split_name].get_view(entry_id)
         if entry is None:
             raise ValueError(
                 f"entry id '{entry_id}' does not exist in dataset '{dataset_name}' split '{split_name}'"
             )
         # NOTE: cmps store data for all annotators, which is a lot
         #       so remove them for now, until we have a better solution
-        # remove cmps data
-        entry.cmps = []
-        return entry
+        # project entry without cmps data (shallow copy, the rest is shared with the store)
+        return entry.model_copy(update={"cmps": []})
+
+    async def _get_dialogue_graph(
+        self, split_address: SplitAddress, entry_id: InstanceId
+    ) -> DialogueGraph:
+        """get (or build) the dialogue graph of the entry, the split's graph lock must be held"""
+        key = split_address, entry_id
+        dialogue_graph = self.dialogue_graphs.get(key)
+        if dialogue_graph is not None:
+            self.dialogue_graphs.move_to_end(key)
+            return dialogue_graph
+
+        entry = await self.stores[split_address].get_view(entry_id)
+        if entry is None:
+            raise ValueError(
+                f"entry id '{entry_id}' does not exist in dataset '{split_address[0]}' split '{split_address[1]}'"
+            )
+        # comparisons of each user are added when the user first touches the graph,
+        # restored from the written state when possible
+        dialogue_graph = DialogueGraph(
+            entry,
+            cmp_factory=self.cmp_factory,
+            lazy_cmps=True,
+            cmp_states=await self._read_cmp_state(split_address, entry_id),
+        )
+        self.dialogue_graphs[key] = dialogue_graph
+        while len(self.dialogue_graphs) > self.graph_cache_size:
+            (evicted_split, evicted_entry), evicted_graph = self.dialogue_graphs.popitem(
+                last=False
+            )
+            dirty_graphs = self.dirty_graphs[evicted_split]
+            if evicted_entry in dirty_graphs:
+                dirty_graphs.remove(evicted_entry)
+                self.evicted_cmp_states[evicted_split][
+                    evicted_entry
+                ] = evicted_graph.get_cmp_states()
+        return dialogue_graph
+
+    async def _get_anno_unit_index(self, split_address: SplitAddress) -> AnnoUnitIndex:
+        """get (or build) the annotation unit index of the split,
+        re-indexing changed entries, the split's graph lock must be held"""
+        store = self.stores[split_address]
+        anno_unit_index = self.anno_unit_indices.get(split_address)
+        if anno_unit_index is None:
+            anno_unit_index = AnnoUnitIndex()
+            for entry in await store.get_entries(0, len(store)):
+                anno_unit_index.set_entry(
+                    entry.get_id(),
+                    get_branching_node_ids(entry),
+                    {cmp.source.get_name() for cmp in entry.cmps},
+                )
+            self.anno_unit_indices[split_address] = anno_unit_index
+            self.stale_anno_entries[split_address] = set()
+            return anno_unit_index
+
+        stale_entries = self.stale_anno_entries[split_address]
+        while stale_entries:
+            entry_id = stale_entries.pop()
+            entry = await store.get_view(entry_id)
+            if entry is None:
+                continue
+            new_units = anno_unit_index.set_entry(
+                entry_id,
+                get_branching_node_ids(entry),
+                {cmp.source.get_name() for cmp in entry.cmps},
+            )
+            # new units are queued after existing ones
+            work_scheduler = self.work_schedulers.get(split_address)
+            for unit in new_units:
+                if work_scheduler is not None:
+                    work_scheduler.add_unit(unit)
+                for (_, index_split), index in self.assignment_indices.items():
+                    if index_split == split_address:
+                        index.add(unit)
+        return anno_unit_index
+
+    async def _is_unit_complete(
+        self, split_address: SplitAddress, unit: AnnoUnit, src_name: SourceName
+    ) -> bool:
+        """all pairs of the unit are compared by the source"""
+        entry_id, node_id = unit
+        dialogue_graph = await self._get_dialogue_graph(split_address, entry_id)
+        pairs_w_rel_count, total_pairs, _ = dialogue_graph.get_cmp(
+            node_id, src_name
+        ).compute_coverage(pair_selector=self.pair_selector)
+        return pairs_w_rel_count == total_pairs
+
+    async def _get_assignment_index(
+        self, src_name: SourceName, split_address: SplitAddress
+    ) -> AssignmentIndex:
+        """get (or build) the assignment index of the source (user) for the split,
+        the split's graph lock must be held"""
+        anno_unit_index = await self._get_anno_unit_index(split_address)
+        assignment_index = self.assignment_indices.get((src_name, split_address))
+        if assignment_index is not None:
+            return assignment_index
+
+        incomplete_units: List[AnnoUnit] = []
+        for unit in anno_unit_index:
+            # only graphs the user has annotated are built
+            if src_name in anno_unit_index.get_sources(
+                unit[0]
+            ) and await self._is_unit_complete(split_address, unit, src_name):
+                continue
+            incomplete_units.append(unit)
+
+        assignment_index = AssignmentIndex(incomplete_units, anno_unit_index.last_unit)
+        self.assignment_indices[src_name, split_address] = assignment_index
+        return assignment_index
+
+    async def _get_work_scheduler(self, split_address: SplitAddress) -> WorkScheduler:
+        """get (or build) the work scheduler of the split, recovering completed units from comparison states,
+        the split's graph lock must be held"""
+        anno_unit_index = await self._get_anno_unit_index(split_address)
+        work_scheduler = self.work_schedulers.get(split_address)
+        if work_scheduler is not None:
+            return work_scheduler
+
+        # completed units are read from comparison states, instead of replaying the
+        # comparisons of every source, units completed since the last checkpoint are
+        # found when they are assigned
+        store = self.stores[split_address]
+        done: Dict[AnnoUnit, Set[SourceName]] = {}
+        for entry_id in anno_unit_index.get_entry_ids():
+            if len(anno_unit_index.get_sources(entry_id)) == 0:
+                continue
+            dialogue_graph = self.dialogue_graphs.get((split_address, entry_id))
+            if dialogue_graph is not None:
+                cmp_states = dialogue_graph.get_cmp_states()
+            else:
+                cmp_states = self.evicted_cmp_states[split_address].get(entry_id)
+            if cmp_states is None:
+                cmp_states = await self._read_cmp_state(split_address, entry_id)
+            serial = await store.get_view(entry_id)
+            if cmp_states is None or serial is None:
+                continue
+            completed = get_completed_node_ids(serial, cmp_states)
+            for node_id, src_names in completed.items():
+                done[entry_id, node_id] = src_names
+
+        work_scheduler = WorkScheduler(
+            anno_unit_index,
+            overlap=self.anno_overlap,
+            lease_s=self.anno_lease_s,
+            done=done,
+        )
+        self.work_schedulers[split_address] = work_scheduler
+        return work_scheduler
 
     # data bridge core methods, for interfacing with TypedWebSocketHandler
     async def create_session(
@@ -410,6 +1048,13 @@ class DataBridge(
             raise SessionError(code=4000, reason="not logged in")
         return Session(self, t_ws, session_id, t_ws.req_session["uname"])
 
+    def fetch_order_key(self, session: Session, request: FetchReq) -> Optional[str]:
+        # an annotation is applied before the next assignment is computed,
+        # other requests (e.g. whoami) are not ordered
+        if isinstance(request, (AssignedAnnoReq, AnnoCmpReq)):
+            return "anno"
+        return None
+
     async def handle_fetch_request(
         self,
         t_ws: AbsTypedWebSocket[FetchReq, FetchRes, AsyncReq, AsyncRes],
@@ -421,23 +1066,43 @@ class DataBridge(
         src_name = UserSource(uname=uname).get_name()
 
         if isinstance(request, AssignedAnnoReq):
-            # resolve SplitAddress
-            if request.ref is None:
-                # NOTE: the tool only annotated from one data split
-                # TODO: remove hard coding
-                split_address = "Thaweewat-oasst1_th", "dev"
-                dialogue_graphs = self.dialogue_graphs[split_address]
-
-                for entry_id, dialogue_graph in dialogue_graphs.items():
-                    cmp = dialogue_graph.root.get_cmp(src_name)
+            if request.ref is not None:
+                res = await self._get_ref_anno(request.id, request.ref, src_name)
+                if res is not None:
+                    return res
+                # a rejected reference (e.g. an unknown node) gets an assignment
+
+            # NOTE: the tool only annotated from one data split
+            split_address = self.anno_split
+            async with self.graph_locks[split_address]:
+                work_scheduler = await self._get_work_scheduler(split_address)
+                assignment_index: Optional[AssignmentIndex] = None
+                while True:
+                    unit = work_scheduler.assign(src_name)
+                    if unit is None:
+                        # all units reach the overlap,
+                        # continue with units the user has not completed
+                        assignment_index = await self._get_assignment_index(
+                            src_name, split_address
+                        )
+                        unit = assignment_index.peek()
+                    if unit is None:
+                        break
+
+                    entry_id, node_id = unit
+                    dialogue_graph = await self._get_dialogue_graph(
+                        split_address, entry_id
+                    )
+                    cmp = dialogue_graph.get_cmp(node_id, src_name)
                     pairs_w_rel_count, total_pairs, pairs_wo_rel = (
-                        cmp.compute_coverage()
+                        cmp.compute_coverage(pair_selector=self.pair_selector)
                     )
-                    if pairs_w_rel_count == total_pairs:
+                    if pairs_wo_rel is None:
+                        # completed after the last checkpoint of its comparison state
+                        work_scheduler.complete(unit, src_name)
+                        if assignment_index is not None:
+                            assignment_index.complete(unit)
                         continue
-
-                    assert pairs_wo_rel is not None
-                    entry = entry_id
                     idx = len(cmp.raw_cmp_data)
                     a, b = pairs_wo_rel
 
@@ -446,9 +1111,10 @@ class DataBridge(
                         ref=AnnoRefBM(
                             dataset=split_address[0],
                             split=split_address[1],
-                            entry=entry,
+                            entry=entry_id,
                             idx=idx,
                             cmpId=str(uuid4()),
+                            node=node_id,
                         ),
                         count=pairs_w_rel_count,
                         total=total_pairs,
@@ -457,11 +1123,19 @@ class DataBridge(
                     )
 
                 # fallback for end of annotation
-                entry_id = list(dialogue_graphs.keys())[-1]
-                dialogue_graph = dialogue_graphs[entry_id]
+                assert (
+                    assignment_index is not None
+                    and assignment_index.last_unit is not None
+                ), "split has nothing to annotate"
+                entry_id, node_id = assignment_index.last_unit
+                dialogue_graph = await self._get_dialogue_graph(
+                    split_address, entry_id
+                )
 
-                cmp = dialogue_graph.root.get_cmp(src_name)
-                pairs_w_rel_count, total_pairs, _ = cmp.compute_coverage()
+                cmp = dialogue_graph.get_cmp(node_id, src_name)
+                pairs_w_rel_count, total_pairs, _ = cmp.compute_coverage(
+                    pair_selector=self.pair_selector
+                )
                 assert pairs_w_rel_count == total_pairs
 
                 idx = len(cmp.raw_cmp_data) - 1
@@ -477,62 +1151,71 @@ class DataBridge(
                         entry=entry_id,
                         idx=idx,
                         cmpId=str(uuid4()),
+                        node=node_id,
                     ),
                     count=pairs_w_rel_count,
                     total=total_pairs,
                     a=a,
                     b=b,
                 )
-            else:
-                split_address = request.ref.dataset, request.ref.split
-                dialogue_graph = self.dialogue_graphs[split_address][request.ref.entry]
-                # TODO add support for non-root anno
-                cmp = dialogue_graph.root.get_cmp(src_name)
-                pairs_w_rel_count, total_pairs, pairs_wo_rel = cmp.compute_coverage()
-
-                if request.ref.idx >= len(cmp.raw_cmp_data):
-                    if pairs_wo_rel is not None:
-                        request.ref.idx = len(cmp.raw_cmp_data)
-                    else:
-                        request.ref.idx = len(cmp.raw_cmp_data) - 1
-
-                if request.ref.idx < len(cmp.raw_cmp_data):
-                    raw_cmp_data = cmp.raw_cmp_data[request.ref.idx]
-                    a = raw_cmp_data.a
-                    b = raw_cmp_data.b
-                else:
-                    assert pairs_wo_rel is not None
-                    a, b = pairs_wo_rel
-
-                return AssignedAnnoRes(
-                    id=request.id,
-                    ref=request.ref,
-                    count=pairs_w_rel_count,
-                    total=total_pairs,
-                    a=a,
-                    b=b,
-                )
         elif isinstance(request, AnnoCmpReq):
             split_address = request.ref.dataset, request.ref.split
-            dialogue_graph = self.dialogue_graphs[split_address][request.ref.entry]
-            # TODO add support for non-root anno
-            cmp = dialogue_graph.root.get_cmp(src_name)
-            cmp.add_cmp_data(request.cmp)
+            async with self.graph_locks[split_address]:
+                dialogue_graph = await self._get_dialogue_graph(
+                    split_address, request.ref.entry
+                )
+                try:
+                    node_id = _get_anno_node_id(dialogue_graph, request.ref)
+                except ClientException as e:
+                    logger.warning(
+                        {"msg": "rejected annotation", "ref": request.ref, "error": e}
+                    )
+                    return AnnoCmpRes(id=request.id, ok=False)
+                cmp = dialogue_graph.get_cmp(node_id, src_name)
+                # reject annotations which conflict with existing data before they are applied,
+                # the full `find_issues` sweep is left to `cli_tools store validate`
+                try:
+                    cmp.check_cmp_data(request.cmp)
+                except DataIntegrityError as e:
+                    logger.warning(
+                        {
+                            "msg": "rejected annotation",
+                            "ref": request.ref,
+                            "issue": e.info,
+                        }
+                    )
+                    return AnnoCmpRes(id=request.id, ok=False)
+
+                store = self.stores[split_address]
+                async with self.cmp_wal_locks[split_address]:
+                    # comparison is durable once it is in the WAL,
+                    # the store is saved by a coalesced checkpoint
+                    await self.cmp_wals[split_address].append(
+                        [CmpLogRecord(entry=request.ref.entry, cmp=request.cmp)]
+                    )
+                    # TODO handle replacement
+                    await store.update(
+                        request.ref.entry, functools.partial(_append_cmp, request.cmp)
+                    )
+                cmp.add_cmp_data(request.cmp)
+                self.dirty_graphs[split_address].add(request.ref.entry)
 
-            # analyze every time we make annotations to data
-            try:
-                dialogue_graph.find_issues(inspect=True)
-            except DataIntegrityError as e:
-                print(e.info)
-                return AnnoCmpRes(id=request.id, ok=False)
-
-            store = self.stores[split_address]
-            serial = store.get(request.ref.entry)
-            assert serial is not None
-            # TODO handle replacement
-            serial.cmps.append(request.cmp)
-            await store.set(serial, replace_if_exist=True)
-            await store.save()
+                pairs_w_rel_count, total_pairs, _ = cmp.compute_coverage(
+                    pair_selector=self.pair_selector
+                )
+                if pairs_w_rel_count == total_pairs:
+                    unit = request.ref.entry, node_id
+                    work_scheduler = self.work_schedulers.get(split_address)
+                    if work_scheduler is not None:
+                        work_scheduler.complete(unit, src_name)
+                    assignment_index = self.assignment_indices.get(
+                        (src_name, split_address)
+                    )
+                    if assignment_index is not None:
+                        assignment_index.complete(unit)
+            # the comparison is already durable in the WAL, the checkpoint only
+            # shortens the replay so its future is not awaited
+            self.save_schedulers[split_address].schedule()
             return AnnoCmpRes(id=request.id, ok=True)
         else:
             assert isinstance(request, WhoAmIReq)
@@ -541,12 +1224,58 @@ class DataBridge(
                 uname=uname,
             )
 
+    async def _get_ref_anno(
+        self, request_id: str, ref: AnnoRefBM, src_name: SourceName
+    ) -> Optional[AssignedAnnoRes]:
+        """pair of the annotation the reference points to,
+        None if the reference is rejected"""
+        split_address = ref.dataset, ref.split
+        async with self.graph_locks[split_address]:
+            dialogue_graph = await self._get_dialogue_graph(split_address, ref.entry)
+            try:
+                ref.node = _get_anno_node_id(dialogue_graph, ref)
+            except ClientException as e:
+                logger.warning(
+                    {"msg": "rejected annotation reference", "ref": ref, "error": e}
+                )
+                return None
+            cmp = dialogue_graph.get_cmp(ref.node, src_name)
+            pairs_w_rel_count, total_pairs, pairs_wo_rel = cmp.compute_coverage(
+                pair_selector=self.pair_selector
+            )
+
+            if ref.idx >= len(cmp.raw_cmp_data):
+                if pairs_wo_rel is not None:
+                    ref.idx = len(cmp.raw_cmp_data)
+                else:
+                    ref.idx = len(cmp.raw_cmp_data) - 1
+
+            if ref.idx < len(cmp.raw_cmp_data):
+                raw_cmp_data = cmp.raw_cmp_data[ref.idx]
+                a = raw_cmp_data.a
+                b = raw_cmp_data.b
+            else:
+                assert pairs_wo_rel is not None
+                a, b = pairs_wo_rel
+
+        return AssignedAnnoRes(
+            id=request_id,
+            ref=ref,
+            count=pairs_w_rel_count,
+            total=total_pairs,
+            a=a,
+            b=b,
+        )
+
     async def handle_async_request(
         self,
         t_ws: AbsTypedWebSocket[FetchReq, FetchRes, AsyncReq, AsyncRes],
         session: Session,
         request: AsyncReq,
     ) -> bool:
+        if isinstance(request, DBDatasetBatchSubReq):
+            return await self._handle_batch_sub(t_ws, session, request)
+
         # DataBridge only have two async requests, sub and unsub
         assert isinstance(request, DBDatasetSubReq)
         if request.type == "sub":
@@ -555,6 +1284,7 @@ class DataBridge(
             await self.pub_sub.subscribe(
                 request.channel,
                 t_ws.send,  # type: ignore
+                request.version,
             )
         else:
             assert request.type == "unsub"
@@ -565,3 +1295,23 @@ class DataBridge(
             )
             session.sub_channels.remove(request.channel)
         return True
+
+    async def _handle_batch_sub(
+        self,
+        t_ws: AbsTypedWebSocket[FetchReq, FetchRes, AsyncReq, AsyncRes],
+        session: Session,
+        request: DBDatasetBatchSubReq,
+    ) -> bool:
+        plan = _plan_batch_sub(session.sub_channels, request.reqs)
+        if plan is None:
+            return False
+        sub_channels, subs, unsubs = plan
+
+        # subscribe before unsubscribing, so a channel both unsubscribed and subscribed
+        # again in the batch is resent without being closed in between, subscriptions of
+        # channels and patterns are counted
+        await self.pub_sub.subscribe_batch(subs, t_ws.send)  # type: ignore
+        for ch in unsubs:
+            self.pub_sub.unsubscribe(ch, t_ws.send)  # type: ignore
+        session.sub_channels[:] = sub_channels
+        return True
@@ -0,0 +1,181 @@
+"""Scheduling of annotation units among annotators"""
+
+import heapq
+import time
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+from ..data_model.source import SourceName
+from .assignment import AnnoUnit
+
+# distinct annotators aimed for per annotation unit
+DEFAULT_ANNO_OVERLAP = 3
+# seconds an annotator holds an annotation unit without completing it
+DEFAULT_ANNO_LEASE_S = 15 * 60
+
+
+class WorkScheduler:
+    """Hand out annotation units of a split to annotators with time-bounded leases
+
+    Each unit aims for `overlap` distinct annotators. Annotators who completed a unit or hold
+    a lease on it count towards its overlap, and units with the lowest count are handed out
+    first (in split order on ties). A lease which is not completed before it expires is
+    reclaimed, and its unit is handed out again.
+
+    Units below the overlap are kept in a single heap keyed by their count, a count change
+    pushes one item and stale items are skipped lazily, so completing a unit is O(log n)
+    whatever the number of annotators. Assigning a unit skips the units with a lower count
+    which the annotator has completed, O((k + 1) log n) for k such units. The heap is rebuilt
+    when its stale items outnumber the units, so its size stays O(n).
+    """
+
+    def __init__(
+        self,
+        units: Iterable[AnnoUnit],
+        overlap: int = DEFAULT_ANNO_OVERLAP,
+        lease_s: float = DEFAULT_ANNO_LEASE_S,
+        done: Optional[Mapping[AnnoUnit, Set[SourceName]]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            units (Iterable[AnnoUnit]): annotation units, in split order
+            overlap (int, optional): distinct annotators aimed for per unit. Defaults to DEFAULT_ANNO_OVERLAP.
+            lease_s (float, optional): seconds before a lease expires. Defaults to DEFAULT_ANNO_LEASE_S.
+            done (Optional[Mapping[AnnoUnit, Set[SourceName]]], optional): sources which completed each unit, recovered from the store. Defaults to None.
+            clock (Callable[[], float], optional): current time in seconds. Defaults to time.monotonic.
+        """
+        self.overlap = overlap
+        self.lease_s = lease_s
+        self._clock = clock
+
+        self._units: List[AnnoUnit] = list(units)
+        self._unit_idx: Dict[AnnoUnit, int] = {
+            unit: idx for idx, unit in enumerate(self._units)
+        }
+        # sources which completed each unit
+        self._done: List[Set[SourceName]] = [
+            set(done.get(unit, ())) if done is not None else set()
+            for unit in self._units
+        ]
+        # source -> lease expiry, of each unit
+        self._leases: List[Dict[SourceName, float]] = [{} for _ in self._units]
+        # unit leased by each source
+        self._source_lease: Dict[SourceName, int] = {}
+        # bumped on every count change, heap items of older versions are stale
+        self._versions: List[int] = [0] * len(self._units)
+        # (count, unit idx, version) of units below overlap
+        self._heap: List[Tuple[int, int, int]] = []
+        self._rebuild_heap()
+        # (expiry, unit idx, source) of leases, renewed and completed leases are skipped lazily
+        self._expiry_heap: List[Tuple[float, int, SourceName]] = []
+
+    def __len__(self) -> int:
+        return len(self._units)
+
+    def add_unit(self, unit: AnnoUnit):
+        """add a unit new to the split"""
+        if unit in self._unit_idx:
+            return
+        idx = len(self._units)
+        self._units.append(unit)
+        self._unit_idx[unit] = idx
+        self._done.append(set())
+        self._leases.append({})
+        self._versions.append(0)
+        self._push(0, idx)
+
+    def get_count(self, unit: AnnoUnit) -> int:
+        """number of annotators who completed or hold a lease on the unit"""
+        idx = self._unit_idx[unit]
+        return len(self._done[idx]) + len(self._leases[idx])
+
+    def assign(self, source: SourceName) -> Optional[AnnoUnit]:
+        """Lease a unit to the source
+
+        The unit already leased by the source is renewed. Otherwise, the unit with the lowest
+        count which the source has not completed is leased.
+
+        Returns:
+            Optional[AnnoUnit]: leased unit, None if all units the source has not completed reach the overlap
+        """
+        now = self._clock()
+        self._reclaim(now)
+
+        idx = self._source_lease.get(source)
+        renew = idx is not None
+        if idx is None:
+            idx = self._pop_unit(source)
+            if idx is None:
+                return None
+            self._source_lease[source] = idx
+
+        expiry = now + self.lease_s
+        self._leases[idx][source] = expiry
+        heapq.heappush(self._expiry_heap, (expiry, idx, source))
+        if not renew:
+            self._update(idx)
+        return self._units[idx]
+
+    def complete(self, unit: AnnoUnit, source: SourceName):
+        """mark unit completed by the source, releasing its lease"""
+        idx = self._unit_idx.get(unit)
+        if idx is None or source in self._done[idx]:
+            return
+        self._done[idx].add(source)
+        if self._leases[idx].pop(source, None) is not None:
+            del self._source_lease[source]
+        self._update(idx)
+
+    def _pop_unit(self, source: SourceName) -> Optional[int]:
+        """unit with the lowest count below overlap, which the source has not completed"""
+        heap = self._heap
+        # units completed by the source, pushed back for the other sources
+        skipped: List[Tuple[int, int, int]] = []
+        found: Optional[int] = None
+        while heap:
+            _, idx, version = heap[0]
+            if version != self._versions[idx]:
+                heapq.heappop(heap)
+            elif source in self._done[idx]:
+                skipped.append(heapq.heappop(heap))
+            else:
+                found = idx
+                break
+        for item in skipped:
+            heapq.heappush(heap, item)
+        return found
+
+    def _reclaim(self, now: float):
+        """release expired leases"""
+        expiry_heap = self._expiry_heap
+        while expiry_heap and expiry_heap[0][0] <= now:
+            expiry, idx, source = heapq.heappop(expiry_heap)
+            leases = self._leases[idx]
+            # lease was renewed or completed
+            if leases.get(source) != expiry:
+                continue
+            del leases[source]
+            del self._source_lease[source]
+            self._update(idx)
+
+    def _update(self, idx: int):
+        """requeue unit after its count changed"""
+        self._versions[idx] += 1
+        count = len(self._done[idx]) + len(self._leases[idx])
+        if count < self.overlap:
+            self._push(count, idx)
+
+    def _push(self, count: int, idx: int):
+        heapq.heappush(self._heap, (count, idx, self._versions[idx]))
+        if len(self._heap) > 2 * len(self._units):
+            # most items are stale
+            self._rebuild_heap()
+
+    def _rebuild_heap(self):
+        heap: List[Tuple[int, int, int]] = []
+        for idx, (unit_done, leases) in enumerate(zip(self._done, self._leases)):
+            count = len(unit_done) + len(leases)
+            if count < self.overlap:
+                heap.append((count, idx, self._versions[idx]))
+        heapq.heapify(heap)
+        self._heap = heap
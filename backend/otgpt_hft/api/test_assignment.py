@@ -0,0 +1,38 @@
+from .assignment import AnnoUnitIndex, AssignmentIndex
+
+
+def test_assignment_index():
+    index = AssignmentIndex([("e0", "r0"), ("e1", "r1"), ("e2", "r2")], ("e3", "r3"))
+    assert len(index) == 3
+    assert index.peek() == ("e0", "r0")
+
+    # completion is independent of the order
+    index.complete(("e1", "r1"))
+    assert ("e1", "r1") not in index
+    assert index.peek() == ("e0", "r0")
+    index.complete(("e0", "r0"))
+    assert index.peek() == ("e2", "r2")
+    # completing a completed unit is a no-op
+    index.complete(("e0", "r0"))
+
+    index.complete(("e2", "r2"))
+    assert index.peek() is None
+    assert index.last_unit == ("e3", "r3")
+
+
+def test_anno_unit_index():
+    index = AnnoUnitIndex()
+    assert index.set_entry("e0", ["p0"], set()) == [("e0", "p0")]
+    assert index.set_entry("e1", [], set()) == []
+    assert index.set_entry("e2", ["p2", "r2"], {"user/a"}) == [
+        ("e2", "p2"),
+        ("e2", "r2"),
+    ]
+    assert index.last_unit == ("e2", "r2")
+
+    # re-indexing an entry only returns its new units
+    assert index.set_entry("e0", ["p0", "r0"], {"user/b"}) == [("e0", "r0")]
+    assert index.get_sources("e0") == {"user/b"}
+    assert list(index) == [("e0", "p0"), ("e0", "r0"), ("e2", "p2"), ("e2", "r2")]
+    assert len(index) == 4
+    assert index.last_unit == ("e2", "r2")
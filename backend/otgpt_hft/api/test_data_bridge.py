@@ -0,0 +1,71 @@
+import asyncio
+import json
+from typing import Any, List, Tuple
+
+from ..tooling.pub_sub.base import ChannelName, SubscriptionAReq, SubscriptionARes
+from ..tooling.pub_sub.channel import Channel
+from ..tooling.pub_sub.pub_sub_ex import ExtensiblePubSub, PChannel
+from .data_bridge import _plan_batch_sub
+
+
+def test_batch_sub_same_channel():
+    async def _run():
+        pub_sub = ExtensiblePubSub()
+
+        def _hook(ch: ChannelName) -> PChannel:
+            channel = Channel(ch, SubscriptionARes[Any])
+            asyncio.get_running_loop().call_soon(
+                lambda: asyncio.ensure_future(channel.publish(ch[-1]))
+            )
+            return channel
+
+        pub_sub.register_hook(("entry",), _hook)
+        received: List[Any] = []
+
+        async def viewer(msg: Any):
+            received.append(json.loads(msg.text))
+
+        sub_channels: List[ChannelName] = []
+
+        async def apply_batch(reqs: List[Tuple[str, ChannelName]]):
+            nonlocal sub_channels
+            plan = _plan_batch_sub(
+                sub_channels,
+                [SubscriptionAReq[Any](type=t, channel=ch) for t, ch in reqs],
+            )
+            assert plan is not None
+            sub_channels, subs, unsubs = plan
+            # as DataBridge applies a batch
+            await pub_sub.subscribe_batch(subs, viewer, wait_s=1)
+            for ch in unsubs:
+                pub_sub.unsubscribe(ch, viewer)
+
+        exact = ("entry", "d", "e0")
+        pattern = ("entry", "d", "*")
+        await apply_batch([("sub", exact), ("sub", pattern)])
+        received.clear()
+
+        # unsubscribed and subscribed again, still followed
+        await apply_batch(
+            [("unsub", exact), ("sub", exact), ("unsub", pattern), ("sub", pattern)]
+        )
+        assert sub_channels == [exact, pattern]
+        assert pub_sub.is_followed(("entry", "d", "e1"))
+        assert pub_sub.ch_s[exact]._sub_counts[viewer] == 2  # exact and pattern
+        await pub_sub.open_channel(("entry", "d", "e1"))
+        await asyncio.sleep(0.01)
+        assert received[-1]["data"] == "e1"
+        received.clear()
+
+        # subscribed and unsubscribed, nothing is subscribed or sent
+        new = ("entry", "x", "e2")
+        new_pattern = ("entry", "x", "*")
+        await apply_batch(
+            [("sub", new), ("unsub", new), ("sub", new_pattern), ("unsub", new_pattern)]
+        )
+        assert sub_channels == [exact, pattern]
+        assert new not in pub_sub.ch_s
+        assert not pub_sub.is_followed(new)
+        assert received == []
+
+    asyncio.run(_run())
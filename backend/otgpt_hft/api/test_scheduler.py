@@ -0,0 +1,101 @@
+from .scheduler import WorkScheduler
+
+UNITS = [("e0", "r0"), ("e1", "r1"), ("e2", "r2")]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_work_scheduler_overlap():
+    scheduler = WorkScheduler(UNITS, overlap=2, lease_s=10, clock=Clock())
+
+    # units are spread among annotators before overlapping
+    assert [scheduler.assign(src) for src in ("a", "b", "c")] == UNITS
+    # lease is renewed until completed
+    assert scheduler.assign("a") == UNITS[0]
+    assert scheduler.assign("d") == UNITS[0]
+    assert scheduler.get_count(UNITS[0]) == 2
+
+    scheduler.complete(UNITS[0], "a")
+    assert scheduler.get_count(UNITS[0]) == 2
+    # completed units are not assigned again
+    assert scheduler.assign("a") == UNITS[1]
+    assert scheduler.assign("e") == UNITS[2]
+    # all units reach the overlap
+    assert scheduler.assign("f") is None
+
+
+def test_work_scheduler_lease_expiry():
+    clock = Clock()
+    scheduler = WorkScheduler(UNITS[:1], overlap=1, lease_s=10, clock=clock)
+
+    assert scheduler.assign("a") == UNITS[0]
+    assert scheduler.assign("b") is None
+
+    # expired lease is reclaimed
+    clock.now = 10
+    assert scheduler.assign("b") == UNITS[0]
+    assert scheduler.assign("a") is None
+    # completing without a lease counts towards the overlap
+    scheduler.complete(UNITS[0], "a")
+    assert scheduler.get_count(UNITS[0]) == 2
+
+
+def test_work_scheduler_recover():
+    scheduler = WorkScheduler(
+        UNITS, overlap=2, lease_s=10, done={UNITS[0]: {"a", "b"}, UNITS[1]: {"a"}}
+    )
+    assert scheduler.assign("a") == UNITS[2]
+    assert scheduler.assign("b") == UNITS[1]
+    assert scheduler.assign("c") == UNITS[2]
+    assert scheduler.assign("d") is None
+
+
+def test_work_scheduler_many_sources():
+    units = [(f"e{i}", "r") for i in range(50)]
+    clock = Clock()
+    scheduler = WorkScheduler(units, overlap=3, lease_s=10, clock=clock)
+    completed = {f"s{i}": set() for i in range(40)}
+
+    # each source completes units in turn, leases expire in between
+    for _ in range(3):
+        for source, source_done in completed.items():
+            counts = {unit: scheduler.get_count(unit) for unit in units}
+            unit = scheduler.assign(source)
+            assert unit is not None and unit not in source_done
+            # lowest count among the units the source has not completed
+            assert counts[unit] == min(
+                count for u, count in counts.items() if u not in source_done
+            )
+            scheduler.complete(unit, source)
+            source_done.add(unit)
+        clock.now += 10
+
+    assert sum(scheduler.get_count(unit) for unit in units) == 3 * len(completed)
+    assert max(scheduler.get_count(unit) for unit in units) <= 3
+    # stale items of count changes are dropped
+    assert len(scheduler._heap) <= 2 * len(units)
+
+
+def test_work_scheduler_skip_completed():
+    units = [(f"e{i}", "r") for i in range(1000)]
+    done = {unit: {"a"} for unit in units[:-1]}
+    done[units[-1]] = {"b"}
+    scheduler = WorkScheduler(units, overlap=3, lease_s=10, done=done, clock=Clock())
+    assert scheduler.assign("a") == units[-1]
+    scheduler.complete(units[-1], "a")
+    assert scheduler.assign("c") == units[0]
+    scheduler.complete(units[0], "c")
+
+    # units completed by the source have the lowest count, they are skipped
+    scheduler.add_unit(("e1000", "r"))
+    assert scheduler.assign("a") == ("e1000", "r")
+    assert scheduler.assign("a") == ("e1000", "r")
+    # and stay available to the other sources
+    assert scheduler.assign("d") == units[1]
+    assert scheduler.assign("a") == ("e1000", "r")
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import heapq
+import random
+from typing import Dict, List, Optional, Set, Tuple
+
+from ..abs import InstanceId
+
+# pair of nodes, ordered by the order nodes were added
+NodePair = Tuple[InstanceId, InstanceId]
+
+
+class PairCoverage:
+    """Incrementally tracked coverage of node pairs
+
+    Keeps the set of pairs without relation, so coverage queries do not recompute all pairs.
+    Relations between nodes only ever grow, so a pair is removed at most once.
+    """
+
+    def __init__(self) -> None:
+        self._node_idx: Dict[InstanceId, int] = {}
+        # nodes without relation to the node
+        self._unrelated: Dict[InstanceId, Set[InstanceId]] = {}
+        # pairs without relation, for picking a random pair in O(1)
+        self._pairs: List[NodePair] = []
+        self._pair_idx: Dict[NodePair, int] = {}
+        # (node_a_idx, node_b_idx) of pairs without relation, for picking the first pair
+        # related pairs are removed lazily
+        self._pair_heap: List[Tuple[int, int]] = []
+        self._nodes: List[InstanceId] = []
+        self.pairs_w_rel_count = 0
+
+    @property
+    def total_pairs(self) -> int:
+        n = len(self._nodes)
+        return n * (n - 1) // 2
+
+    def add_node(self, node: InstanceId):
+        """add node without relation to any other node"""
+        node_idx = len(self._nodes)
+        self._node_idx[node] = node_idx
+        self._unrelated[node] = set(self._nodes)
+        for o_idx, o_node in enumerate(self._nodes):
+            self._unrelated[o_node].add(node)
+            pair = o_node, node
+            self._pair_idx[pair] = len(self._pairs)
+            self._pairs.append(pair)
+            heapq.heappush(self._pair_heap, (o_idx, node_idx))
+        self._nodes.append(node)
+
+    def unrelated(self, node: InstanceId) -> Set[InstanceId]:
+        """nodes without relation to the node (do not modify)"""
+        return self._unrelated[node]
+
+    def relate(self, node_a: InstanceId, node_b: InstanceId):
+        """mark pair as related, no-op if already related"""
+        unrelated_a = self._unrelated[node_a]
+        if node_b not in unrelated_a:
+            return
+        unrelated_a.remove(node_b)
+        self._unrelated[node_b].remove(node_a)
+        self.pairs_w_rel_count += 1
+
+        pair = self._get_pair(node_a, node_b)
+        # swap with the last pair and pop
+        idx = self._pair_idx.pop(pair)
+        last_pair = self._pairs.pop()
+        if last_pair != pair:
+            self._pairs[idx] = last_pair
+            self._pair_idx[last_pair] = idx
+
+    def random_pair_wo_rel(self) -> Optional[NodePair]:
+        if len(self._pairs) == 0:
+            return None
+        return random.choice(self._pairs)
+
+    def first_pair_wo_rel(self) -> Optional[NodePair]:
+        heap = self._pair_heap
+        while heap:
+            a_idx, b_idx = heap[0]
+            pair = self._nodes[a_idx], self._nodes[b_idx]
+            if pair in self._pair_idx:
+                return pair
+            heapq.heappop(heap)
+        return None
+
+    def _get_pair(self, node_a: InstanceId, node_b: InstanceId) -> NodePair:
+        if self._node_idx[node_a] < self._node_idx[node_b]:
+            return node_a, node_b
+        return node_b, node_a
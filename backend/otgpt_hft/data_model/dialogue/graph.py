@@ -1,30 +1,109 @@
-from typing import Dict
+from typing import Dict, List, Optional, Set, Tuple
 
 from otgpt_hft.data_model.abs import DM_AbsUtterance, InstanceId
 from otgpt_hft.data_model.any import AnyUtterance
 from otgpt_hft.data_model.cmp import DB_ResponseCmp
 from otgpt_hft.data_model.dialogue.error import DataIntegrityError
-from otgpt_hft.data_model.dialogue.node import DialogueNode
+from otgpt_hft.data_model.dialogue.node import (
+    DialogueNode,
+    DialogueNodeCmp,
+    NodeCmpFactory,
+    PNodeCmp,
+)
+from otgpt_hft.data_model.dialogue.state import GraphCmpState, NodeCmpState
 from otgpt_hft.data_model.serial.entry import SerializedEntry
+from otgpt_hft.data_model.source import SourceName
+
+
+def get_branching_node_ids(serial: SerializedEntry) -> List[InstanceId]:
+    """ids of nodes with two or more next utterances, without building the graph"""
+    n_next: Dict[InstanceId, int] = {}
+    branching_node_ids: List[InstanceId] = []
+    for utt in serial.utterance:
+        n = n_next[utt.prev_id] = n_next.get(utt.prev_id, 0) + 1
+        if n == 2:
+            branching_node_ids.append(utt.prev_id)
+    return branching_node_ids
+
+
+def get_completed_node_ids(
+    serial: SerializedEntry, cmp_states: GraphCmpState
+) -> Dict[InstanceId, Set[SourceName]]:
+    """sources which completed comparing the next utterances of each node, according to the
+    states matching the entry's comparisons, without building the graph"""
+    next_ids: Dict[InstanceId, List[InstanceId]] = {}
+    prev_ids: Dict[InstanceId, InstanceId] = {}
+    for utt in serial.utterance:
+        next_ids.setdefault(utt.prev_id, []).append(utt.id)
+        prev_ids[utt.id] = utt.prev_id
+
+    # (node id, source name) -> comparisons
+    node_cmps: Dict[Tuple[InstanceId, SourceName], List[DB_ResponseCmp]] = {}
+    for cmp in serial.cmps:
+        node_id = prev_ids.get(cmp.a)
+        if node_id is not None:
+            node_cmps.setdefault((node_id, cmp.source.get_name()), []).append(cmp)
+
+    completed: Dict[InstanceId, Set[SourceName]] = {}
+    for src_name, states in cmp_states.sources.items():
+        for node_id, state in states.items():
+            # same check as restoring the state, see `DialogueNode.load_cmp_state`
+            cmps = node_cmps.get((node_id, src_name), [])
+            if (
+                state.nodes == next_ids.get(node_id)
+                and state.n_cmps == len(cmps)
+                and state.n_cmps > 0
+                and cmps[-1].id == state.last_cmp_id
+                and state.is_complete()
+            ):
+                completed.setdefault(node_id, set()).add(src_name)
+    return completed
 
 
 class DialogueGraph:
     root: DialogueNode
     nodes: Dict[InstanceId, DialogueNode]
+    # nodes with two or more next utterances, in the order they became branching
+    branching_nodes: Dict[InstanceId, DialogueNode]
 
-    def __init__(self, serial: SerializedEntry, inspect=False):
-        self.root = DialogueNode(serial.prompt)
+    def __init__(
+        self,
+        serial: SerializedEntry,
+        inspect=False,
+        cmp_factory: NodeCmpFactory = DialogueNodeCmp,
+        lazy_cmps=False,
+        cmp_states: Optional[GraphCmpState] = None,
+    ):
+        """
+        Args:
+            serial (SerializedEntry): entry to build the graph from
+            inspect (bool, optional): check for issues after adding each comparison. Defaults to False.
+            cmp_factory (NodeCmpFactory, optional): comparison data engine of nodes. Defaults to DialogueNodeCmp.
+            lazy_cmps (bool, optional): add comparisons of a source on its first access (`get_cmp`/`add_cmp`), instead of all comparisons now. Defaults to False.
+            cmp_states (Optional[GraphCmpState], optional): states restored instead of adding their comparisons, when a source is accessed (lazy_cmps only). Defaults to None.
+        """
+        self._cmp_factory = cmp_factory
+        # comparisons of each source, which are not added to nodes yet
+        self._pending_cmps: Dict[SourceName, List[DB_ResponseCmp]] = {}
+        # states of each source, which are not restored yet
+        self._pending_states: Dict[SourceName, Dict[InstanceId, NodeCmpState]] = (
+            dict(cmp_states.sources) if cmp_states is not None else {}
+        )
+        self.root = DialogueNode(serial.prompt, cmp_factory)
         self.nodes = {
             serial.prompt.id: self.root,
         }
+        self.branching_nodes = {}
 
         for utt in serial.utterance:
             # NOTE: this assumes the connection by adding nodes to the graph in order
             # if utt.prev_id not in self.nodes, then fix this graph resolution
             self.add_utt(utt)
 
-        # TODO lazily load cmp for each user
         for cmp in serial.cmps:
+            if lazy_cmps:
+                self._pending_cmps.setdefault(cmp.source.get_name(), []).append(cmp)
+                continue
             self.add_cmp(cmp)
             if inspect:
                 try:
@@ -39,16 +118,64 @@ class DialogueGraph:
                     )
 
     def add_utt(self, utt: AnyUtterance):
-        self.nodes[utt.id] = DialogueNode(utt)
+        self.nodes[utt.id] = DialogueNode(utt, self._cmp_factory)
         assert (
             utt.prev_id in self.nodes
         ), f"utterance previous node {utt.prev_id} does not exist"
         prev_node = self.nodes[utt.prev_id]
         prev_node.add_next(utt.id)
+        if prev_node.is_branching():
+            self.branching_nodes.setdefault(utt.prev_id, prev_node)
+
+    def load_source(self, src_name: SourceName):
+        """add pending comparisons of the source, restoring states when possible"""
+        pending_cmps = self._pending_cmps.pop(src_name, None)
+        states = self._pending_states.pop(src_name, {})
+        if pending_cmps is None:
+            return
+
+        node_cmps: Dict[InstanceId, List[DB_ResponseCmp]] = {}
+        for cmp in pending_cmps:
+            node_cmps.setdefault(self._get_cmp_node_id(cmp), []).append(cmp)
 
-    def add_cmp(self, cmp: DB_ResponseCmp):
+        for node_id, cmps in node_cmps.items():
+            node = self.nodes[node_id]
+            state = states.get(node_id)
+            n_restored = 0
+            # only comparisons newer than the state are added
+            if state is not None and node.load_cmp_state(
+                src_name, state, cmps[: state.n_cmps]
+            ):
+                n_restored = state.n_cmps
+            cmp_data = node.get_cmp(src_name)
+            for cmp in cmps[n_restored:]:
+                cmp_data.add_cmp_data(cmp)
+
+    def get_cmp_states(self) -> GraphCmpState:
+        """states of all sources, including sources which are not restored yet"""
+        sources = {
+            src_name: states.copy() for src_name, states in self._pending_states.items()
+        }
+        for node_id, node in self.nodes.items():
+            for src_name, state in node.get_cmp_states().items():
+                sources.setdefault(src_name, {})[node_id] = state
+        return GraphCmpState(sources=sources)
+
+    def get_cmp(self, node_id: InstanceId, src_name: SourceName) -> PNodeCmp:
+        """comparison data of the source on the node"""
+        self.load_source(src_name)
+        return self.nodes[node_id].get_cmp(src_name)
+
+    def add_cmp(self, cmp: DB_ResponseCmp, strict: bool = False):
         src_name = cmp.source.get_name()
+        self.load_source(src_name)
 
+        parent_node = self.nodes[self._get_cmp_node_id(cmp)]
+        cmp_data = parent_node.get_cmp(src_name)
+        cmp_data.add_cmp_data(cmp, strict)
+
+    def _get_cmp_node_id(self, cmp: DB_ResponseCmp) -> InstanceId:
+        """node which the compared utterances follow"""
         a_node = self.nodes[cmp.a]
         b_node = self.nodes[cmp.b]
         assert isinstance(a_node.unit, DM_AbsUtterance)
@@ -57,12 +184,10 @@ class DialogueGraph:
         a_parent_id = a_node.unit.prev_id
         b_parent_id = b_node.unit.prev_id
         assert a_parent_id == b_parent_id
-
-        parent_node = self.nodes[a_parent_id]
-        cmp_data = parent_node.get_cmp(src_name)
-        cmp_data.add_cmp_data(cmp)
+        return a_parent_id
 
     def find_issues(self, inspect: bool) -> bool:
+        """check comparison data of all nodes (pending comparisons are not checked)"""
         if inspect:
             for node_id, node in self.nodes.items():
                 try:
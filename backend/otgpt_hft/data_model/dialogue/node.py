@@ -1,7 +1,16 @@
 from __future__ import annotations
 
-import random
-from typing import Dict, List, Literal, Optional, Set, Tuple
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    List,
+    Literal,
+    Optional,
+    Protocol,
+    Set,
+    Tuple,
+)
 
 from otgpt_hft.data_model.cmp import DB_ResponseCmp
 from otgpt_hft.data_model.dialogue.error import DataIntegrityError
@@ -9,6 +18,11 @@ from otgpt_hft.data_model.dialogue.error import DataIntegrityError
 from ..abs import InstanceId
 from ..any import AnyDialogueUnit
 from ..source import SourceName
+from .coverage import PairCoverage
+from .state import NodeCmpState
+
+if TYPE_CHECKING:
+    from .pair_selection import PairSelector
 
 ClusterId = str
 
@@ -18,6 +32,65 @@ FullCompareOp = Literal[">", "=", "<", "-"]
 CoverageData = Tuple[int, int, Optional[Tuple[InstanceId, InstanceId]]]
 
 
+class PNodeCmp(Protocol):
+    """Comparison data engine of a single node from a single source"""
+
+    nodes: List[InstanceId]
+    coverage_cache: Optional[CoverageData]
+    raw_cmp_data: List[DB_ResponseCmp]
+    coverage: PairCoverage
+
+    def find_issues(self, inspect: bool) -> bool: ...
+
+    def get_cmp(self, node_a: InstanceId, node_b: InstanceId) -> FullCompareOp: ...
+
+    def add_node(self, node: InstanceId): ...
+
+    def get_cmp_data(self) -> List[DB_ResponseCmp]: ...
+
+    def check_cmp_data(self, cmp: DB_ResponseCmp): ...
+
+    def add_cmp_data(self, cmp: DB_ResponseCmp, strict: bool = False): ...
+
+    def compute_coverage(
+        self,
+        random_pair_wo_rel: bool = True,
+        pair_selector: Optional[PairSelector] = None,
+    ) -> CoverageData: ...
+
+    def to_state(self) -> NodeCmpState: ...
+
+    def load_state(self, state: NodeCmpState, cmps: List[DB_ResponseCmp]): ...
+
+
+# create comparison data engine from initial nodes
+NodeCmpFactory = Callable[[List[InstanceId]], PNodeCmp]
+
+
+def check_cmp_op(current_op: FullCompareOp, cmp: DB_ResponseCmp):
+    """Check comparison is consistent with the current relation of its nodes
+
+    Relations are transitively closed, so a comparison which does not contradict the current
+    relation can be added without creating a cycle or conflict.
+
+    Raises:
+        DataIntegrityError: comparison contradicts the current relation
+    """
+    if cmp.cmp == ">":
+        consistent = current_op in (">", "-")
+    else:
+        assert cmp.cmp == "="
+        consistent = current_op in ("=", "-")
+    if not consistent:
+        raise DataIntegrityError(
+            {
+                "msg": f'comparison "{cmp.a} {cmp.cmp} {cmp.b}" contradicts existing relation "{cmp.a} {current_op} {cmp.b}"',
+                "cmp": cmp,
+                "current_op": current_op,
+            }
+        )
+
+
 class InstanceCluster:
     def __init__(self, init_ins: InstanceId):
         self.c_id = "c" + init_ins
@@ -27,6 +100,10 @@ class InstanceCluster:
         self.cluster: Set[InstanceId] = {init_ins}
         # after: prefer less than this cluster
         self.after: Set[ClusterId] = set()
+        # union by rank, upper bound of the height of merged clusters
+        self.rank = 0
+        # merge generation when before/after were last pruned to representatives
+        self.resolved_gen = 0
 
     def has_conflict(self) -> bool:
         return len(self.before.intersection(self.after)) > 0
@@ -36,12 +113,22 @@ class DialogueNodeCmp:
     """Dialogue Node Comparison Data
 
     Stores comparison data for a single node from a single source.
+
+    Equally prefered clusters are merged with union-find, only representative clusters are kept
+    in `ins_cluster`. Cluster ids in `node_to_cluster` may refer to merged clusters, and are
+    resolved to representatives on access. Before/after of clusters may still contain merged
+    clusters next to their representatives, they are pruned lazily by `get_cluster`.
     """
 
     def __init__(self, init_nodes: Optional[List[InstanceId]] = None) -> None:
         self.ins_cluster: Dict[ClusterId, InstanceCluster] = {}
         self.node_to_cluster: Dict[InstanceId, ClusterId] = {}
+        # merged cluster -> cluster it was merged into
+        self.cluster_parent: Dict[ClusterId, ClusterId] = {}
+        # incremented on every merge, stale before/after are pruned lazily
+        self.merge_gen = 0
         self.nodes: List[InstanceId] = []
+        self.coverage = PairCoverage()
 
         if init_nodes:
             for n in init_nodes:
@@ -50,12 +137,38 @@ class DialogueNodeCmp:
         self.coverage_cache: Optional[CoverageData] = None
         self.raw_cmp_data: List[DB_ResponseCmp] = []
 
+    def find_cluster_id(self, c_id: ClusterId) -> ClusterId:
+        """representative of cluster, with path compression"""
+        root = c_id
+        while root in self.cluster_parent:
+            root = self.cluster_parent[root]
+        while c_id != root:
+            parent = self.cluster_parent[c_id]
+            self.cluster_parent[c_id] = root
+            c_id = parent
+        return root
+
+    def get_cluster_id(self, node: InstanceId) -> ClusterId:
+        c_id = self.find_cluster_id(self.node_to_cluster[node])
+        self.node_to_cluster[node] = c_id
+        return c_id
+
+    def get_cluster(self, c_id: ClusterId) -> InstanceCluster:
+        """representative cluster, with before/after pruned to representatives"""
+        cluster = self.ins_cluster[self.find_cluster_id(c_id)]
+        if cluster.resolved_gen != self.merge_gen:
+            cluster.before = {self.find_cluster_id(o_c_id) for o_c_id in cluster.before}
+            cluster.after = {self.find_cluster_id(o_c_id) for o_c_id in cluster.after}
+            cluster.resolved_gen = self.merge_gen
+        return cluster
+
     def find_issues(self, inspect: bool) -> bool:
         all_cluster_id: Set[ClusterId] = set()
-        for node, cluster_id in self.node_to_cluster.items():
+        for node in self.node_to_cluster:
+            cluster_id = self.get_cluster_id(node)
             # [1.1] all nodes exist in the cluster they are referencing
-            cluster = self.ins_cluster[cluster_id]
-            if node not in cluster.cluster:
+            cluster = self.ins_cluster.get(cluster_id)
+            if cluster is None or node not in cluster.cluster:
                 if inspect:
                     raise DataIntegrityError(
                         {
@@ -83,10 +196,11 @@ class DialogueNodeCmp:
                 )
             return True
 
-        for cluster_id, cluster in self.ins_cluster.items():
+        for cluster_id in all_cluster_id:
+            cluster = self.get_cluster(cluster_id)
             # [1.2] all nodes in cluster are referencing the cluster
             for node_id in cluster.cluster:
-                if self.node_to_cluster[node_id] != cluster_id:
+                if self.get_cluster_id(node_id) != cluster_id:
                     if inspect:
                         raise DataIntegrityError(
                             {
@@ -100,7 +214,7 @@ class DialogueNodeCmp:
 
             # [4] check before after cluster matches
             for o_c_id in cluster.after:
-                o_cluster = self.ins_cluster[o_c_id]
+                o_cluster = self.get_cluster(o_c_id)
                 if cluster_id not in o_cluster.before:
                     if inspect:
                         raise DataIntegrityError(
@@ -112,7 +226,7 @@ class DialogueNodeCmp:
                         )
                     return True
             for o_c_id in cluster.before:
-                o_cluster = self.ins_cluster[o_c_id]
+                o_cluster = self.get_cluster(o_c_id)
                 if cluster_id not in o_cluster.after:
                     if inspect:
                         raise DataIntegrityError(
@@ -125,7 +239,8 @@ class DialogueNodeCmp:
                     return True
 
         # [3] check data does not have conflict
-        for cluster_id, cluster in self.ins_cluster.items():
+        for cluster_id in all_cluster_id:
+            cluster = self.get_cluster(cluster_id)
             if cluster.has_conflict():
                 if inspect:
                     raise DataIntegrityError(
@@ -140,13 +255,14 @@ class DialogueNodeCmp:
         return False
 
     def get_cmp(self, node_a: InstanceId, node_b: InstanceId) -> FullCompareOp:
-        a_c_id = self.node_to_cluster[node_a]
-        b_c_id = self.node_to_cluster[node_b]
-
-        a_cluster = self.ins_cluster[a_c_id]
+        a_c_id = self.get_cluster_id(node_a)
+        b_c_id = self.get_cluster_id(node_b)
 
         if a_c_id == b_c_id:
             return "="
+
+        # representatives are always referenced next to merged clusters, no need to resolve
+        a_cluster = self.ins_cluster[a_c_id]
         if b_c_id in a_cluster.after:
             return ">"
         if b_c_id in a_cluster.before:
@@ -158,6 +274,7 @@ class DialogueNodeCmp:
         self.ins_cluster[cluster.c_id] = cluster
         self.node_to_cluster[node] = cluster.c_id
         self.nodes.append(node)
+        self.coverage.add_node(node)
         self.coverage_cache = None
 
     # def connect_node(self, node_a: InstanceId, node_b: InstanceId, cmp_op: CompareOp):
@@ -174,7 +291,31 @@ class DialogueNodeCmp:
     def get_cmp_data(self) -> List[DB_ResponseCmp]:
         return self.raw_cmp_data.copy()
 
-    def add_cmp_data(self, cmp: DB_ResponseCmp):
+    def check_cmp_data(self, cmp: DB_ResponseCmp):
+        """Check comparison can be added without conflict, without modifying data
+
+        Raises:
+            DataIntegrityError: comparison references unknown node, or conflicts with existing data
+        """
+        for node in (cmp.a, cmp.b):
+            if node not in self.node_to_cluster:
+                raise DataIntegrityError(
+                    {
+                        "msg": f'comparison references node "{node}" which does not exist',
+                        "cmp": cmp,
+                        "node_id": node,
+                    }
+                )
+        check_cmp_op(self.get_cmp(cmp.a, cmp.b), cmp)
+
+    def add_cmp_data(self, cmp: DB_ResponseCmp, strict: bool = False):
+        """
+        Args:
+            cmp (DB_ResponseCmp): comparison to add
+            strict (bool, optional): reject (raise DataIntegrityError) comparisons which conflict with existing data, before modifying it. Defaults to False.
+        """
+        if strict:
+            self.check_cmp_data(cmp)
         self.raw_cmp_data.append(cmp)
         if cmp.cmp == ">":
             self.connect_cluster(
@@ -184,35 +325,106 @@ class DialogueNodeCmp:
             assert cmp.cmp == "="
             self.merge_cluster(self.node_to_cluster[cmp.a], self.node_to_cluster[cmp.b])
 
-    def compute_coverage(self, random_pair_wo_rel: bool = True) -> CoverageData:
+    def compute_coverage(
+        self,
+        random_pair_wo_rel: bool = True,
+        pair_selector: Optional[PairSelector] = None,
+    ) -> CoverageData:
+        """
+        Args:
+            random_pair_wo_rel (bool, optional): pick a random pair without relation, instead of the first one. Defaults to True.
+            pair_selector (Optional[PairSelector], optional): strategy picking the pair without relation, overrides `random_pair_wo_rel`. The pick is cached until data changes. Defaults to None.
+        """
         if self.coverage_cache is None:
-            total_pairs = 0
-            pairs_w_rel_count = 0
-            pairs_wo_rel: List[Tuple[InstanceId, InstanceId]] = []
-            for a_idx, node_a in enumerate(self.nodes):
-                for node_b in self.nodes[a_idx + 1 :]:
-                    total_pairs += 1
-                    if self.get_cmp(node_a, node_b) == "-":
-                        pairs_wo_rel.append((node_a, node_b))
-                    else:
-                        pairs_w_rel_count += 1
-
-            if len(pairs_wo_rel):
-                if random_pair_wo_rel:
-                    pair_wo_rel = random.choice(pairs_wo_rel)
-                else:
-                    pair_wo_rel = pairs_wo_rel[0]
+            coverage = self.coverage
+            if pair_selector is not None:
+                pair_wo_rel = pair_selector(self)
+            elif random_pair_wo_rel:
+                pair_wo_rel = coverage.random_pair_wo_rel()
             else:
-                pair_wo_rel = None
-
-            self.coverage_cache = pairs_w_rel_count, total_pairs, pair_wo_rel
+                pair_wo_rel = coverage.first_pair_wo_rel()
+            self.coverage_cache = (
+                coverage.pairs_w_rel_count,
+                coverage.total_pairs,
+                pair_wo_rel,
+            )
 
         return self.coverage_cache
 
+    def to_state(self) -> NodeCmpState:
+        assert len(self.raw_cmp_data) > 0, "no comparison to snapshot"
+        node_idx = {node: idx for idx, node in enumerate(self.nodes)}
+        c_ids = list(self.ins_cluster.keys())
+        c_idx = {c_id: idx for idx, c_id in enumerate(c_ids)}
+        return NodeCmpState(
+            n_cmps=len(self.raw_cmp_data),
+            last_cmp_id=self.raw_cmp_data[-1].id,
+            nodes=self.nodes.copy(),
+            clusters=[
+                sorted(node_idx[node] for node in self.ins_cluster[c_id].cluster)
+                for c_id in c_ids
+            ],
+            after=[
+                sorted(c_idx[o_c_id] for o_c_id in self.get_cluster(c_id).after)
+                for c_id in c_ids
+            ],
+        )
+
+    def load_state(self, state: NodeCmpState, cmps: List[DB_ResponseCmp]):
+        """Restore state, instead of adding its comparisons
+
+        Args:
+            state (NodeCmpState): state with the same nodes, without any comparison added yet
+            cmps (List[DB_ResponseCmp]): comparisons folded into the state
+        """
+        assert state.nodes == self.nodes and len(self.raw_cmp_data) == 0
+
+        clusters: List[InstanceCluster] = []
+        for node_indices in state.clusters:
+            nodes = [self.nodes[idx] for idx in node_indices]
+            cluster = self.ins_cluster[self.node_to_cluster[nodes[0]]]
+            for node in nodes[1:]:
+                c_id = self.node_to_cluster[node]
+                self.cluster_parent[c_id] = cluster.c_id
+                del self.ins_cluster[c_id]
+                cluster.cluster.add(node)
+            if len(nodes) > 1:
+                cluster.rank = 1
+            clusters.append(cluster)
+
+        for cluster, after in zip(clusters, state.after):
+            for idx in after:
+                cluster.after.add(clusters[idx].c_id)
+                clusters[idx].before.add(cluster.c_id)
+
+        for cluster in clusters:
+            related_nodes = set(cluster.cluster)
+            for c_id in cluster.after:
+                related_nodes.update(self.ins_cluster[c_id].cluster)
+            self._update_coverage(cluster.cluster, related_nodes)
+
+        self.raw_cmp_data = list(cmps)
+        self.coverage_cache = None
+
+    def _get_cluster_nodes(self, c_ids: Set[ClusterId]) -> Set[InstanceId]:
+        nodes: Set[InstanceId] = set()
+        for c_id in c_ids:
+            nodes.update(self.ins_cluster[self.find_cluster_id(c_id)].cluster)
+        return nodes
+
+    def _update_coverage(self, nodes: Set[InstanceId], o_nodes: Set[InstanceId]):
+        """mark pairs between nodes and other nodes as related"""
+        coverage = self.coverage
+        for node in nodes:
+            for o_node in coverage.unrelated(node) & o_nodes:
+                coverage.relate(node, o_node)
+
     def connect_cluster(self, a_c_id: ClusterId, b_c_id: ClusterId):
         # a_cluster prefered over b_cluster
-        a_cluster = self.ins_cluster[a_c_id]
-        b_cluster = self.ins_cluster[b_c_id]
+        a_cluster = self.get_cluster(a_c_id)
+        b_cluster = self.get_cluster(b_c_id)
+        a_c_id = a_cluster.c_id
+        b_c_id = b_cluster.c_id
 
         # add "a cluster" and all clusters before "a cluster" to be "before" all clusters after "b cluster"
         for c_id in b_cluster.after:
@@ -234,65 +446,120 @@ class DialogueNodeCmp:
         a_cluster.after.add(b_c_id)
         a_cluster.after.update(b_cluster.after)
 
+        # new relations are between "a cluster" (and before) and "b cluster" (and after)
+        self._update_coverage(
+            self._get_cluster_nodes({a_c_id} | a_cluster.before),
+            self._get_cluster_nodes({b_c_id} | b_cluster.after),
+        )
         self.coverage_cache = None
 
     def merge_cluster(self, a_c_id: ClusterId, b_c_id: ClusterId):
         # a_cluster equally prefered to b_cluster
-        # we will merge b_cluster into a_cluster
-        a_cluster = self.ins_cluster[a_c_id]
-        b_cluster = self.ins_cluster[b_c_id]
-
-        for ins_id in b_cluster.cluster:  # move nodes in b_cluster into a_cluster
-            self.node_to_cluster[ins_id] = a_c_id
-        a_cluster.cluster.update(b_cluster.cluster)
+        a_cluster = self.get_cluster(a_c_id)
+        b_cluster = self.get_cluster(b_c_id)
+        if a_cluster is b_cluster:
+            return
+        # union by rank, we will merge b_cluster into a_cluster
+        if a_cluster.rank < b_cluster.rank:
+            a_cluster, b_cluster = b_cluster, a_cluster
+        elif a_cluster.rank == b_cluster.rank:
+            a_cluster.rank += 1
+        a_c_id = a_cluster.c_id
+        b_c_id = b_cluster.c_id
+
+        # nodes of b_cluster and references to b_cluster are resolved to a_cluster lazily
+        self.cluster_parent[b_c_id] = a_c_id
         del self.ins_cluster[b_c_id]
+        a_cluster.cluster.update(b_cluster.cluster)
+        self.merge_gen += 1
 
+        # clusters after (before) one of the merged clusters are after (before) all clusters
+        # before (after) the other one
+        # references to b_cluster are kept, but a_cluster is referenced as well
         for c_id in b_cluster.after:
-            cluster = self.ins_cluster[c_id]
-            cluster.before.remove(b_c_id)
+            cluster = self.ins_cluster[self.find_cluster_id(c_id)]
             cluster.before.add(a_c_id)
             cluster.before.update(a_cluster.before)
-
         for c_id in b_cluster.before:
-            cluster = self.ins_cluster[c_id]
-            cluster.after.remove(b_c_id)
+            cluster = self.ins_cluster[self.find_cluster_id(c_id)]
             cluster.after.add(a_c_id)
             cluster.after.update(a_cluster.after)
-
         for c_id in a_cluster.after:
-            cluster = self.ins_cluster[c_id]
-            cluster.before.update(b_cluster.before)
-
+            self.ins_cluster[self.find_cluster_id(c_id)].before.update(b_cluster.before)
         for c_id in a_cluster.before:
-            cluster = self.ins_cluster[c_id]
-            cluster.after.update(b_cluster.after)
+            self.ins_cluster[self.find_cluster_id(c_id)].after.update(b_cluster.after)
 
         a_cluster.after.update(b_cluster.after)
         a_cluster.before.update(b_cluster.before)
 
+        # new relations are within merged cluster, or between clusters before and after it
+        merged_nodes = a_cluster.cluster
+        before_nodes = self._get_cluster_nodes(a_cluster.before)
+        after_nodes = self._get_cluster_nodes(a_cluster.after)
+        self._update_coverage(merged_nodes, merged_nodes | before_nodes | after_nodes)
+        self._update_coverage(before_nodes, after_nodes)
         self.coverage_cache = None
 
 
 class DialogueNode:
     unit: AnyDialogueUnit
     _next: List[InstanceId]
-    _cmps: Dict[SourceName, DialogueNodeCmp]
+    _cmps: Dict[SourceName, PNodeCmp]
 
-    def __init__(self, unit: AnyDialogueUnit) -> None:
+    def __init__(
+        self, unit: AnyDialogueUnit, cmp_factory: NodeCmpFactory = DialogueNodeCmp
+    ) -> None:
         self.unit = unit
         self._next = []
         self._cmps = {}
+        self._cmp_factory = cmp_factory
 
     def add_next(self, utt_id: InstanceId):
         self._next.append(utt_id)
         for cmp_data in self._cmps.values():
             cmp_data.add_node(utt_id)
 
-    def get_cmp(self, source: SourceName):
+    def is_branching(self) -> bool:
+        """node has multiple next utterances, which can be compared"""
+        return len(self._next) >= 2
+
+    def has_cmp(self, source: SourceName) -> bool:
+        """source has comparison data on this node (without creating it like `get_cmp`)"""
+        return source in self._cmps
+
+    def load_cmp_state(
+        self, source: SourceName, state: NodeCmpState, cmps: List[DB_ResponseCmp]
+    ) -> bool:
+        """Restore comparison data of the source from state
+
+        Returns:
+            bool: state matches the node and comparisons, and is restored
+        """
+        if (
+            state.nodes != self._next
+            or state.n_cmps != len(cmps)
+            or state.n_cmps == 0
+            or cmps[-1].id != state.last_cmp_id
+        ):
+            return False
+        cmp_data = self._cmp_factory(self._next)
+        cmp_data.load_state(state, cmps)
+        self._cmps[source] = cmp_data
+        return True
+
+    def get_cmp_states(self) -> Dict[SourceName, NodeCmpState]:
+        """states of sources with comparisons and without issues"""
+        return {
+            src: cmp.to_state()
+            for src, cmp in self._cmps.items()
+            if len(cmp.raw_cmp_data) > 0 and not cmp.find_issues(inspect=False)
+        }
+
+    def get_cmp(self, source: SourceName) -> PNodeCmp:
         if source in self._cmps:
             cmp_data = self._cmps[source]
         else:
-            cmp_data = self._cmps[source] = DialogueNodeCmp(self._next)
+            cmp_data = self._cmps[source] = self._cmp_factory(self._next)
         return cmp_data
 
     def find_issues(self, inspect: bool) -> bool:
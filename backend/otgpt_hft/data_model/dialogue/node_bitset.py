@@ -0,0 +1,292 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional
+
+from otgpt_hft.data_model.cmp import DB_ResponseCmp
+from otgpt_hft.data_model.dialogue.error import DataIntegrityError
+
+from ..abs import InstanceId
+from .coverage import PairCoverage
+from .node import CoverageData, FullCompareOp, check_cmp_op
+from .state import NodeCmpState
+
+if TYPE_CHECKING:
+    from .pair_selection import PairSelector
+
+
+def _iter_bits(mask: int) -> Iterator[int]:
+    while mask:
+        low_bit = mask & -mask
+        yield low_bit.bit_length() - 1
+        mask ^= low_bit
+
+
+class BitsetDialogueNodeCmp:
+    """Dialogue Node Comparison Data, bitset engine
+
+    Same as `DialogueNodeCmp`, but each node gets an index and relations of a node are stored
+    as int bitmasks over node indices, so closure updates and lookups are bit operations.
+    """
+
+    def __init__(self, init_nodes: Optional[List[InstanceId]] = None) -> None:
+        self.node_idx: Dict[InstanceId, int] = {}
+        self.nodes: List[InstanceId] = []
+        # eq: nodes prefered equally to the node (including the node)
+        self.eq: List[int] = []
+        # lt: nodes prefered more than the node (before)
+        self.lt: List[int] = []
+        # gt: nodes prefered less than the node (after)
+        self.gt: List[int] = []
+        # related nodes already counted in coverage
+        self._covered: List[int] = []
+        self.coverage = PairCoverage()
+
+        if init_nodes:
+            for n in init_nodes:
+                self.add_node(n)
+
+        self.coverage_cache: Optional[CoverageData] = None
+        self.raw_cmp_data: List[DB_ResponseCmp] = []
+
+    def find_issues(self, inspect: bool) -> bool:
+        for idx, node in enumerate(self.nodes):
+            eq = self.eq[idx]
+            # [1] equally prefered nodes share the same relations
+            for o_idx in _iter_bits(eq):
+                if (
+                    self.eq[o_idx] != eq
+                    or self.lt[o_idx] != self.lt[idx]
+                    or self.gt[o_idx] != self.gt[idx]
+                ):
+                    if inspect:
+                        raise DataIntegrityError(
+                            {
+                                "msg": f"node {node} is equal to node {self.nodes[o_idx]}, but their relations differ",
+                                "node_id": node,
+                                "other_node_id": self.nodes[o_idx],
+                            }
+                        )
+                    return True
+
+            # [2] check before after matches
+            for o_idx in _iter_bits(self.gt[idx]):
+                if not self.lt[o_idx] >> idx & 1:
+                    if inspect:
+                        raise DataIntegrityError(
+                            {
+                                "msg": f"node {node} has another node {self.nodes[o_idx]} as after, but not the other way around (before)",
+                                "node_id": node,
+                                "other_node_id": self.nodes[o_idx],
+                            }
+                        )
+                    return True
+            for o_idx in _iter_bits(self.lt[idx]):
+                if not self.gt[o_idx] >> idx & 1:
+                    if inspect:
+                        raise DataIntegrityError(
+                            {
+                                "msg": f"node {node} has another node {self.nodes[o_idx]} as before, but not the other way around (after)",
+                                "node_id": node,
+                                "other_node_id": self.nodes[o_idx],
+                            }
+                        )
+                    return True
+
+        # [3] check data does not have conflict
+        for idx, node in enumerate(self.nodes):
+            if self.has_conflict(idx):
+                if inspect:
+                    raise DataIntegrityError(
+                        {
+                            "msg": f"node {node} has conflict",
+                            "node_id": node,
+                            "before": [self.nodes[i] for i in _iter_bits(self.lt[idx])],
+                            "after": [self.nodes[i] for i in _iter_bits(self.gt[idx])],
+                        }
+                    )
+                return True
+
+        return False
+
+    def has_conflict(self, idx: int) -> bool:
+        lt = self.lt[idx]
+        gt = self.gt[idx]
+        # node both before and after, or equal to a node before/after
+        return (lt & gt) != 0 or (self.eq[idx] & (lt | gt)) != 0
+
+    def get_cmp(self, node_a: InstanceId, node_b: InstanceId) -> FullCompareOp:
+        a_idx = self.node_idx[node_a]
+        b_bit = 1 << self.node_idx[node_b]
+
+        if self.eq[a_idx] & b_bit:
+            return "="
+        if self.gt[a_idx] & b_bit:
+            return ">"
+        if self.lt[a_idx] & b_bit:
+            return "<"
+        return "-"
+
+    def add_node(self, node: InstanceId):
+        idx = len(self.nodes)
+        self.node_idx[node] = idx
+        self.nodes.append(node)
+        self.eq.append(1 << idx)
+        self.lt.append(0)
+        self.gt.append(0)
+        self._covered.append(1 << idx)
+        self.coverage.add_node(node)
+        self.coverage_cache = None
+
+    def get_cmp_data(self) -> List[DB_ResponseCmp]:
+        return self.raw_cmp_data.copy()
+
+    def check_cmp_data(self, cmp: DB_ResponseCmp):
+        """Check comparison can be added without conflict, without modifying data
+
+        Raises:
+            DataIntegrityError: comparison references unknown node, or conflicts with existing data
+        """
+        for node in (cmp.a, cmp.b):
+            if node not in self.node_idx:
+                raise DataIntegrityError(
+                    {
+                        "msg": f'comparison references node "{node}" which does not exist',
+                        "cmp": cmp,
+                        "node_id": node,
+                    }
+                )
+        check_cmp_op(self.get_cmp(cmp.a, cmp.b), cmp)
+
+    def add_cmp_data(self, cmp: DB_ResponseCmp, strict: bool = False):
+        """
+        Args:
+            cmp (DB_ResponseCmp): comparison to add
+            strict (bool, optional): reject (raise DataIntegrityError) comparisons which conflict with existing data, before modifying it. Defaults to False.
+        """
+        if strict:
+            self.check_cmp_data(cmp)
+        self.raw_cmp_data.append(cmp)
+        if cmp.cmp == ">":
+            self.connect(self.node_idx[cmp.a], self.node_idx[cmp.b])
+        else:
+            assert cmp.cmp == "="
+            self.merge(self.node_idx[cmp.a], self.node_idx[cmp.b])
+
+    def compute_coverage(
+        self,
+        random_pair_wo_rel: bool = True,
+        pair_selector: Optional[PairSelector] = None,
+    ) -> CoverageData:
+        """
+        Args:
+            random_pair_wo_rel (bool, optional): pick a random pair without relation, instead of the first one. Defaults to True.
+            pair_selector (Optional[PairSelector], optional): strategy picking the pair without relation, overrides `random_pair_wo_rel`. The pick is cached until data changes. Defaults to None.
+        """
+        if self.coverage_cache is None:
+            coverage = self.coverage
+            if pair_selector is not None:
+                pair_wo_rel = pair_selector(self)
+            elif random_pair_wo_rel:
+                pair_wo_rel = coverage.random_pair_wo_rel()
+            else:
+                pair_wo_rel = coverage.first_pair_wo_rel()
+            self.coverage_cache = (
+                coverage.pairs_w_rel_count,
+                coverage.total_pairs,
+                pair_wo_rel,
+            )
+
+        return self.coverage_cache
+
+    def to_state(self) -> NodeCmpState:
+        assert len(self.raw_cmp_data) > 0, "no comparison to snapshot"
+        # clusters of equal nodes, identified by their eq mask
+        cluster_idx: Dict[int, int] = {}
+        clusters: List[List[int]] = []
+        after_masks: List[int] = []
+        for idx, eq in enumerate(self.eq):
+            if eq not in cluster_idx:
+                cluster_idx[eq] = len(clusters)
+                clusters.append(list(_iter_bits(eq)))
+                after_masks.append(self.gt[idx])
+        return NodeCmpState(
+            n_cmps=len(self.raw_cmp_data),
+            last_cmp_id=self.raw_cmp_data[-1].id,
+            nodes=self.nodes.copy(),
+            clusters=clusters,
+            after=[
+                sorted({cluster_idx[self.eq[idx]] for idx in _iter_bits(after_mask)})
+                for after_mask in after_masks
+            ],
+        )
+
+    def load_state(self, state: NodeCmpState, cmps: List[DB_ResponseCmp]):
+        """Restore state, instead of adding its comparisons
+
+        Args:
+            state (NodeCmpState): state with the same nodes, without any comparison added yet
+            cmps (List[DB_ResponseCmp]): comparisons folded into the state
+        """
+        assert state.nodes == self.nodes and len(self.raw_cmp_data) == 0
+
+        masks = [sum(1 << idx for idx in node_indices) for node_indices in state.clusters]
+        for mask, after in zip(masks, state.after):
+            gt = 0
+            for c_idx in after:
+                gt |= masks[c_idx]
+            for idx in _iter_bits(mask):
+                self.eq[idx] = mask
+                self.gt[idx] = gt
+            for idx in _iter_bits(gt):
+                self.lt[idx] |= mask
+
+        self._update_coverage((1 << len(self.nodes)) - 1)
+        self.raw_cmp_data = list(cmps)
+        self.coverage_cache = None
+
+    def _update_coverage(self, mask: int):
+        """mark newly related pairs of nodes in mask"""
+        for idx in _iter_bits(mask):
+            related = self.eq[idx] | self.lt[idx] | self.gt[idx]
+            new_related = related & ~self._covered[idx]
+            if new_related:
+                self._covered[idx] |= new_related
+                node = self.nodes[idx]
+                for o_idx in _iter_bits(new_related):
+                    self.coverage.relate(node, self.nodes[o_idx])
+
+    def connect(self, a_idx: int, b_idx: int):
+        # node a prefered over node b
+        # node a, and all nodes equal to or before node a
+        a_side = self.eq[a_idx] | self.lt[a_idx]
+        # node b, and all nodes equal to or after node b
+        b_side = self.eq[b_idx] | self.gt[b_idx]
+
+        for idx in _iter_bits(a_side):
+            self.gt[idx] |= b_side
+        for idx in _iter_bits(b_side):
+            self.lt[idx] |= a_side
+
+        self._update_coverage(a_side)
+        self.coverage_cache = None
+
+    def merge(self, a_idx: int, b_idx: int):
+        # node a equally prefered to node b
+        eq = self.eq[a_idx] | self.eq[b_idx]
+        if eq == self.eq[a_idx]:
+            return
+        lt = self.lt[a_idx] | self.lt[b_idx]
+        gt = self.gt[a_idx] | self.gt[b_idx]
+
+        # nodes after the merged nodes are after all nodes before any of them
+        for idx in _iter_bits(gt):
+            self.lt[idx] |= eq | lt
+        for idx in _iter_bits(lt):
+            self.gt[idx] |= eq | gt
+        for idx in _iter_bits(eq):
+            self.eq[idx] = eq
+            self.lt[idx] = lt
+            self.gt[idx] = gt
+
+        self._update_coverage(eq | lt | gt)
+        self.coverage_cache = None
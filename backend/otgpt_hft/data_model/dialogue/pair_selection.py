@@ -0,0 +1,75 @@
+"""Strategies for picking the next pair of nodes to compare"""
+
+from __future__ import annotations
+
+import functools
+from typing import Callable, Dict, List, Optional
+
+from ..abs import InstanceId
+from .coverage import NodePair
+from .node import PNodeCmp
+
+# pick a pair without relation, None if all pairs are related
+PairSelector = Callable[[PNodeCmp], Optional[NodePair]]
+
+
+def select_random_pair(cmp: PNodeCmp) -> Optional[NodePair]:
+    """random pair without relation"""
+    return cmp.coverage.random_pair_wo_rel()
+
+
+def select_first_pair(cmp: PNodeCmp) -> Optional[NodePair]:
+    """first pair without relation, in the order nodes were added"""
+    return cmp.coverage.first_pair_wo_rel()
+
+
+def select_insertion_pair(cmp: PNodeCmp) -> Optional[NodePair]:
+    """Pair of binary insertion sort
+
+    Nodes related to each other form a sorted chain, the first node outside the chain is
+    inserted into it by comparing against the middle of the chain nodes it has no relation to.
+    Either answer relates the inserted node to half of those nodes through transitivity,
+    which resolves the most unknown pairs in expectation, so a node of n responses is fully
+    ordered with about log2(n!) comparisons instead of up to n(n-1)/2.
+    """
+    coverage = cmp.coverage
+    chain: List[InstanceId] = []
+    inserted: Optional[InstanceId] = None
+    for node in cmp.nodes:
+        unrelated = coverage.unrelated(node)
+        if not any(chain_node in unrelated for chain_node in chain):
+            chain.append(node)
+        elif inserted is None:
+            inserted = node
+    if inserted is None:
+        return None
+
+    # chain nodes the inserted node may be placed around, contiguous once the chain is sorted
+    unrelated = coverage.unrelated(inserted)
+    candidates = sorted(
+        (node for node in chain if node in unrelated),
+        key=functools.cmp_to_key(functools.partial(_cmp_order, cmp)),
+    )
+    middle = candidates[len(candidates) // 2]
+
+    node_idx: Dict[InstanceId, int] = {node: idx for idx, node in enumerate(cmp.nodes)}
+    if node_idx[middle] < node_idx[inserted]:
+        return middle, inserted
+    return inserted, middle
+
+
+def _cmp_order(cmp: PNodeCmp, node_a: InstanceId, node_b: InstanceId) -> int:
+    """more prefered nodes first"""
+    op = cmp.get_cmp(node_a, node_b)
+    if op == ">":
+        return -1
+    if op == "<":
+        return 1
+    return 0
+
+
+PAIR_SELECTORS: Dict[str, PairSelector] = {
+    "random": select_random_pair,
+    "first": select_first_pair,
+    "insertion": select_insertion_pair,
+}
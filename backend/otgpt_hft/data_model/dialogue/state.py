@@ -0,0 +1,44 @@
+"""Serializable comparison state of dialogue graphs"""
+
+from typing import Dict, List, Set, Tuple
+
+from pydantic import BaseModel
+
+from ..abs import InstanceId
+from ..source import SourceName
+
+
+class NodeCmpState(BaseModel):
+    """Comparison data of a single node from a single source, without its comparisons"""
+
+    # number of comparisons folded into the state
+    n_cmps: int
+    # id of the last comparison folded into the state
+    last_cmp_id: str
+    # next nodes being compared, in order
+    nodes: List[InstanceId]
+    # equally prefered nodes, as indices of `nodes`
+    clusters: List[List[int]]
+    # clusters prefered less than each cluster, as indices of `clusters`
+    after: List[List[int]]
+
+    def is_complete(self) -> bool:
+        """all pairs of nodes are related, the source completed comparing the nodes"""
+        related: Set[Tuple[int, int]] = set()
+        for cluster, after in zip(self.clusters, self.after):
+            related_nodes = set(cluster)
+            for c_idx in after:
+                related_nodes.update(self.clusters[c_idx])
+            for node in cluster:
+                for o_node in related_nodes:
+                    if node != o_node:
+                        related.add((min(node, o_node), max(node, o_node)))
+        n_nodes = len(self.nodes)
+        return len(related) == n_nodes * (n_nodes - 1) // 2
+
+
+class GraphCmpState(BaseModel):
+    """Comparison data of a dialogue graph"""
+
+    # source name -> node id -> state
+    sources: Dict[SourceName, Dict[InstanceId, NodeCmpState]] = {}
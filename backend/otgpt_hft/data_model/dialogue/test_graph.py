@@ -0,0 +1,137 @@
+from uuid import uuid4
+
+from otgpt_hft.data_model.cmp import DB_ResponseCmp
+from otgpt_hft.data_model.dialogue.graph import (
+    DialogueGraph,
+    get_branching_node_ids,
+    get_completed_node_ids,
+)
+from otgpt_hft.data_model.serial.entry import SerializedEntry
+from otgpt_hft.data_model.source import UserSource
+
+SOURCE_A = UserSource(uname="a")
+SOURCE_B = UserSource(uname="b")
+
+
+def make_entry() -> SerializedEntry:
+    src = {"t": "oanno", "name": "test"}
+    return SerializedEntry.model_validate(
+        {
+            "prompt": {
+                "id": "p",
+                "cls": "pmpt",
+                "task": "general",
+                "author": "user",
+                "source": src,
+                "tags": [],
+                "utt": "prompt",
+            },
+            "utterance": [
+                {
+                    "id": f"r{i}",
+                    "cls": "utt",
+                    "task": "general",
+                    "author": "agent",
+                    "source": src,
+                    "prev_id": "p",
+                    "utt": f"response {i}",
+                }
+                for i in range(3)
+            ],
+            "cmps": [
+                DB_ResponseCmp(
+                    id=str(uuid4()), a="r0", b="r1", cmp=">", source=SOURCE_A
+                ).model_dump(),
+                DB_ResponseCmp(
+                    id=str(uuid4()), a="r1", b="r2", cmp="=", source=SOURCE_B
+                ).model_dump(),
+            ],
+        }
+    )
+
+
+def test_dialogue_graph_lazy_cmps():
+    graph = DialogueGraph(make_entry(), lazy_cmps=True)
+
+    # comparisons are not added until the source is accessed
+    assert not graph.root.has_cmp(SOURCE_A.get_name())
+    assert not graph.root.has_cmp(SOURCE_B.get_name())
+
+    cmp = graph.get_cmp("p", SOURCE_A.get_name())
+    assert cmp.get_cmp("r0", "r1") == ">"
+    assert len(cmp.raw_cmp_data) == 1
+    assert not graph.root.has_cmp(SOURCE_B.get_name())
+
+    # pending comparisons are added before new ones
+    graph.add_cmp(
+        DB_ResponseCmp(id=str(uuid4()), a="r0", b="r2", cmp=">", source=SOURCE_B)
+    )
+    cmp = graph.get_cmp("p", SOURCE_B.get_name())
+    assert [cmp_data.cmp for cmp_data in cmp.raw_cmp_data] == ["=", ">"]
+    assert cmp.get_cmp("r0", "r1") == ">"
+    assert graph.find_issues(inspect=True) == False
+
+
+def test_dialogue_graph_cmp_states():
+    entry = make_entry()
+    graph = DialogueGraph(entry, lazy_cmps=True)
+    graph.get_cmp("p", SOURCE_A.get_name())
+    cmp_states = graph.get_cmp_states()
+    # sources which are not accessed keep no state
+    assert list(cmp_states.sources) == [SOURCE_A.get_name()]
+
+    # a comparison newer than the state is replayed on top of it
+    newer_cmp = DB_ResponseCmp(
+        id=str(uuid4()), a="r1", b="r2", cmp=">", source=SOURCE_A
+    )
+    entry.cmps.append(newer_cmp)
+    graph = DialogueGraph(entry, lazy_cmps=True, cmp_states=cmp_states)
+    cmp = graph.get_cmp("p", SOURCE_A.get_name())
+    assert cmp.raw_cmp_data == [entry.cmps[0], newer_cmp]
+    assert cmp.get_cmp("r0", "r2") == ">"
+
+    # a state which does not match the comparisons is ignored
+    entry.cmps[0] = entry.cmps[0].model_copy(update={"id": str(uuid4())})
+    graph = DialogueGraph(entry, lazy_cmps=True, cmp_states=cmp_states)
+    cmp = graph.get_cmp("p", SOURCE_A.get_name())
+    assert len(cmp.raw_cmp_data) == 2
+    assert cmp.get_cmp("r0", "r2") == ">"
+
+
+def test_dialogue_graph_branching_nodes():
+    entry = make_entry()
+    graph = DialogueGraph(entry)
+    assert list(graph.branching_nodes) == ["p"] == get_branching_node_ids(entry)
+
+    # index is kept current as utterances are added
+    for i in range(2):
+        utt = entry.utterance[0].model_copy(
+            update={"id": f"r0_{i}", "prev_id": "r0"}
+        )
+        graph.add_utt(utt)
+        entry.utterance.append(utt)
+    assert list(graph.branching_nodes) == ["p", "r0"] == get_branching_node_ids(entry)
+
+
+def test_get_completed_node_ids():
+    entry = make_entry()
+    entry.cmps.append(
+        DB_ResponseCmp(id=str(uuid4()), a="r1", b="r2", cmp=">", source=SOURCE_A)
+    )
+    graph = DialogueGraph(entry, lazy_cmps=True)
+    graph.get_cmp("p", SOURCE_A.get_name())
+    graph.get_cmp("p", SOURCE_B.get_name())
+    cmp_states = graph.get_cmp_states()
+    # only source a related all pairs
+    assert get_completed_node_ids(entry, cmp_states) == {"p": {SOURCE_A.get_name()}}
+
+    # a state which does not match the comparisons is not trusted
+    entry.cmps.append(
+        DB_ResponseCmp(id=str(uuid4()), a="r0", b="r2", cmp=">", source=SOURCE_B)
+    )
+    assert get_completed_node_ids(entry, cmp_states) == {"p": {SOURCE_A.get_name()}}
+    graph = DialogueGraph(entry, lazy_cmps=True, cmp_states=cmp_states)
+    graph.get_cmp("p", SOURCE_B.get_name())
+    assert get_completed_node_ids(entry, graph.get_cmp_states()) == {
+        "p": {SOURCE_A.get_name(), SOURCE_B.get_name()}
+    }
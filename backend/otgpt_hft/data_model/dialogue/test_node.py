@@ -1,14 +1,25 @@
+import random
 from uuid import uuid4
 
+import pytest
+
 from otgpt_hft.data_model.cmp import DB_ResponseCmp
-from otgpt_hft.data_model.dialogue.node import DialogueNodeCmp
+from otgpt_hft.data_model.dialogue.error import DataIntegrityError
+from otgpt_hft.data_model.dialogue.node import DialogueNodeCmp, NodeCmpFactory
+from otgpt_hft.data_model.dialogue.node_bitset import BitsetDialogueNodeCmp
+from otgpt_hft.data_model.dialogue.testing import random_rank, random_ranked_cmps
 from otgpt_hft.data_model.source import UserSource
 
 TEST_SOURCE = UserSource(uname="test-suit")
 
 
-def test_dialogue_node_cmp():
-    cmp = DialogueNodeCmp()
+@pytest.fixture(params=[DialogueNodeCmp, BitsetDialogueNodeCmp])
+def cmp_factory(request: pytest.FixtureRequest) -> NodeCmpFactory:
+    return request.param
+
+
+def test_dialogue_node_cmp(cmp_factory: NodeCmpFactory):
+    cmp = cmp_factory([])
 
     cmp.add_node("a1")
     cmp.add_node("a2")
@@ -85,8 +96,8 @@ def test_dialogue_node_cmp():
     assert cmp.find_issues(inspect=True) == False
 
 
-def test_dialogue_node_cmp_coverage_1():
-    cmp = DialogueNodeCmp()
+def test_dialogue_node_cmp_coverage_1(cmp_factory: NodeCmpFactory):
+    cmp = cmp_factory([])
 
     assert cmp.compute_coverage(random_pair_wo_rel=False) == (0, 0, None)
 
@@ -123,8 +134,8 @@ def test_dialogue_node_cmp_coverage_1():
     assert cmp.find_issues(inspect=True) == False
 
 
-def test_dialogue_node_cmp_coverage_2():
-    cmp = DialogueNodeCmp()
+def test_dialogue_node_cmp_coverage_2(cmp_factory: NodeCmpFactory):
+    cmp = cmp_factory([])
 
     cmp.add_node("a1")
     cmp.add_node("a2")
@@ -145,8 +156,8 @@ def test_dialogue_node_cmp_coverage_2():
     assert cmp.find_issues(inspect=True) == False
 
 
-def test_dialogue_node_cmp_coverage_3():
-    cmp = DialogueNodeCmp()
+def test_dialogue_node_cmp_coverage_3(cmp_factory: NodeCmpFactory):
+    cmp = cmp_factory([])
 
     cmp.add_node("a1")
     cmp.add_node("a2")
@@ -167,8 +178,8 @@ def test_dialogue_node_cmp_coverage_3():
     assert cmp.find_issues(inspect=True) == False
 
 
-def test_dialogue_node_cmp_conflict_1():
-    cmp = DialogueNodeCmp()
+def test_dialogue_node_cmp_conflict_1(cmp_factory: NodeCmpFactory):
+    cmp = cmp_factory([])
 
     cmp.add_node("a1")
     cmp.add_node("a2")
@@ -188,8 +199,8 @@ def test_dialogue_node_cmp_conflict_1():
     assert cmp.find_issues(inspect=False) == True
 
 
-def test_dialogue_node_cmp_conflict_2():
-    cmp = DialogueNodeCmp()
+def test_dialogue_node_cmp_conflict_2(cmp_factory: NodeCmpFactory):
+    cmp = cmp_factory([])
 
     cmp.add_node("a1")
     cmp.add_node("a2")
@@ -209,8 +220,8 @@ def test_dialogue_node_cmp_conflict_2():
     assert cmp.find_issues(inspect=False) == True
 
 
-def test_dialogue_node_cmp_conflict_3():
-    cmp = DialogueNodeCmp()
+def test_dialogue_node_cmp_conflict_3(cmp_factory: NodeCmpFactory):
+    cmp = cmp_factory([])
 
     cmp.add_node("a1")
 
@@ -220,8 +231,8 @@ def test_dialogue_node_cmp_conflict_3():
     assert cmp.find_issues(inspect=False) == True
 
 
-def test_dialogue_node_cmp_conflict_3():
-    cmp = DialogueNodeCmp()
+def test_dialogue_node_cmp_conflict_3(cmp_factory: NodeCmpFactory):
+    cmp = cmp_factory([])
 
     cmp.add_node("a1")
 
@@ -229,3 +240,163 @@ def test_dialogue_node_cmp_conflict_3():
         DB_ResponseCmp(id=str(uuid4()), a="a1", b="a1", cmp=">", source=TEST_SOURCE)
     )
     assert cmp.find_issues(inspect=False) == True
+
+
+def test_dialogue_node_cmp_coverage_incremental(cmp_factory: NodeCmpFactory):
+    rng = random.Random(0)
+    nodes = [f"a{i}" for i in range(12)]
+
+    for _ in range(20):
+        # comparisons are consistent with a hidden ranking (with ties)
+        rank = random_rank(rng, nodes, 5)
+        cmp = cmp_factory(nodes[:6])
+        for node in nodes[6:]:
+            for cmp_data in random_ranked_cmps(rng, cmp.nodes, rank, 3, TEST_SOURCE):
+                cmp.add_cmp_data(cmp_data)
+
+                # compare against all pairs
+                pairs_wo_rel = [
+                    (node_a, node_b)
+                    for a_idx, node_a in enumerate(cmp.nodes)
+                    for node_b in cmp.nodes[a_idx + 1 :]
+                    if cmp.get_cmp(node_a, node_b) == "-"
+                ]
+                total_pairs = len(cmp.nodes) * (len(cmp.nodes) - 1) // 2
+                cmp.coverage_cache = None
+                assert cmp.compute_coverage(random_pair_wo_rel=False) == (
+                    total_pairs - len(pairs_wo_rel),
+                    total_pairs,
+                    pairs_wo_rel[0] if pairs_wo_rel else None,
+                )
+                cmp.coverage_cache = None
+                pair_wo_rel = cmp.compute_coverage()[2]
+                assert pair_wo_rel is None or pair_wo_rel in pairs_wo_rel
+            cmp.add_node(node)
+
+
+def test_dialogue_node_cmp_engines_agree():
+    rng = random.Random(1)
+    nodes = [f"a{i}" for i in range(10)]
+    rank = random_rank(rng, nodes, 4)
+
+    cmp = DialogueNodeCmp(nodes)
+    bitset_cmp = BitsetDialogueNodeCmp(nodes)
+    for cmp_data in random_ranked_cmps(rng, nodes, rank, 12, TEST_SOURCE):
+        cmp.add_cmp_data(cmp_data)
+        bitset_cmp.add_cmp_data(cmp_data)
+
+        for node_a in nodes:
+            for node_b in nodes:
+                assert cmp.get_cmp(node_a, node_b) == bitset_cmp.get_cmp(
+                    node_a, node_b
+                )
+        assert cmp.compute_coverage(False) == bitset_cmp.compute_coverage(False)
+    assert bitset_cmp.find_issues(inspect=True) == False
+
+
+def test_dialogue_node_cmp_merge_chain():
+    nodes = [f"a{i}" for i in range(8)]
+    cmp = DialogueNodeCmp(nodes)
+
+    cmp.add_cmp_data(
+        DB_ResponseCmp(id=str(uuid4()), a="a0", b="a1", cmp=">", source=TEST_SOURCE)
+    )
+    for node_a, node_b in zip(nodes[2:], nodes[1:]):
+        cmp.add_cmp_data(
+            DB_ResponseCmp(
+                id=str(uuid4()), a=node_a, b=node_b, cmp="=", source=TEST_SOURCE
+            )
+        )
+
+    # all tied nodes are resolved to a single representative cluster
+    assert len(cmp.ins_cluster) == 2
+    assert len({cmp.get_cluster_id(node) for node in nodes[1:]}) == 1
+    for node in nodes[1:]:
+        assert cmp.get_cmp("a0", node) == ">"
+        assert cmp.get_cmp(node, "a0") == "<"
+        assert cmp.get_cmp("a1", node) == "="
+    assert cmp.compute_coverage(random_pair_wo_rel=False) == (28, 28, None)
+    assert cmp.find_issues(inspect=True) == False
+
+
+def test_dialogue_node_cmp_strict(cmp_factory: NodeCmpFactory):
+    cmp = cmp_factory(["a1", "a2", "a3"])
+
+    cmp.add_cmp_data(
+        DB_ResponseCmp(id=str(uuid4()), a="a1", b="a2", cmp=">", source=TEST_SOURCE),
+        strict=True,
+    )
+    cmp.add_cmp_data(
+        DB_ResponseCmp(id=str(uuid4()), a="a2", b="a3", cmp=">", source=TEST_SOURCE),
+        strict=True,
+    )
+    coverage = cmp.compute_coverage(random_pair_wo_rel=False)
+
+    rejected = [
+        # cycle
+        DB_ResponseCmp(id=str(uuid4()), a="a3", b="a1", cmp=">", source=TEST_SOURCE),
+        # tie of ordered nodes
+        DB_ResponseCmp(id=str(uuid4()), a="a1", b="a3", cmp="=", source=TEST_SOURCE),
+        # node prefered over itself
+        DB_ResponseCmp(id=str(uuid4()), a="a1", b="a1", cmp=">", source=TEST_SOURCE),
+        # unknown node
+        DB_ResponseCmp(id=str(uuid4()), a="a1", b="b1", cmp=">", source=TEST_SOURCE),
+    ]
+    for cmp_data in rejected:
+        with pytest.raises(DataIntegrityError):
+            cmp.add_cmp_data(cmp_data, strict=True)
+
+    # data is not modified by rejected comparisons
+    assert len(cmp.raw_cmp_data) == 2
+    assert cmp.compute_coverage(random_pair_wo_rel=False) == coverage
+    assert cmp.find_issues(inspect=True) == False
+
+    # comparisons consistent with existing data are accepted
+    cmp.add_cmp_data(
+        DB_ResponseCmp(id=str(uuid4()), a="a1", b="a3", cmp=">", source=TEST_SOURCE),
+        strict=True,
+    )
+    cmp.add_cmp_data(
+        DB_ResponseCmp(id=str(uuid4()), a="a2", b="a2", cmp="=", source=TEST_SOURCE),
+        strict=True,
+    )
+    assert len(cmp.raw_cmp_data) == 4
+
+
+def test_dialogue_node_cmp_state(cmp_factory: NodeCmpFactory):
+    rng = random.Random(2)
+    nodes = [f"a{i}" for i in range(10)]
+    rank = random_rank(rng, nodes, 4)
+
+    cmp = cmp_factory(nodes)
+    for cmp_data in random_ranked_cmps(rng, nodes, rank, 12, TEST_SOURCE):
+        cmp.add_cmp_data(cmp_data)
+
+    # state is restored by either engine
+    state = cmp.to_state()
+    assert state.n_cmps == 12
+    for restore_factory in (DialogueNodeCmp, BitsetDialogueNodeCmp):
+        restored = restore_factory(nodes)
+        restored.load_state(state, cmp.raw_cmp_data)
+        assert restored.raw_cmp_data == cmp.raw_cmp_data
+        for node_a in nodes:
+            for node_b in nodes:
+                assert restored.get_cmp(node_a, node_b) == cmp.get_cmp(node_a, node_b)
+        assert restored.compute_coverage(False) == cmp.compute_coverage(False)
+        assert restored.find_issues(inspect=True) == False
+
+
+def test_dialogue_node_cmp_state_complete(cmp_factory: NodeCmpFactory):
+    rng = random.Random(3)
+    nodes = [f"a{i}" for i in range(6)]
+    rank = random_rank(rng, nodes, 3)
+
+    cmp = cmp_factory(nodes)
+    completed = False
+    for cmp_data in random_ranked_cmps(rng, nodes, rank, 40, TEST_SOURCE):
+        cmp.add_cmp_data(cmp_data)
+        # completion is known from the state, as from the coverage
+        pairs_w_rel_count, total_pairs, _ = cmp.compute_coverage(False)
+        assert cmp.to_state().is_complete() == (pairs_w_rel_count == total_pairs)
+        completed = pairs_w_rel_count == total_pairs
+    assert completed
@@ -0,0 +1,45 @@
+import random
+
+import pytest
+
+from otgpt_hft.data_model.dialogue.node import DialogueNodeCmp, NodeCmpFactory
+from otgpt_hft.data_model.dialogue.node_bitset import BitsetDialogueNodeCmp
+from otgpt_hft.data_model.dialogue.pair_selection import select_insertion_pair
+from otgpt_hft.data_model.dialogue.testing import random_rank, ranked_cmp
+from otgpt_hft.data_model.source import UserSource
+
+TEST_SOURCE = UserSource(uname="test-suit")
+
+
+@pytest.mark.parametrize("cmp_factory", [DialogueNodeCmp, BitsetDialogueNodeCmp])
+def test_select_insertion_pair(cmp_factory: NodeCmpFactory):
+    rng = random.Random(0)
+    nodes = [f"a{i}" for i in range(8)]
+
+    for _ in range(20):
+        rank = random_rank(rng, nodes, 6)
+        cmp = cmp_factory(nodes)
+        n_cmps = 0
+        while True:
+            cmp.coverage_cache = None
+            _, _, pair = cmp.compute_coverage(pair_selector=select_insertion_pair)
+            if pair is None:
+                break
+            a, b = pair
+            # pairs are ordered by the order nodes were added, and have no relation
+            assert nodes.index(a) < nodes.index(b)
+            assert cmp.get_cmp(a, b) == "-"
+
+            cmp.add_cmp_data(ranked_cmp(rank, a, b, TEST_SOURCE))
+            n_cmps += 1
+
+        # binary insertion of 8 nodes takes at most 0 + 1 + 2 + 2 + 3 + 3 + 3 + 3 comparisons
+        assert n_cmps <= 17
+        for node_a in nodes:
+            for node_b in nodes:
+                expected = (
+                    "="
+                    if rank[node_a] == rank[node_b]
+                    else ">" if rank[node_a] > rank[node_b] else "<"
+                )
+                assert cmp.get_cmp(node_a, node_b) == expected
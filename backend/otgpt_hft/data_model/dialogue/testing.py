@@ -0,0 +1,42 @@
+"""Comparisons of a simulated annotator, for tests and benchmarks"""
+
+import random
+from typing import Dict, List
+from uuid import uuid4
+
+from ..abs import InstanceId
+from ..cmp import DB_ResponseCmp
+from ..source import AnySource
+
+
+def random_rank(
+    rng: random.Random, nodes: List[InstanceId], n_ranks: int
+) -> Dict[InstanceId, int]:
+    """hidden ranking of the annotator, with ties when there are fewer ranks than nodes"""
+    return {node: rng.randrange(n_ranks) for node in nodes}
+
+
+def ranked_cmp(
+    rank: Dict[InstanceId, int], a: InstanceId, b: InstanceId, source: AnySource
+) -> DB_ResponseCmp:
+    """comparison of the pair consistent with the ranking, the better node first"""
+    if rank[a] < rank[b]:
+        a, b = b, a
+    return DB_ResponseCmp(
+        id=str(uuid4()),
+        a=a,
+        b=b,
+        cmp=">" if rank[a] > rank[b] else "=",
+        source=source,
+    )
+
+
+def random_ranked_cmps(
+    rng: random.Random,
+    nodes: List[InstanceId],
+    rank: Dict[InstanceId, int],
+    n: int,
+    source: AnySource,
+) -> List[DB_ResponseCmp]:
+    """comparisons of `n` random pairs, consistent with the ranking"""
+    return [ranked_cmp(rank, *rng.sample(nodes, 2), source) for _ in range(n)]
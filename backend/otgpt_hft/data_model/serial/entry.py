@@ -1,6 +1,6 @@
 """Representation for serialized data"""
 
-from typing import List
+from typing import Any, Dict, List
 
 from ..any import AnyPrompt, AnyUtterance
 from ..cmp import DB_ResponseCmp
@@ -15,3 +15,7 @@ class SerializedEntry(WithId):
     def get_id(self) -> str:
         # entry is the prompt id
         return self.prompt.id
+
+    @classmethod
+    def get_id_from_raw(cls, raw: Dict[str, Any]) -> str:
+        return raw["prompt"]["id"]
@@ -0,0 +1,130 @@
+"""Group-commit scheduling of saves"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, List, Optional
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# seconds to wait for more changes before flushing
+DEFAULT_SAVE_WINDOW_S = 1.0
+# number of pending changes which triggers a flush before the window ends
+DEFAULT_SAVE_MAX_PENDING = 256
+
+
+class SaveSchedulerStats(BaseModel):
+    # number of flushes performed
+    flushes: int = 0
+    # number of changes that shared a flush with an earlier change
+    coalesced_writes: int = 0
+    # latency of the last flush
+    last_flush_latency_s: float = 0.0
+    # maximum latency of a flush
+    max_flush_latency_s: float = 0.0
+    # total latency of all flushes
+    total_flush_latency_s: float = 0.0
+
+
+class SaveScheduler:
+    """Coalesce pending changes and flush them together
+
+    A change is registered with `schedule`, the returned future resolves once a flush
+    including the change is done. Changes are flushed together when `window_s` seconds have
+    passed since the first pending change, or when `max_pending` changes are pending.
+    Flushes never overlap, `flush` returns once every earlier flush is done.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[], Awaitable[None]],
+        window_s: float = DEFAULT_SAVE_WINDOW_S,
+        max_pending: int = DEFAULT_SAVE_MAX_PENDING,
+    ):
+        self._flush = flush
+        self._window_s = window_s
+        self._max_pending = max_pending
+        # futures of pending changes
+        self._waiters: List[asyncio.Future[None]] = []
+        # task waiting for the window to end before flushing
+        self._task: Optional[asyncio.Task[None]] = None
+        # set when flush should happen before the window ends
+        self._flush_now = asyncio.Event()
+        # held while a flush runs, a flush started later waits for it
+        self._flush_lock = asyncio.Lock()
+        self.stats = SaveSchedulerStats()
+
+    def __len__(self) -> int:
+        """number of pending changes"""
+        return len(self._waiters)
+
+    def schedule(self) -> asyncio.Future[None]:
+        """Register a pending change
+
+        Returns:
+            asyncio.Future[None]: resolved once the change is flushed
+        """
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        # errors are logged by the scheduler, awaiting the future is optional
+        future.add_done_callback(_retrieve_exception)
+        self._waiters.append(future)
+
+        if self._task is None:
+            self._task = asyncio.create_task(self._wait_and_flush())
+        if len(self._waiters) >= self._max_pending:
+            self._flush_now.set()
+        return future
+
+    async def flush(self):
+        """Flush pending changes without waiting for the window to end"""
+        if self._task is not None:
+            self._flush_now.set()
+            await asyncio.shield(self._task)
+        else:
+            await self._run_flush([])
+
+    async def _wait_and_flush(self):
+        try:
+            await asyncio.wait_for(self._flush_now.wait(), timeout=self._window_s)
+        except asyncio.TimeoutError:
+            pass
+        self._flush_now.clear()
+        self._task = None
+
+        waiters = self._waiters
+        self._waiters = []
+        await self._run_flush(waiters)
+
+    async def _run_flush(self, waiters: List[asyncio.Future[None]]):
+        async with self._flush_lock:
+            await self._run_flush_locked(waiters)
+
+    async def _run_flush_locked(self, waiters: List[asyncio.Future[None]]):
+        start_time = time.perf_counter()
+        try:
+            await self._flush()
+        except Exception as e:
+            logger.error({"msg": "flush failed", "error": e})
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+            return
+
+        latency = time.perf_counter() - start_time
+        stats = self.stats
+        stats.flushes += 1
+        stats.coalesced_writes += max(len(waiters) - 1, 0)
+        stats.last_flush_latency_s = latency
+        stats.max_flush_latency_s = max(stats.max_flush_latency_s, latency)
+        stats.total_flush_latency_s += latency
+
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+def _retrieve_exception(future: asyncio.Future[Any]):
+    if not future.cancelled():
+        future.exception()
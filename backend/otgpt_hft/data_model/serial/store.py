@@ -1,14 +1,34 @@
 import asyncio
 import json
+import pickle
 import re
+import zlib
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import Executor
 from pathlib import Path
-from typing import Dict, Generic, List, Optional, Type, TypeVar
+from typing import (
+    Any,
+    Callable,
+    Collection,
+    Dict,
+    Generic,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+)
 
 import aiofiles.os
-from pydantic import BaseModel
-
-from ...utils.file import create_file_atomically, safe_write_file
+from pydantic import BaseModel, ValidationError
+
+from ...utils.file import (
+    atomic_write_bytes,
+    create_file_atomically,
+    durable_write_file,
+    safe_write_file,
+)
 from ..abs import InstanceId
 
 DEFAULT_CHUNK_SIZE = 1024
@@ -20,24 +40,100 @@ class WithId(BaseModel, ABC):
     @abstractmethod
     def get_id(self) -> InstanceId: ...
 
+    @classmethod
+    def get_id_from_raw(cls, raw: Dict[str, Any]) -> InstanceId:
+        """Get ID from a decoded JSON object without validating the whole object
+
+        Subclasses should override this with a cheap lookup,
+        the default implementation validates the whole object.
+        """
+        return cls.model_validate(raw).get_id()
+
 
 I = TypeVar("I", bound=WithId)
 
-CHUNK_FILENAME_PATTERN = r"chunk_(\d+)\.json"
+# temporary files of chunk writes (`chunk_<number>.jsonl.tmp`) are not chunks
+CHUNK_FILENAME_PATTERN = r"^chunk_(\d+)\.jsonl?$"
+
+SNAPSHOT_FILENAME = "snapshot.pkl"
+# version of the snapshot format, snapshots of other versions are ignored
+SNAPSHOT_VERSION = 1
+
+# entry id, byte offset, byte length, crc32 of the entry's line
+ChunkIndexEntry = Tuple[str, int, int, int]
+
+
+class ChunkIndex(BaseModel):
+    """Byte-offset index of a chunk file, stored as a sidecar next to the chunk"""
+
+    # size and modification time of the indexed chunk file, for detecting stale index
+    size: int
+    mtime_ns: int
+    entries: List[ChunkIndexEntry]
+
+    @staticmethod
+    def from_lines(
+        lines: List[bytes], entry_ids: List[str], size: int, mtime_ns: int
+    ) -> "ChunkIndex":
+        entries: List[ChunkIndexEntry] = []
+        offset = 0
+        for line, entry_id in zip(lines, entry_ids):
+            entries.append((entry_id, offset, len(line), zlib.crc32(line)))
+            # line separator
+            offset += len(line) + 1
+        return ChunkIndex(size=size, mtime_ns=mtime_ns, entries=entries)
+
+
+class StoreSnapshot(BaseModel):
+    """Binary snapshot of a fully loaded store, see `Store.save_snapshot`"""
+
+    version: int
+    entry_cls: str
+    # size and modification time of each chunk file the snapshot was taken from
+    chunk_stats: Dict[str, Tuple[int, int]]
+    chunk2id: Dict[int, List[str]]
+    # pickled entries, unpickling skips validation
+    entries: bytes
 
 
 class Store(Generic[I]):
+    """Chunked JSONL key-value store
+
+    By default, all chunks are parsed into memory by `load_chunks`.
+    With `lazy=True`, `load_chunks` only collects chunk metadata (entry ids of each chunk),
+    and a chunk is parsed the first time `get`, `get_entries` or `set` touches it.
+    `max_loaded_chunks` bounds the number of parsed chunks in lazy mode,
+    least recently used chunks are unloaded (and saved if they have pending changes).
+
+    In lazy mode, entries of chunks which are not loaded are read through the chunk's
+    byte-offset index (`chunk_<IDX>.idx`), only parsing the requested lines.
+
+    A fully loaded store can be written to a binary snapshot (`snapshot.pkl`) with `save_snapshot`,
+    `load_snapshot` restores the store without parsing JSON as long as the chunk files are unchanged.
+    """
+
     def __init__(
         self,
         entry_cls: Type[I],
         chunk_dir: Path,
         chunk_size: int = DEFAULT_CHUNK_SIZE,
+        lazy: bool = False,
+        max_loaded_chunks: Optional[int] = None,
     ):
+        assert (
+            max_loaded_chunks is None or max_loaded_chunks > 0
+        ), "max_loaded_chunks must be positive"
         self._chunk_dir = chunk_dir
         self._chunk_size = chunk_size
         self._entry_cls = entry_cls
+        self._lazy = lazy
+        self._max_loaded_chunks = max_loaded_chunks
         # mapping from id to the entires being stored
         self._store: Dict[str, I] = {}
+        # chunks parsed into `_store`, ordered from least to most recently used
+        self._loaded_chunks: OrderedDict[int, None] = OrderedDict()
+        # byte-offset index of chunks (lazy mode)
+        self._chunk_index: Dict[int, ChunkIndex] = {}
 
         # chunking information
         # mapping from id to chunk index
@@ -54,6 +150,10 @@ class Store(Generic[I]):
         self._last_chunk_idx = -1
         # lock for chunking information
         self.chunking_lock = asyncio.Lock()
+        # listeners called with (entry id, entry is created) whenever an entry is set
+        self._set_listeners: List[
+            Callable[[str, bool, Optional[Collection[str]]], None]
+        ] = []
 
     def __len__(self) -> int:
         return self._chunk_size * self._last_chunk_idx + len(
@@ -67,22 +167,37 @@ class Store(Generic[I]):
         chunk_last = end // self._chunk_size
         chunk_end = chunk_last + 1
 
-        for chunk_idx in range(chunk_begin, chunk_end):
-            if chunk_idx == chunk_begin:
-                entry_begin = begin % self._chunk_size
-            else:
-                entry_begin = 0
-            if chunk_idx == chunk_last:
-                entry_end = end % self._chunk_size
-            else:
-                entry_end = self._chunk_size
+        async with self.chunking_lock:
+            for chunk_idx in range(chunk_begin, chunk_end):
+                if chunk_idx == chunk_begin:
+                    entry_begin = begin % self._chunk_size
+                else:
+                    entry_begin = 0
+                if chunk_idx == chunk_last:
+                    entry_end = end % self._chunk_size
+                else:
+                    entry_end = self._chunk_size
+
+                chunkIds = self._chunk2id.get(chunk_idx)
+                if chunkIds is None:
+                    continue
+                entry_end = min(len(chunkIds), entry_end)
+                if entry_begin >= entry_end:
+                    continue
 
-            chunkIds = self._chunk2id[chunk_idx]
-            entry_end = min(len(chunkIds), entry_end)
-            for entry_idx in range(entry_begin, entry_end):
-                entry_id = chunkIds[entry_idx]
-                entry = self._store[entry_id]
-                entries.append(entry)
+                if chunk_idx not in self._loaded_chunks:
+                    chunk_entries = await self._read_indexed_entries(
+                        chunk_idx, entry_begin, entry_end
+                    )
+                    if chunk_entries is not None:
+                        entries.extend(chunk_entries)
+                        continue
+
+                await self._unsafe_touch_chunk(chunk_idx)
+                for entry_idx in range(entry_begin, entry_end):
+                    entry_id = chunkIds[entry_idx]
+                    entry = self._store[entry_id]
+                    entries.append(entry)
 
         return entries
 
@@ -90,7 +205,16 @@ class Store(Generic[I]):
         self,
         begin: int = 0,
         end: int = -1,
+        executor: Optional[Executor] = None,
     ):
+        """Load chunks [begin, end) from disk
+
+        Args:
+            begin (int, optional): first chunk index. Defaults to 0.
+            end (int, optional): end chunk index, -1 for all chunks. Defaults to -1.
+            executor (Optional[Executor], optional): executor (e.g. `ProcessPoolExecutor`) for parsing chunks in parallel,
+                one chunk per task. Not used in lazy mode. Defaults to None (parse in the event loop).
+        """
         async with self.chunking_lock:
             # get chunk ids from disk
             chunk_idx_s: List[int] = sorted(
@@ -110,38 +234,283 @@ class Store(Generic[I]):
             else:
                 self._last_chunk_idx = end - 1
 
-            # iterate over chunks
+            chunk_idx_to_load: List[int] = []
             for chunk_idx in range(begin, end):
                 if chunk_idx not in chunk_idx_s:
                     print(
                         f"WARNING: chunk {chunk_idx} cannot be loaded, chunk is missing"
                     )
                     continue
+                chunk_idx_to_load.append(chunk_idx)
 
-                # read chunk file
-                async with aiofiles.open(
-                    self._chunk_dir / Store.get_chunk_filename(chunk_idx), mode="r"
-                ) as file:
-                    lines = await file.readlines()
+            if executor is not None and not self._lazy:
+                await self._parse_chunks_in_executor(executor, chunk_idx_to_load)
+                return
 
-                chunk2id: List[str] = []
-                for line in lines:
-                    entry = self._entry_cls.model_validate_json(line)
-                    entry_id = entry.get_id()
+            # iterate over chunks
+            for chunk_idx in chunk_idx_to_load:
+                if self._lazy:
+                    # only collect metadata, entries are parsed on first access
+                    chunk_index = await self._load_chunk_index(chunk_idx)
+                    chunk2id = [entry[0] for entry in chunk_index.entries]
+                else:
+                    chunk2id = await self._read_chunk(chunk_idx)
+                self._set_chunk_metadata(chunk_idx, chunk2id)
+
+    def _get_snapshot_path(self) -> Path:
+        return self._chunk_dir / SNAPSHOT_FILENAME
+
+    async def _get_chunk_stats(self) -> Dict[str, Tuple[int, int]]:
+        chunk_stats: Dict[str, Tuple[int, int]] = {}
+        for filename in await aiofiles.os.listdir(self._chunk_dir):
+            if Store.get_chunk_idx_from_filename(filename) is None:
+                continue
+            stat = await aiofiles.os.stat(self._chunk_dir / filename)
+            chunk_stats[filename] = (stat.st_size, stat.st_mtime_ns)
+        return chunk_stats
+
+    def _get_entry_cls_name(self) -> str:
+        return f"{self._entry_cls.__module__}.{self._entry_cls.__qualname__}"
+
+    async def save_snapshot(self):
+        """Write a binary snapshot of the store
+
+        The store must be fully loaded (not lazy) without pending changes,
+        since the snapshot is bound to the chunk files on disk. Raises if the snapshot
+        cannot be written.
+        """
+        async with self.chunking_lock:
+            if self._lazy:
+                raise ValueError("cannot snapshot a lazy store")
+            if len(self._chunk_pending_save) > 0 or len(self._unallocated_chunk) > 0:
+                raise ValueError("cannot snapshot a store with pending changes")
+
+            entries = [
+                self._store[entry_id]
+                for chunk_idx in sorted(self._chunk2id)
+                for entry_id in self._chunk2id[chunk_idx]
+            ]
+            snapshot = StoreSnapshot(
+                version=SNAPSHOT_VERSION,
+                entry_cls=self._get_entry_cls_name(),
+                chunk_stats=await self._get_chunk_stats(),
+                chunk2id=self._chunk2id,
+                entries=pickle.dumps(entries, protocol=pickle.HIGHEST_PROTOCOL),
+            )
+            await atomic_write_bytes(
+                self._get_snapshot_path(),
+                pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL),
+            )
+
+    async def load_snapshot(self) -> bool:
+        """Load the store from its binary snapshot, instead of `load_chunks`
+
+        Returns:
+            bool: the snapshot is loaded, False if the snapshot is missing or stale
+        """
+        if self._lazy:
+            return False
+
+        async with self.chunking_lock:
+            snapshot_path = self._get_snapshot_path()
+            if not await aiofiles.os.path.exists(snapshot_path):
+                return False
+            async with aiofiles.open(snapshot_path, mode="rb") as file:
+                snapshot = pickle.loads(await file.read())
+
+            if (
+                not isinstance(snapshot, StoreSnapshot)
+                or snapshot.version != SNAPSHOT_VERSION
+                or snapshot.entry_cls != self._get_entry_cls_name()
+                or snapshot.chunk_stats != await self._get_chunk_stats()
+            ):
+                return False
+
+            entries: List[I] = pickle.loads(snapshot.entries)
+            entry_iter = iter(entries)
+            for chunk_idx in sorted(snapshot.chunk2id):
+                chunk2id = snapshot.chunk2id[chunk_idx]
+                for entry_id in chunk2id:
+                    self._store[entry_id] = next(entry_iter)
+                self._loaded_chunks[chunk_idx] = None
+                self._set_chunk_metadata(chunk_idx, chunk2id)
+            if len(snapshot.chunk2id) > 0:
+                self._last_chunk_idx = max(snapshot.chunk2id)
+            return True
+
+    async def _parse_chunks_in_executor(
+        self, executor: Executor, chunk_idx_s: List[int]
+    ):
+        loop = asyncio.get_running_loop()
+        chunks_entries = await asyncio.gather(
+            *(
+                loop.run_in_executor(
+                    executor,
+                    _parse_chunk_file,
+                    self._entry_cls,
+                    self._get_chunk_path(chunk_idx),
+                )
+                for chunk_idx in chunk_idx_s
+            )
+        )
+
+        # merge in chunk order
+        for chunk_idx, chunk_entries in zip(chunk_idx_s, chunks_entries):
+            chunk2id: List[str] = []
+            for entry in chunk_entries:
+                entry_id = entry.get_id()
+                self._store[entry_id] = entry
+                chunk2id.append(entry_id)
+            self._loaded_chunks[chunk_idx] = None
+            self._set_chunk_metadata(chunk_idx, chunk2id)
+
+    async def _read_chunk_lines(self, chunk_idx: int) -> List[str]:
+        async with aiofiles.open(self._get_chunk_path(chunk_idx), mode="r") as file:
+            lines = await file.readlines()
+        return [line for line in lines if line.strip()]
+
+    def _get_chunk_path(self, chunk_idx: int) -> Path:
+        return self._chunk_dir / Store.get_chunk_filename(chunk_idx)
+
+    def _get_chunk_index_path(self, chunk_idx: int) -> Path:
+        return self._chunk_dir / Store.get_chunk_index_filename(chunk_idx)
+
+    async def _load_chunk_index(self, chunk_idx: int) -> ChunkIndex:
+        """load the chunk's byte-offset index, the index is rebuilt if it is missing or stale"""
+        chunk_stat = await aiofiles.os.stat(self._get_chunk_path(chunk_idx))
+        index_path = self._get_chunk_index_path(chunk_idx)
+
+        chunk_index: Optional[ChunkIndex] = None
+        if await aiofiles.os.path.exists(index_path):
+            async with aiofiles.open(index_path, mode="r") as file:
+                try:
+                    chunk_index = ChunkIndex.model_validate_json(await file.read())
+                except ValidationError:
+                    chunk_index = None
+        if (
+            chunk_index is None
+            or chunk_index.size != chunk_stat.st_size
+            or chunk_index.mtime_ns != chunk_stat.st_mtime_ns
+        ):
+            chunk_index = await self._rebuild_chunk_index(chunk_idx)
+
+        self._chunk_index[chunk_idx] = chunk_index
+        return chunk_index
+
+    async def _rebuild_chunk_index(self, chunk_idx: int) -> ChunkIndex:
+        """scan the chunk file for entry ids and offsets, without validating its entries"""
+        chunk_path = self._get_chunk_path(chunk_idx)
+        chunk_stat = await aiofiles.os.stat(chunk_path)
+        async with aiofiles.open(chunk_path, mode="rb") as file:
+            content = await file.read()
+
+        lines = content.split(b"\n")
+        entry_ids = [
+            self._entry_cls.get_id_from_raw(json.loads(line)) if line.strip() else ""
+            for line in lines
+        ]
+        chunk_index = ChunkIndex.from_lines(
+            lines, entry_ids, chunk_stat.st_size, chunk_stat.st_mtime_ns
+        )
+        # skip blank lines
+        chunk_index.entries = [entry for entry in chunk_index.entries if entry[0]]
+        await self._write_chunk_index(chunk_idx, chunk_index)
+        return chunk_index
+
+    async def _write_chunk_index(self, chunk_idx: int, chunk_index: ChunkIndex):
+        await safe_write_file(
+            self._get_chunk_index_path(chunk_idx), chunk_index.model_dump_json()
+        )
+
+    async def _read_indexed_entries(
+        self, chunk_idx: int, entry_begin: int, entry_end: int
+    ) -> Optional[List[I]]:
+        """Read entries [entry_begin, entry_end) of a chunk through its byte-offset index,
+        without loading the chunk
+
+        Returns:
+            Optional[List[I]]: entries, None if the chunk has no usable index
+        """
+        chunk_index = self._chunk_index.get(chunk_idx)
+        if chunk_index is None or chunk_idx in self._chunk_pending_save:
+            return None
+
+        index_entries = chunk_index.entries[entry_begin:entry_end]
+        if len(index_entries) != entry_end - entry_begin:
+            # the index does not cover the entries, fallback to loading the chunk
+            del self._chunk_index[chunk_idx]
+            return None
+        read_begin = index_entries[0][1]
+        read_end = index_entries[-1][1] + index_entries[-1][2]
+        async with aiofiles.open(self._get_chunk_path(chunk_idx), mode="rb") as file:
+            await file.seek(read_begin)
+            content = await file.read(read_end - read_begin)
+
+        entries: List[I] = []
+        for entry_id, offset, length, crc32 in index_entries:
+            line = content[offset - read_begin : offset - read_begin + length]
+            if zlib.crc32(line) != crc32:
+                # the index does not match the chunk file, fallback to loading the chunk
+                del self._chunk_index[chunk_idx]
+                return None
+            entry = self._entry_cls.model_validate_json(line)
+            if entry.get_id() != entry_id:
+                del self._chunk_index[chunk_idx]
+                return None
+            entries.append(entry)
+        return entries
 
-                    # store entry
-                    self._store[entry_id] = entry
+    async def _read_chunk(self, chunk_idx: int) -> List[str]:
+        """parse entries of a chunk into `_store`
 
-                    # collect chunk-entry metadata
-                    self._id2chunk[entry_id] = chunk_idx
-                    chunk2id.append(entry_id)
+        Returns:
+            List[str]: entry ids of the chunk in order
+        """
+        chunk2id: List[str] = []
+        for line in await self._read_chunk_lines(chunk_idx):
+            entry = self._entry_cls.model_validate_json(line)
+            entry_id = entry.get_id()
+
+            # store entry
+            self._store[entry_id] = entry
+            chunk2id.append(entry_id)
+
+        self._loaded_chunks[chunk_idx] = None
+        return chunk2id
+
+    def _set_chunk_metadata(self, chunk_idx: int, chunk2id: List[str]):
+        # collect chunk-entry metadata
+        for entry_id in chunk2id:
+            self._id2chunk[entry_id] = chunk_idx
+        self._chunk2id[chunk_idx] = chunk2id
+
+        # if chunk have remaining capacity
+        if (
+            len(chunk2id) < self._chunk_size
+            and chunk_idx not in self._chunk_with_capacity
+        ):
+            # keep track of chunk with remaining capacity for future insert
+            self._chunk_with_capacity.append(chunk_idx)
+
+    async def _unsafe_touch_chunk(self, chunk_idx: int):
+        """Make sure the chunk is parsed into `_store` and mark it as most recently used
+
+        Direct calls to this method without `async with self.chunking_lock` is NOT concurrent-safe.
+        """
+        if chunk_idx in self._loaded_chunks:
+            self._loaded_chunks.move_to_end(chunk_idx)
+            return
 
-                self._chunk2id[chunk_idx] = chunk2id
+        await self._read_chunk(chunk_idx)
+        await self._unsafe_evict_cold_chunks()
 
-                # if chunk have remaining capacity
-                if len(chunk2id) < self._chunk_size:
-                    # keep track of chunk with remaining capacity for future insert
-                    self._chunk_with_capacity.append(chunk_idx)
+    async def _unsafe_evict_cold_chunks(self):
+        if not self._lazy or self._max_loaded_chunks is None:
+            return
+        while len(self._loaded_chunks) > self._max_loaded_chunks:
+            # least recently used chunk
+            chunk_idx = next(iter(self._loaded_chunks))
+            await self.unsafe_unload_chunk(chunk_idx)
 
     async def unload_chunk(
         self,
@@ -149,44 +518,132 @@ class Store(Generic[I]):
         save: bool = True,
     ):
         async with self.chunking_lock:
-            if save and chunk_idx in self._chunk_pending_save:
-                await self.unsafe_save_chunk(chunk_idx)
+            await self.unsafe_unload_chunk(chunk_idx, save)
+
+    async def unsafe_unload_chunk(
+        self,
+        chunk_idx: int,
+        save: bool = True,
+    ):
+        """Remove entries of a chunk from memory, chunk metadata is kept so the chunk can be loaded again
+
+        Direct calls to this method without `async with self.chunking_lock` is NOT concurrent-safe.
+        Async caller should call `unload_chunk` instead.
+
+        Args:
+            chunk_idx (int): chunk to unload
+            save (bool, optional): save pending changes of the chunk before unloading. Defaults to True.
+        """
+        if chunk_idx not in self._loaded_chunks:
+            return
 
-            for entry_id in self._chunk2id[chunk_idx]:
-                del self._store[entry_id]
-            del self._chunk2id[chunk_idx]
+        if chunk_idx in self._chunk_pending_save:
+            if save:
+                await self.unsafe_save_chunk(chunk_idx)
+            self._chunk_pending_save.remove(chunk_idx)
 
-            if chunk_idx in self._chunk_with_capacity:
-                self._chunk_with_capacity.remove(chunk_idx)
+        for entry_id in self._chunk2id[chunk_idx]:
+            self._store.pop(entry_id, None)
+        del self._loaded_chunks[chunk_idx]
 
     async def set(self, entry: I, replace_if_exist: bool = False):
         """concurrent-safe setting entry"""
         async with self.chunking_lock:
+            entry_id = entry.get_id()
+            chunk_idx = self._id2chunk.get(entry_id)
+            if chunk_idx is None and len(self._chunk_with_capacity) > 0:
+                # new entry will be allocated to the first chunk with capacity
+                chunk_idx = self._chunk_with_capacity[0]
+            if chunk_idx is not None:
+                await self._unsafe_touch_chunk(chunk_idx)
             self.unsafe_set(entry, replace_if_exist)
 
-    def get(self, entry_id: str) -> Optional[I]:
-        entry = self._store.get(entry_id)
+    async def get(self, entry_id: str) -> Optional[I]:
+        """get a (deep) copy of the entry, which can be modified freely"""
+        entry = await self.get_view(entry_id)
         if entry is None:
             return None
         return entry.model_copy(deep=True)
 
+    async def get_view(self, entry_id: str) -> Optional[I]:
+        """Get the entry without copying
+
+        The returned entry is shared with the store and MUST NOT be modified,
+        use `update` for modifying the entry.
+        """
+        entry = self._store.get(entry_id)
+        chunk_idx = self._id2chunk.get(entry_id)
+        if entry is None:
+            if chunk_idx is None:
+                return None
+            async with self.chunking_lock:
+                if chunk_idx not in self._loaded_chunks:
+                    entry_idx = self._chunk2id[chunk_idx].index(entry_id)
+                    entries = await self._read_indexed_entries(
+                        chunk_idx, entry_idx, entry_idx + 1
+                    )
+                    if entries is not None:
+                        return entries[0]
+                await self._unsafe_touch_chunk(chunk_idx)
+                entry = self._store[entry_id]
+        elif chunk_idx in self._loaded_chunks:
+            self._loaded_chunks.move_to_end(chunk_idx)
+        return entry
+
+    async def update(
+        self, entry_id: str, get_update: Callable[[I], Dict[str, Any]]
+    ) -> I:
+        """Copy-on-write update of an existing entry
+
+        Args:
+            entry_id (str): id of the entry to update
+            get_update (Callable[[I], Dict[str, Any]]): called with the current entry (which must not be modified),
+                returns the fields to replace. Fields which are not replaced are shared with the current entry.
+
+        Raises:
+            KeyError: entry does not exist
+
+        Returns:
+            I: the updated entry
+        """
+        async with self.chunking_lock:
+            chunk_idx = self._id2chunk.get(entry_id)
+            if chunk_idx is not None:
+                await self._unsafe_touch_chunk(chunk_idx)
+            entry = self._store.get(entry_id)
+            if entry is None:
+                raise KeyError(f"instance with id: {entry_id} does not exist")
+
+            update = get_update(entry)
+            entry = entry.model_copy(update=update)
+            self.unsafe_set(entry, replace_if_exist=True, fields=update.keys())
+            return entry
+
     def __contains__(self, key: str):
-        return key in self._store
+        return key in self._id2chunk or key in self._store
 
-    def unsafe_set(self, entry: I, replace_if_exist: bool = False):
+    def unsafe_set(
+        self,
+        entry: I,
+        replace_if_exist: bool = False,
+        fields: Optional[Collection[str]] = None,
+    ):
         """Perform unsafe key-value set to Store. Since set touches the chunking information
 
         Direct calls to this method without `async with self.chunking_lock` is NOT concurrent-safe. Async caller should call `set` instead.
+        In lazy mode, the chunk of the entry (or the first chunk with capacity for a new entry) must be loaded.
 
         Args:
             entry (I): entry to be set (add/update) into the
             replace_if_exist (bool, optional): make setting operation an update if already exists. Defaults to False.
+            fields (Optional[Collection[str]], optional): fields changed from the existing entry, passed to the set listeners. Defaults to None (any field may have changed).
 
         Raises:
             ValueError: entry with the same id already exists
         """
         entry_id = entry.get_id()
-        if not replace_if_exist and entry_id in self._store:
+        created = entry_id not in self
+        if not replace_if_exist and not created:
             raise ValueError(f"instance with id: {entry_id} already exist")
 
         self._store[entry_id] = entry
@@ -199,6 +656,7 @@ class Store(Generic[I]):
                 chunk_idx = self._chunk_with_capacity[0]
                 chunk2id = self._chunk2id[chunk_idx]
                 chunk2id.append(entry_id)
+                self._id2chunk[entry_id] = chunk_idx
                 if len(chunk2id) >= self._chunk_size:
                     self._chunk_with_capacity.remove(chunk_idx)
 
@@ -210,10 +668,35 @@ class Store(Generic[I]):
             if chunk_idx not in self._chunk_pending_save:
                 self._chunk_pending_save.append(chunk_idx)
 
+        for listener in self._set_listeners:
+            listener(entry_id, created, fields)
+
+    def add_set_listener(
+        self, listener: Callable[[str, bool, Optional[Collection[str]]], None]
+    ):
+        """Add a listener which is called with (entry id, entry is created, changed fields
+        or None if unknown) whenever an entry is set"""
+        self._set_listeners.append(listener)
+
+    def get_position(self, entry_id: str) -> Optional[int]:
+        """Position of the entry, as used by `get_entries`
+
+        Returns:
+            Optional[int]: position, None if the entry does not exist or is not allocated to a chunk yet
+        """
+        chunk_idx = self._id2chunk.get(entry_id)
+        if chunk_idx is None:
+            return None
+        return chunk_idx * self._chunk_size + self._chunk2id[chunk_idx].index(entry_id)
+
     @staticmethod
     def get_chunk_filename(chunk_idx: int):
         return f"chunk_{chunk_idx:04d}.jsonl"
 
+    @staticmethod
+    def get_chunk_index_filename(chunk_idx: int):
+        return f"chunk_{chunk_idx:04d}.idx"
+
     @staticmethod
     def get_chunk_idx_from_filename(chunk_filename: str) -> Optional[int]:
         """
@@ -231,13 +714,25 @@ class Store(Generic[I]):
         else:
             return None  # Return None if no match is found
 
-    async def save(self):
+    async def save(self, durable: bool = False):
+        """Save pending changes to chunk files
+
+        Args:
+            durable (bool, optional): raise if a chunk cannot be written, and fsync chunks, so changes are on disk once it returns (e.g. before truncating a WAL). Defaults to False.
+        """
         async with self.chunking_lock:
             # update existing chunks with pending changes
             chunks_saving = self._chunk_pending_save
             self._chunk_pending_save = []
-            for chunk_idx in chunks_saving:
-                await self.unsafe_save_chunk(chunk_idx)
+            for idx, chunk_idx in enumerate(chunks_saving):
+                try:
+                    await self.unsafe_save_chunk(chunk_idx, durable)
+                except Exception:
+                    # keep unsaved chunks pending for the next save
+                    for unsaved_idx in chunks_saving[idx:]:
+                        if unsaved_idx not in self._chunk_pending_save:
+                            self._chunk_pending_save.append(unsaved_idx)
+                    raise
 
             # create new chunks for unallocated data
             while len(self._unallocated_chunk) > 0:
@@ -253,12 +748,21 @@ class Store(Generic[I]):
                         except FileExistsError:
                             continue
                         break
-                self._chunk2id[chunk_idx] = id_to_save
-                await self.unsafe_save_chunk(chunk_idx)
-
-    async def unsafe_save_chunk(self, chunk_idx: int):
+                self._set_chunk_metadata(chunk_idx, id_to_save)
+                self._loaded_chunks[chunk_idx] = None
+                try:
+                    await self.unsafe_save_chunk(chunk_idx, durable)
+                except Exception:
+                    # the chunk is allocated, save it with the next save
+                    self._chunk_pending_save.append(chunk_idx)
+                    raise
+
+            await self._unsafe_evict_cold_chunks()
+
+    async def unsafe_save_chunk(self, chunk_idx: int, durable: bool = False):
         lines: List[str] = []
-        for entry_id in self._chunk2id[chunk_idx]:
+        entry_ids = self._chunk2id[chunk_idx]
+        for entry_id in entry_ids:
             entry = self._store[entry_id]
             lines.append(
                 json.dumps(
@@ -266,5 +770,30 @@ class Store(Generic[I]):
                     ensure_ascii=False,
                 )
             )
-        chunk_path = self._chunk_dir / self.get_chunk_filename(chunk_idx)
-        await safe_write_file(chunk_path, "\n".join(lines))
+        chunk_path = self._get_chunk_path(chunk_idx)
+        if durable:
+            await durable_write_file(chunk_path, "\n".join(lines))
+        else:
+            await safe_write_file(chunk_path, "\n".join(lines))
+
+        # write byte-offset index of the chunk
+        chunk_stat = await aiofiles.os.stat(chunk_path)
+        chunk_index = ChunkIndex.from_lines(
+            [line.encode() for line in lines],
+            entry_ids,
+            chunk_stat.st_size,
+            chunk_stat.st_mtime_ns,
+        )
+        await self._write_chunk_index(chunk_idx, chunk_index)
+        if self._lazy:
+            self._chunk_index[chunk_idx] = chunk_index
+
+
+def _parse_chunk_file(entry_cls: Type[I], chunk_path: Path) -> List[I]:
+    """parse entries of a chunk file, to be run in an executor (e.g. a worker process)"""
+    with open(chunk_path, mode="r") as file:
+        return [
+            entry_cls.model_validate_json(line)
+            for line in file.readlines()
+            if line.strip()
+        ]
@@ -0,0 +1,95 @@
+import asyncio
+
+from .save_scheduler import SaveScheduler
+
+
+def test_save_scheduler_coalesce():
+    async def _check():
+        n_flush = 0
+
+        async def flush():
+            nonlocal n_flush
+            n_flush += 1
+
+        scheduler = SaveScheduler(flush, window_s=0.01, max_pending=100)
+        futures = [scheduler.schedule() for _ in range(10)]
+        await asyncio.gather(*futures)
+
+        assert n_flush == 1
+        assert scheduler.stats.flushes == 1
+        assert scheduler.stats.coalesced_writes == 9
+        assert len(scheduler) == 0
+
+    asyncio.run(_check())
+
+
+def test_save_scheduler_max_pending():
+    async def _check():
+        n_flush = 0
+
+        async def flush():
+            nonlocal n_flush
+            n_flush += 1
+
+        # window is long, flush must be triggered by pending changes
+        scheduler = SaveScheduler(flush, window_s=60, max_pending=3)
+        futures = [scheduler.schedule() for _ in range(3)]
+        await asyncio.wait_for(asyncio.gather(*futures), timeout=1)
+        assert n_flush == 1
+
+        future = scheduler.schedule()
+        await scheduler.flush()
+        assert future.done()
+        assert n_flush == 2
+
+    asyncio.run(_check())
+
+
+def test_save_scheduler_flush_error():
+    async def _check():
+        async def flush():
+            raise OSError("disk full")
+
+        scheduler = SaveScheduler(flush, window_s=0.01)
+        future = scheduler.schedule()
+        try:
+            await future
+            assert False, "flush error must be propagated"
+        except OSError:
+            pass
+        assert scheduler.stats.flushes == 0
+
+    asyncio.run(_check())
+
+
+def test_save_scheduler_flush_waits_running_flush():
+    async def _check():
+        started = asyncio.Event()
+        release = asyncio.Event()
+        n_calls = 0
+        n_done = 0
+
+        async def flush():
+            nonlocal n_calls, n_done
+            n_calls += 1
+            if n_calls == 1:
+                # only the first flush is slow
+                started.set()
+                await release.wait()
+            n_done += 1
+
+        scheduler = SaveScheduler(flush, window_s=0.01)
+        future = scheduler.schedule()
+        await started.wait()
+
+        # the window has ended and the first flush is running
+        flush_task = asyncio.create_task(scheduler.flush())
+        await asyncio.sleep(0.01)
+        assert not flush_task.done()
+
+        release.set()
+        await flush_task
+        assert future.done()
+        assert n_done == 2
+
+    asyncio.run(_check())
@@ -0,0 +1,260 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, List
+
+import pytest
+
+from . import store as store_module
+from .store import Store, WithId
+
+
+class Entry(WithId):
+    id: str
+    value: int
+
+    def get_id(self) -> str:
+        return self.id
+
+
+def write_store(chunk_dir: Path, n_entries: int, chunk_size: int):
+    async def _write():
+        store = Store(Entry, chunk_dir, chunk_size=chunk_size)
+        for i in range(n_entries):
+            await store.set(Entry(id=f"e{i}", value=i))
+        await store.save()
+
+    asyncio.run(_write())
+
+
+def test_store_save_load(tmp_path: Path):
+    write_store(tmp_path, 10, chunk_size=4)
+
+    async def _check():
+        store = Store(Entry, tmp_path, chunk_size=4)
+        await store.load_chunks()
+
+        assert len(store) == 10
+        entries = await store.get_entries(0, len(store))
+        assert [entry.value for entry in entries] == list(range(10))
+        entry = await store.get("e5")
+        assert entry is not None and entry.value == 5
+        assert await store.get("missing") is None
+
+    asyncio.run(_check())
+
+
+def test_store_lazy_load(tmp_path: Path):
+    write_store(tmp_path, 10, chunk_size=4)
+
+    async def _check():
+        store = Store(Entry, tmp_path, chunk_size=4, lazy=True, max_loaded_chunks=1)
+        await store.load_chunks()
+
+        # only metadata is loaded
+        assert len(store) == 10
+        assert "e9" in store
+        assert len(store._store) == 0
+
+        entry = await store.get("e9")
+        assert entry is not None and entry.value == 9
+
+        # updating entries loads their chunks
+        await store.set(Entry(id="e9", value=9), replace_if_exist=True)
+        assert list(store._loaded_chunks) == [2]
+        await store.set(Entry(id="e5", value=5), replace_if_exist=True)
+        # chunk budget is respected
+        assert list(store._loaded_chunks) == [1]
+
+        entries = await store.get_entries(2, 6)
+        assert [entry.value for entry in entries] == [2, 3, 4, 5]
+
+    asyncio.run(_check())
+
+
+def test_store_lazy_evict_dirty_chunk(tmp_path: Path):
+    write_store(tmp_path, 10, chunk_size=4)
+
+    async def _check():
+        store = Store(Entry, tmp_path, chunk_size=4, lazy=True, max_loaded_chunks=1)
+        await store.load_chunks()
+
+        await store.set(Entry(id="e1", value=100), replace_if_exist=True)
+        # new entry is allocated to the chunk with capacity
+        await store.set(Entry(id="e10", value=10))
+        # touching another chunk evicts (and saves) the updated chunks
+        assert await store.get("e5") is not None
+        assert 0 not in store._loaded_chunks
+        await store.save()
+
+        store = Store(Entry, tmp_path, chunk_size=4)
+        await store.load_chunks()
+        assert len(store) == 11
+        entry = await store.get("e1")
+        assert entry is not None and entry.value == 100
+        entry = await store.get("e10")
+        assert entry is not None and entry.value == 10
+
+    asyncio.run(_check())
+
+
+def test_store_chunk_index(tmp_path: Path):
+    write_store(tmp_path, 10, chunk_size=4)
+    assert (tmp_path / Store.get_chunk_index_filename(0)).exists()
+
+    async def _check():
+        store = Store(Entry, tmp_path, chunk_size=4, lazy=True)
+        await store.load_chunks()
+
+        # entries are read through the index, without loading chunks
+        entry = await store.get("e6")
+        assert entry is not None and entry.value == 6
+        entries = await store.get_entries(3, 9)
+        assert [entry.value for entry in entries] == [3, 4, 5, 6, 7, 8]
+        assert len(store._loaded_chunks) == 0
+
+    asyncio.run(_check())
+
+
+def test_store_stale_chunk_index(tmp_path: Path):
+    write_store(tmp_path, 10, chunk_size=4)
+
+    # modify chunk without updating its index
+    chunk_path = tmp_path / Store.get_chunk_filename(1)
+    lines = chunk_path.read_text().split("\n")
+    lines[0] = Entry(id="e4", value=400).model_dump_json()
+    chunk_path.write_text("\n".join(lines))
+
+    async def _check():
+        store = Store(Entry, tmp_path, chunk_size=4, lazy=True)
+        await store.load_chunks()
+
+        entries = await store.get_entries(4, 6)
+        assert [entry.value for entry in entries] == [400, 5]
+
+    asyncio.run(_check())
+
+
+def test_store_short_chunk_index(tmp_path: Path):
+    write_store(tmp_path, 10, chunk_size=4)
+
+    async def _check():
+        store = Store(Entry, tmp_path, chunk_size=4, lazy=True)
+        await store.load_chunks()
+        # index in memory disagrees with the chunk's entries
+        store._chunk_index[1].entries = store._chunk_index[1].entries[:2]
+
+        entry = await store.get_view("e7")
+        assert entry is not None and entry.value == 7
+        entries = await store.get_entries(4, 8)
+        assert [entry.value for entry in entries] == [4, 5, 6, 7]
+
+    asyncio.run(_check())
+
+
+def test_store_parallel_load(tmp_path: Path):
+    write_store(tmp_path, 10, chunk_size=4)
+
+    async def _check():
+        store = Store(Entry, tmp_path, chunk_size=4)
+        with ProcessPoolExecutor(2) as executor:
+            await store.load_chunks(executor=executor)
+
+        assert len(store) == 10
+        assert store._chunk2id == {
+            0: ["e0", "e1", "e2", "e3"],
+            1: ["e4", "e5", "e6", "e7"],
+            2: ["e8", "e9"],
+        }
+        assert store._chunk_with_capacity == [2]
+        entries = await store.get_entries(0, len(store))
+        assert [entry.value for entry in entries] == list(range(10))
+
+    asyncio.run(_check())
+
+
+def test_store_snapshot(tmp_path: Path):
+    write_store(tmp_path, 10, chunk_size=4)
+
+    async def _check():
+        store = Store(Entry, tmp_path, chunk_size=4)
+        assert not await store.load_snapshot()
+        await store.load_chunks()
+        await store.save_snapshot()
+
+        store = Store(Entry, tmp_path, chunk_size=4)
+        assert await store.load_snapshot()
+        assert len(store) == 10
+        assert store._chunk_with_capacity == [2]
+        entries = await store.get_entries(0, len(store))
+        assert [entry.value for entry in entries] == list(range(10))
+
+        # snapshot is stale once a chunk changes
+        await store.set(Entry(id="e10", value=10))
+        await store.save()
+        store = Store(Entry, tmp_path, chunk_size=4)
+        assert not await store.load_snapshot()
+
+    asyncio.run(_check())
+
+
+def test_store_view_and_update(tmp_path: Path):
+    write_store(tmp_path, 10, chunk_size=4)
+
+    async def _check():
+        store = Store(Entry, tmp_path, chunk_size=4)
+        await store.load_chunks()
+
+        view = await store.get_view("e3")
+        assert view is not None
+        # views are not copied
+        assert view is await store.get_view("e3")
+        assert view is not await store.get("e3")
+
+        changes: List[Any] = []
+        store.add_set_listener(lambda *change: changes.append(change))
+        updated = await store.update("e3", lambda entry: {"value": entry.value + 1})
+        assert updated.value == 4
+        # listeners are told the changed fields
+        assert [(id, created, list(fields)) for id, created, fields in changes] == [
+            ("e3", False, ["value"])
+        ]
+        # copy-on-write, previous view is unchanged
+        assert view.value == 3
+        assert await store.get_view("e3") is updated
+
+        await store.save()
+        store = Store(Entry, tmp_path, chunk_size=4)
+        await store.load_chunks()
+        entry = await store.get_view("e3")
+        assert entry is not None and entry.value == 4
+
+    asyncio.run(_check())
+
+
+def test_store_durable_save_failure(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    write_store(tmp_path, 10, chunk_size=4)
+
+    async def _fail_write(path: Path, content: str):
+        raise OSError("disk full")
+
+    async def _check():
+        store = Store(Entry, tmp_path, chunk_size=4)
+        await store.load_chunks()
+        await store.set(Entry(id="e1", value=100), replace_if_exist=True)
+        await store.set(Entry(id="e10", value=10))
+
+        with monkeypatch.context() as patch:
+            patch.setattr(store_module, "durable_write_file", _fail_write)
+            with pytest.raises(OSError):
+                await store.save(durable=True)
+
+        # changes are kept pending, and saved by the next save
+        await store.save(durable=True)
+        store = Store(Entry, tmp_path, chunk_size=4)
+        await store.load_chunks()
+        entry = await store.get("e1")
+        assert entry is not None and entry.value == 100
+        assert await store.get("e10") is not None
+
+    asyncio.run(_check())
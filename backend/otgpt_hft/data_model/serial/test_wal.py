@@ -0,0 +1,80 @@
+import asyncio
+from pathlib import Path
+
+from pydantic import BaseModel
+
+from .wal import WriteAheadLog
+
+
+class Record(BaseModel):
+    id: str
+    value: int
+
+
+def test_wal_append_read_truncate(tmp_path: Path):
+    async def _check():
+        path = tmp_path / "test.wal"
+        wal = WriteAheadLog(Record, path)
+        assert await wal.read() == []
+
+        await wal.append([Record(id="a", value=1)])
+        await wal.append([Record(id="b", value=2), Record(id="c", value=3)])
+        assert len(wal) == 3
+
+        wal = WriteAheadLog(Record, path)
+        records = await wal.read()
+        assert [record.id for record in records] == ["a", "b", "c"]
+        assert len(wal) == 3
+
+        await wal.truncate()
+        assert len(wal) == 0
+        assert await wal.read() == []
+
+    asyncio.run(_check())
+
+
+def test_wal_line_breaks_in_record(tmp_path: Path):
+    async def _check():
+        path = tmp_path / "test.wal"
+        wal = WriteAheadLog(Record, path)
+        ids = ["a\u2028b", "c\u2029d", "e\x85f", "g\x1ch", "i\rj"]
+        await wal.append([Record(id=id, value=0) for id in ids])
+
+        wal = WriteAheadLog(Record, path)
+        assert [record.id for record in await wal.read()] == ids
+
+    asyncio.run(_check())
+
+
+def test_wal_skip_incomplete_record(tmp_path: Path):
+    async def _check():
+        path = tmp_path / "test.wal"
+        wal = WriteAheadLog(Record, path)
+        await wal.append([Record(id="a", value=1)])
+        # simulate a crash in the middle of an append
+        with open(path, "a") as file:
+            file.write('{"id": "b", "val')
+
+        records = await wal.read()
+        assert [record.id for record in records] == ["a"]
+
+    asyncio.run(_check())
+
+
+def test_wal_append_after_incomplete_record(tmp_path: Path):
+    async def _check():
+        path = tmp_path / "test.wal"
+        # the only record was cut by a crash
+        with open(path, "w") as file:
+            file.write('{"id": "a", "val')
+
+        wal = WriteAheadLog(Record, path)
+        assert await wal.read() == []
+        await wal.append([Record(id="b", value=2)])
+
+        # restart
+        wal = WriteAheadLog(Record, path)
+        records = await wal.read()
+        assert [record.id for record in records] == ["b"]
+
+    asyncio.run(_check())
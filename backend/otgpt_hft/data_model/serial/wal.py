@@ -0,0 +1,96 @@
+"""Append-only write-ahead log"""
+
+import asyncio
+import logging
+import os
+from pathlib import Path
+from typing import Generic, List, Sequence, Type, TypeVar
+
+import aiofiles
+import aiofiles.os
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+R = TypeVar("R", bound=BaseModel)
+
+_fsync = aiofiles.os.wrap(os.fsync)
+
+
+class WriteAheadLog(Generic[R]):
+    """Append-only JSONL log of records
+
+    Records are durable once `append` returns (when `fsync` is enabled).
+    The log is meant to be folded into a `Store` by a checkpoint, followed by `truncate`.
+    """
+
+    def __init__(self, record_cls: Type[R], path: Path, fsync: bool = True):
+        self._record_cls = record_cls
+        self._path = path
+        self._fsync = fsync
+        # number of records in the log
+        self._n_records = 0
+        # lock for appending/truncating the log file
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return self._n_records
+
+    async def append(self, records: Sequence[R]):
+        """Append records to the log, all records are flushed (and fsynced) at once
+
+        Args:
+            records (Sequence[R]): records to append
+        """
+        if len(records) == 0:
+            return
+        content = "".join(record.model_dump_json() + "\n" for record in records)
+        async with self._lock:
+            async with aiofiles.open(self._path, mode="a") as file:
+                await file.write(content)
+                await file.flush()
+                if self._fsync:
+                    await _fsync(file.fileno())
+            self._n_records += len(records)
+
+    async def read(self) -> List[R]:
+        """Read all records in the log
+
+        An incomplete trailing record (e.g. from a crash during `append`) is cut from the
+        log file, so later appends start on a new line.
+        """
+        if not await aiofiles.os.path.exists(self._path):
+            self._n_records = 0
+            return []
+
+        async with aiofiles.open(self._path, mode="rb") as file:
+            content = await file.read()
+
+        complete_size = content.rfind(b"\n") + 1
+        if complete_size < len(content):
+            logger.warning({"msg": "cut incomplete WAL record", "path": self._path})
+            async with self._lock:
+                async with aiofiles.open(self._path, mode="r+b") as file:
+                    await file.truncate(complete_size)
+                    await file.flush()
+                    if self._fsync:
+                        await _fsync(file.fileno())
+
+        records: List[R] = []
+        # records are split on "\n" only, as written by `append`: JSON strings may
+        # contain other line breaks (e.g. U+2028) unescaped
+        for line in content[:complete_size].split(b"\n"):
+            if not line.strip():
+                continue
+            records.append(self._record_cls.model_validate_json(line))
+        self._n_records = len(records)
+        return records
+
+    async def truncate(self):
+        """Remove all records from the log"""
+        async with self._lock:
+            async with aiofiles.open(self._path, mode="w") as file:
+                await file.flush()
+                if self._fsync:
+                    await _fsync(file.fileno())
+            self._n_records = 0
@@ -1,8 +1,107 @@
+import os
+from typing import Collection, cast, get_args
 from pathlib import Path
-from otgpt_hft.api.data_bridge import DataBridge
+from otgpt_hft.api.data_bridge import (
+    DEFAULT_ANNO_SPLIT,
+    DEFAULT_GRAPH_CACHE_SIZE,
+    DEFAULT_PARKED_CHANNELS,
+    DataBridge,
+)
+from otgpt_hft.data_model.dialogue.node import DialogueNodeCmp, NodeCmpFactory
+from otgpt_hft.data_model.dialogue.node_bitset import BitsetDialogueNodeCmp
+from otgpt_hft.api.scheduler import DEFAULT_ANNO_LEASE_S, DEFAULT_ANNO_OVERLAP
+from otgpt_hft.tooling.ws.connection import DEFAULT_MAX_CONCURRENT_FETCH
+from otgpt_hft.tooling.pub_sub.sub_queue import (
+    DEFAULT_OVERFLOW_POLICY,
+    DEFAULT_SUB_QUEUE_SIZE,
+    OverflowPolicy,
+)
+from otgpt_hft.data_model.dialogue.pair_selection import PAIR_SELECTORS
 from otgpt_hft.database import Database
 
 DATA_STORE_PATH = Path("data/store")
 
-g_data_bridge = DataBridge()
+
+def _env_choice(name: str, default: str, choices: Collection[str]) -> str:
+    """environment variable which must be one of the choices"""
+    value = os.environ.get(name, default)
+    if value not in choices:
+        options = ", ".join(repr(choice) for choice in choices)
+        raise ValueError(f"{name} must be one of {options}, got {value!r}")
+    return value
+
+
+# store loading options
+# parse chunks on first access instead of at startup
+STORE_LAZY = os.environ.get("STORE_LAZY", "0") == "1"
+# maximum number of parsed chunks per split (lazy mode only)
+STORE_MAX_LOADED_CHUNKS = (
+    int(os.environ["STORE_MAX_LOADED_CHUNKS"])
+    if "STORE_MAX_LOADED_CHUNKS" in os.environ
+    else None
+)
+# number of worker processes for parsing chunks at startup
+STORE_PARSE_WORKERS = (
+    int(os.environ["STORE_PARSE_WORKERS"])
+    if "STORE_PARSE_WORKERS" in os.environ
+    else None
+)
+# load stores from binary snapshots, and write snapshots on shutdown
+STORE_SNAPSHOT = os.environ.get("STORE_SNAPSHOT", "0") == "1"
+
+# comparison data engine, "set" or "bitset"
+CMP_ENGINES: dict[str, NodeCmpFactory] = {
+    "set": DialogueNodeCmp,
+    "bitset": BitsetDialogueNodeCmp,
+}
+CMP_ENGINE = _env_choice("CMP_ENGINE", "set", CMP_ENGINES)
+# split annotated when no annotation reference is given
+ANNO_SPLIT = (
+    os.environ.get("ANNO_DATASET", DEFAULT_ANNO_SPLIT[0]),
+    os.environ.get("ANNO_SPLIT", DEFAULT_ANNO_SPLIT[1]),
+)
+# maximum number of dialogue graphs kept in memory
+GRAPH_CACHE_SIZE = int(os.environ.get("GRAPH_CACHE_SIZE", DEFAULT_GRAPH_CACHE_SIZE))
+# restore comparison data of dialogue graphs from states written at checkpoints
+CMP_SNAPSHOT = os.environ.get("CMP_SNAPSHOT", "1") == "1"
+# strategy picking the next pair shown to annotators, "random", "first" or "insertion"
+PAIR_SELECTOR = _env_choice("PAIR_SELECTOR", "random", PAIR_SELECTORS)
+# distinct annotators aimed for per annotation unit
+ANNO_OVERLAP = int(os.environ.get("ANNO_OVERLAP", DEFAULT_ANNO_OVERLAP))
+# seconds an annotator holds an assigned annotation unit
+ANNO_LEASE_S = float(os.environ.get("ANNO_LEASE_S", DEFAULT_ANNO_LEASE_S))
+# maximum number of fetch requests of a connection handled at once
+MAX_CONCURRENT_FETCH = int(
+    os.environ.get("MAX_CONCURRENT_FETCH", DEFAULT_MAX_CONCURRENT_FETCH)
+)
+# maximum number of channel messages queued per subscriber
+SUB_QUEUE_SIZE = int(os.environ.get("SUB_QUEUE_SIZE", DEFAULT_SUB_QUEUE_SIZE))
+# handling of channel messages published to a full subscriber queue,
+# "drop-oldest", "latest" or "disconnect"
+SUB_OVERFLOW_POLICY = cast(
+    OverflowPolicy,
+    _env_choice(
+        "SUB_OVERFLOW_POLICY", DEFAULT_OVERFLOW_POLICY, get_args(OverflowPolicy)
+    ),
+)
+# maximum number of entry channels without subscribers kept for resuming subscribers
+PARKED_CHANNELS = int(os.environ.get("PARKED_CHANNELS", DEFAULT_PARKED_CHANNELS))
+
+g_data_bridge = DataBridge(
+    store_lazy=STORE_LAZY,
+    store_max_loaded_chunks=STORE_MAX_LOADED_CHUNKS,
+    parse_workers=STORE_PARSE_WORKERS,
+    store_snapshot=STORE_SNAPSHOT,
+    cmp_factory=CMP_ENGINES[CMP_ENGINE],
+    anno_split=ANNO_SPLIT,
+    graph_cache_size=GRAPH_CACHE_SIZE,
+    cmp_snapshot=CMP_SNAPSHOT,
+    pair_selector=PAIR_SELECTORS[PAIR_SELECTOR],
+    anno_overlap=ANNO_OVERLAP,
+    anno_lease_s=ANNO_LEASE_S,
+    max_concurrent_fetch=MAX_CONCURRENT_FETCH,
+    sub_queue_size=SUB_QUEUE_SIZE,
+    sub_overflow_policy=SUB_OVERFLOW_POLICY,
+    parked_channels=PARKED_CHANNELS,
+)
 g_database = Database()
@@ -43,6 +43,10 @@ async def lifespan(app: FastAPI):
     g_data_bridge.set_loop(running_loop)
 
     yield
+    # fold pending annotations into the stores
+    await g_data_bridge.close()
+    logger.debug("data_bridge closed")
+
     # close database connection
     await g_database.close()
     logger.debug("database connection closed")
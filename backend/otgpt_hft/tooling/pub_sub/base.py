@@ -5,6 +5,7 @@ from typing import (
     Awaitable,
     Callable,
     Generic,
+    List,
     Literal,
     Optional,
     Tuple,
@@ -12,7 +13,8 @@ from typing import (
     Union,
 )
 
-from otgpt_hft.tooling.ws.connection import APayloadBM
+from otgpt_hft.tooling.ws.connection import APayloadBM, EncodedPayload
+from otgpt_hft.utils.json_patch import PatchOp
 
 from ..client_exc import ClientException
 
@@ -31,17 +33,51 @@ CH = TypeVar("CH", bound=ChannelName)
 class SubscriptionAReq(APayloadBM[Literal["sub", "unsub"]], Generic[CH]):
     type: Literal["sub", "unsub"]
     channel: CH
+    # version last received on the channel, to resume from on "sub"
+    version: Optional[int] = None
 
 
 class SubscriptionARes(APayloadBM[Literal["sub"]], Generic[CH]):
     type: Literal["sub"] = "sub"
     channel: CH
     data: Any
+    # sequence number of the message
+    version: Optional[int] = None
+
+
+class SubscriptionPatchARes(APayloadBM[Literal["patch"]], Generic[CH]):
+    """Patch turning the data of version `base` into version `version`"""
+
+    type: Literal["patch"] = "patch"
+    channel: CH
+    base: int
+    version: int
+    ops: List[PatchOp]
+
+
+class BatchSubscriptionAReq(APayloadBM[Literal["batch"]], Generic[CH]):
+    """Subscription requests applied at once"""
+
+    type: Literal["batch"] = "batch"
+    reqs: List[SubscriptionAReq[CH]]
+
+
+class BatchSubscriptionARes(APayloadBM[Literal["batch"]]):
+    """Messages sent in a single frame, e.g. initial messages of a batch subscription"""
+
+    type: Literal["batch"] = "batch"
+    msgs: List[Any]
+
+
+def encode_batch(frames: List[EncodedPayload]) -> EncodedPayload:
+    """encode messages as a `BatchSubscriptionARes`, without encoding them again"""
+    msgs = ",".join(frame.text for frame in frames)
+    return EncodedPayload(f'{{"p":"A","type":"batch","msgs":[{msgs}]}}')
 
 
 HookChannel = Tuple[Tuple[str, ...], Tuple[str, ...]]
 Message = Any
-Subscriber = Callable[[SubscriptionARes[Any]], Awaitable[None]]
+Subscriber = Callable[[SubscriptionARes[Any] | EncodedPayload], Awaitable[None]]
 
 
 class UnregisteredChannel(ClientException):
@@ -62,7 +98,9 @@ class PubSub(ABC):
     #     ...
 
     @abstractmethod
-    async def subscribe(self, ch: ChannelName, sub: Subscriber) -> None:
+    async def subscribe(
+        self, ch: ChannelName, sub: Subscriber, version: Optional[int] = None
+    ) -> None:
         """Add subscriber to channel
 
         Once subscribe, future message to the channel will be pass to the Subscriber.
@@ -70,6 +108,7 @@ class PubSub(ABC):
         Args:
             ch (Channel): channel
             sub (Subscriber): subscriber
+            version (Optional[int], optional): version last received by the subscriber, only missed messages are sent. Defaults to None.
         """
         ...
 
@@ -1,37 +1,181 @@
+import asyncio
+import itertools
+import json
 import logging
-from typing import Any, Callable, Generic, List, Optional, Type, TypeVar
-
-from .base import ChannelName, Message, Subscriber, SubscriptionARes
+import time
+from collections import deque
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Generic,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+)
+
+from pydantic_core import to_jsonable_python
+
+from ...utils.json_patch import make_patch
+from ..ws.connection import EncodedPayload
+from .base import (
+    ChannelName,
+    Message,
+    Subscriber,
+    SubscriptionARes,
+    SubscriptionPatchARes,
+)
 from .pub_sub_ex import PChannel
+from .sub_queue import (
+    DEFAULT_OVERFLOW_POLICY,
+    DEFAULT_SUB_QUEUE_SIZE,
+    ChannelStats,
+    OverflowPolicy,
+    SubscriberQueue,
+)
 
 logger = logging.getLogger(__name__)
 
 SAR = TypeVar("SAR", bound=SubscriptionARes[Any])
+SPR = TypeVar("SPR", bound=SubscriptionPatchARes[Any])
+
+# number of patches kept by a DeltaChannel for resuming subscribers
+DEFAULT_REPLAY_SIZE = 32
+
+# no message was published yet
+_UNSET: Any = object()
+
+# sequence numbers of channel messages, shared by all channels and starting from the current
+# time in microseconds, so a number is not reused by a recreated channel, or after a restart
+_seqs = itertools.count(time.time_ns() // 1000)
+
+
+def next_seq() -> int:
+    return next(_seqs)
+
+
+class EncodedMessage(EncodedPayload):
+    """Channel message encoded as JSON text, with its sequence number
+
+    A DeltaChannel also keeps the JSON-able message (`doc`) it encoded, so publishing a
+    cached frame diffs it without parsing the text again.
+    """
+
+    def __init__(self, text: str, version: int, doc: Any = _UNSET):
+        super().__init__(text)
+        self.version = version
+        self.doc = doc
 
 
 class Channel(PChannel, Generic[SAR]):
+    """Channel publishing full messages
+
+    Messages are stamped with a sequence number (`version`). A subscriber resuming with the
+    version of the message it last received gets the current message only if it missed one,
+    since every message supersedes the previous ones.
+    """
+
     def __init__(
         self,
         ch: ChannelName,
         SARType: Type[SAR],
         on_empty: Optional[Callable[[PChannel], None]] = None,
+        max_queue_size: int = DEFAULT_SUB_QUEUE_SIZE,
+        overflow_policy: OverflowPolicy = DEFAULT_OVERFLOW_POLICY,
+        on_disconnect: Optional[Callable[[Subscriber], None]] = None,
     ) -> None:
-        self._subs: List[Subscriber] = []
+        """
+        Args:
+            ch (ChannelName): channel name
+            SARType (Type[SAR]): message wrapper
+            on_empty (Optional[Callable[[PChannel], None]], optional): called when the last subscriber unsubscribes (or is removed), the channel is then dropped by PubSub. Defaults to None.
+            max_queue_size (int, optional): maximum number of messages queued per subscriber. Defaults to DEFAULT_SUB_QUEUE_SIZE.
+            overflow_policy (OverflowPolicy, optional): handling of messages published to a full subscriber queue. Defaults to DEFAULT_OVERFLOW_POLICY.
+            on_disconnect (Optional[Callable[[Subscriber], None]], optional): called with a subscriber removed by the channel (its queue overflowed with "disconnect" policy, or sending failed), to close its connection. Defaults to None.
+        """
+        # outbound queue of each subscriber
+        self._subs: Dict[Subscriber, SubscriberQueue] = {}
+        # number of subscriptions of each subscriber, it is removed with the last one
+        self._sub_counts: Dict[Subscriber, int] = {}
         self.ch = ch
         self._SARType = SARType
-        self._cache = None
+        self._cache: Optional[EncodedMessage] = None
+        # sequence number of the current message, 0 until a message is published
+        self.version = 0
         self._on_empty = on_empty
+        self._max_queue_size = max_queue_size
+        self._overflow_policy: OverflowPolicy = overflow_policy
+        self._on_disconnect = on_disconnect
+        self.stats = ChannelStats()
+        # set once the first message is published
+        self._ready = asyncio.Event()
+
+    @property
+    def queue_depth(self) -> int:
+        """number of messages queued for all subscribers"""
+        return sum(len(queue) for queue in self._subs.values())
 
     def _set_cache(self, msg: Message):
-        self._cache = self._wrap_msg(msg)
+        self._cache = self.encode(msg)
+        self.version = self._cache.version
+        self._ready.set()
 
-    def get_initial_msg(self) -> Optional[SAR]:
+    def get_initial_msg(self) -> Optional[EncodedMessage]:
         return self._cache
 
-    async def sub(self, sub: Subscriber) -> None:
-        self._subs.append(sub)
-        if self._cache is not None:
-            await sub(self._cache)
+    async def sub(
+        self, sub: Subscriber, version: Optional[int] = None, hold: bool = False
+    ) -> None:
+        """Subscribe
+
+        Args:
+            sub (Subscriber): subscriber
+            version (Optional[int], optional): version last received by the subscriber, to resume from. Defaults to None (send the current message).
+            hold (bool, optional): queue messages to the subscriber without sending them, until `release`. Defaults to False.
+        """
+        queue = self._subs.get(sub)
+        if queue is None:
+            queue = SubscriberQueue(
+                sub,
+                self.stats,
+                self._remove_sub,
+                max_size=self._max_queue_size,
+                policy=self._overflow_policy,
+            )
+            self._subs[sub] = queue
+            self._sub_counts[sub] = 1
+        else:
+            # e.g. subscribed to the channel, and to a pattern matching it
+            self._sub_counts[sub] += 1
+        if hold:
+            queue.hold()
+        for frame in self._get_resume_frames(version):
+            queue.put(frame)
+
+    def take_held(self, sub: Subscriber) -> List[EncodedPayload]:
+        """take the messages queued to a subscriber, which was subscribed with `hold`"""
+        queue = self._subs.get(sub)
+        return [] if queue is None else queue.take()
+
+    def release(self, sub: Subscriber):
+        """send messages queued to the subscriber from now on"""
+        queue = self._subs.get(sub)
+        if queue is not None:
+            queue.release()
+
+    async def wait_ready(self):
+        """wait until the first message is published"""
+        await self._ready.wait()
+
+    def _get_resume_frames(self, version: Optional[int]) -> List[EncodedMessage]:
+        """messages missed by a subscriber which last received `version`"""
+        if version is not None and version == self.version:
+            return []
+        initial_msg = self.get_initial_msg()
+        return [] if initial_msg is None else [initial_msg]
 
     def unsub(self, sub: Subscriber) -> bool:
         """Unsubscribe
@@ -42,10 +186,17 @@ class Channel(PChannel, Generic[SAR]):
         Returns:
             bool: channel should be kept by PubSub
         """
-        try:
-            self._subs.remove(sub)
-        except ValueError:
-            logger.error("sub cannot be remove: sub does not exist")
+        count = self._sub_counts.get(sub, 0)
+        if count > 1:
+            self._sub_counts[sub] = count - 1
+            return True
+        queue = self._subs.pop(sub, None)
+        self._sub_counts.pop(sub, None)
+        if queue is None:
+            # removed by the channel, `on_empty` was called then (see `_remove_sub`)
+            logger.debug("sub cannot be remove: sub does not exist")
+            return len(self._subs) > 0
+        queue.close()
 
         if self._on_empty is not None and len(self._subs) == 0:
             self._on_empty(self)
@@ -53,23 +204,169 @@ class Channel(PChannel, Generic[SAR]):
 
         return True
 
-    def _wrap_msg(self, msg: Message) -> SAR:
-        return self._SARType(channel=self.ch, data=msg)
+    def _remove_sub(self, sub: Subscriber):
+        """remove a subscriber whose queue overflowed or failed,
+        the channel is kept by PubSub until the subscriber unsubscribes"""
+        if self._subs.pop(sub, None) is None:
+            return
+        self._sub_counts.pop(sub, None)
+        if self._on_disconnect is not None:
+            self._on_disconnect(sub)
+        if self._on_empty is not None and len(self._subs) == 0:
+            self._on_empty(self)
+
+    def _wrap_msg(self, msg: Message, version: int) -> SAR:
+        return self._SARType(channel=self.ch, data=msg, version=version)
+
+    def encode(self, msg: Message) -> EncodedMessage:
+        """wrap and encode a message of this channel with a new sequence number,
+        the result can be published with `publish_encoded`"""
+        version = next_seq()
+        return EncodedMessage(
+            self._wrap_msg(msg, version).model_dump_json(by_alias=True), version
+        )
 
     async def publish(self, msg: Message) -> None:
-        self._cache = wmsg = self._wrap_msg(msg)
-        for i in range(len(self._subs) - 1, -1, -1):
-            sub = self._subs[i]
-            try:
-                await sub(wmsg)
-            except RuntimeError as e:
-                self._subs.pop(i)
-                logger.error(
-                    f"sub must not raise a RuntimeError, got {e}: there probably dangling with a close WebsocketConnection"
-                )
-            except Exception as e:
-                self._subs.pop(i)
-                logger.error(f"sub must not raise an exception: got exception: {e}")
+        # encoded once for all subscribers
+        await self._publish_wrapped(self.encode(msg))
+
+    async def publish_encoded(self, frame: EncodedPayload) -> None:
+        """publish a message encoded by `encode`"""
+        assert isinstance(frame, EncodedMessage), "frame must be encoded by `encode`"
+        await self._publish_wrapped(frame)
+
+    async def _publish_wrapped(self, wmsg: EncodedMessage) -> None:
+        self._cache = wmsg
+        # a cached frame keeps the version it was encoded with, which may be older
+        self.version = max(self.version, wmsg.version)
+        self._ready.set()
+        self._enqueue(wmsg)
+
+    def _enqueue(self, frame: EncodedPayload):
+        # queued for each subscriber's writer, so a slow subscriber does not delay the others
+        for queue in list(self._subs.values()):
+            queue.put(frame)
+
+    async def drain(self):
+        """wait until queued messages are sent to all subscribers"""
+        await asyncio.gather(*(queue.drain() for queue in list(self._subs.values())))
+
+
+class DeltaChannel(Channel[SAR], Generic[SAR, SPR]):
+    """Channel publishing patches of its message
+
+    Subscribers receive the full message (a snapshot) when they subscribe, later messages are
+    sent as JSON patches against the previous one, so a small change to a large message is
+    sent as a small frame. A snapshot carries its version and a patch carries the version it
+    applies to (`base`). A client which misses a patch (e.g. dropped from a full queue) sees a
+    gap and resubscribes for a snapshot.
+
+    The last patches are kept in a ring buffer, a subscriber resuming from a version still in
+    the buffer only receives the patches it missed.
+    """
+
+    def __init__(
+        self,
+        ch: ChannelName,
+        SARType: Type[SAR],
+        SPRType: Type[SPR],
+        on_empty: Optional[Callable[[PChannel], None]] = None,
+        max_queue_size: int = DEFAULT_SUB_QUEUE_SIZE,
+        overflow_policy: OverflowPolicy = DEFAULT_OVERFLOW_POLICY,
+        on_disconnect: Optional[Callable[[Subscriber], None]] = None,
+        replay_size: int = DEFAULT_REPLAY_SIZE,
+    ) -> None:
+        """
+        Args:
+            ch (ChannelName): channel name
+            SARType (Type[SAR]): message wrapper
+            SPRType (Type[SPR]): patch wrapper
+            on_empty (Optional[Callable[[PChannel], None]], optional): called when the last subscriber unsubscribes (or is removed), the channel is then dropped by PubSub. Defaults to None.
+            max_queue_size (int, optional): maximum number of messages queued per subscriber. Defaults to DEFAULT_SUB_QUEUE_SIZE.
+            overflow_policy (OverflowPolicy, optional): handling of messages published to a full subscriber queue. Defaults to DEFAULT_OVERFLOW_POLICY.
+            on_disconnect (Optional[Callable[[Subscriber], None]], optional): called with a subscriber removed by the channel, to close its connection. Defaults to None.
+            replay_size (int, optional): number of patches kept for resuming subscribers. Defaults to DEFAULT_REPLAY_SIZE.
+        """
+        super().__init__(
+            ch, SARType, on_empty, max_queue_size, overflow_policy, on_disconnect
+        )
+        self._SPRType = SPRType
+        # JSON-able message of the current version, parsed from the snapshot when first needed
+        self._doc: Any = _UNSET
+        # (base, patch) of the last patches
+        self._patches: Deque[Tuple[int, EncodedMessage]] = deque(maxlen=replay_size)
+
+    def get_initial_msg(self) -> Optional[EncodedMessage]:
+        # snapshot is encoded on demand after a change
+        if self._cache is None and self._doc is not _UNSET:
+            self._cache = EncodedMessage(
+                self._wrap_msg(self._doc, self.version).model_dump_json(by_alias=True),
+                self.version,
+                self._doc,
+            )
+        return self._cache
+
+    def _get_resume_frames(self, version: Optional[int]) -> List[EncodedMessage]:
+        if version is not None and version != self.version:
+            for idx, (base, _) in enumerate(self._patches):
+                if base == version:
+                    patches = [
+                        patch
+                        for _, patch in itertools.islice(self._patches, idx, None)
+                    ]
+                    # a snapshot is smaller than a backlog which would overflow the queue
+                    if len(patches) <= self._max_queue_size:
+                        return patches
+                    break
+        return super()._get_resume_frames(version)
+
+    def encode(self, msg: Message) -> EncodedMessage:
+        """wrap and encode a message of this channel with a new sequence number,
+        keeping its JSON-able form to diff it when it is published"""
+        doc = to_jsonable_python(msg, by_alias=True)
+        frame = super().encode(doc)
+        frame.doc = doc
+        return frame
+
+    def _get_doc(self) -> Any:
+        if self._doc is _UNSET and self._cache is not None:
+            doc = self._cache.doc
+            self._doc = json.loads(self._cache.text)["data"] if doc is _UNSET else doc
+        return self._doc
+
+    async def publish(self, msg: Message) -> None:
+        if self._cache is None and self._doc is _UNSET:
+            # first message is published as is
+            await super().publish(msg)
+            return
+        await self._publish_doc(to_jsonable_python(msg, by_alias=True))
+
+    async def _publish_doc(self, doc: Any) -> None:
+        ops = make_patch(self._get_doc(), doc)
+        if len(ops) == 0:
+            return
+        base = self.version
+        self.version = next_seq()
+        self._doc = doc
+        self._cache = None
+        patch = self._SPRType(
+            channel=self.ch, base=base, version=self.version, ops=ops
+        )
+        frame = EncodedMessage(patch.model_dump_json(by_alias=True), self.version)
+        self._patches.append((base, frame))
+        self._enqueue(frame)
+
+    async def publish_encoded(self, frame: EncodedPayload) -> None:
+        """publish a message encoded by `encode`, as a patch unless it is the first message"""
+        assert isinstance(frame, EncodedMessage), "frame must be encoded by `encode`"
+        if self._cache is None and self._doc is _UNSET:
+            await super().publish_encoded(frame)
+            return
+        if frame.doc is _UNSET:
+            await self._publish_doc(json.loads(frame.text)["data"])
+        elif frame.doc is not self._get_doc():
+            # the same cached frame published again is unchanged, no need to diff it
+            await self._publish_doc(frame.doc)
 
 
 # class BaseChannel(AbsChannel):
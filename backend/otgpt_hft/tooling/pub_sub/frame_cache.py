@@ -0,0 +1,66 @@
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from ..ws.connection import EncodedPayload
+from .base import ChannelName
+
+# maximum total size (in characters) of cached frames
+DEFAULT_FRAME_CACHE_MAX_SIZE = 64 * 1024 * 1024
+
+
+class FrameCache:
+    """Bounded LRU cache of encoded channel messages, keyed by channel name
+
+    `generation` is increased on every invalidation. A frame computed from data read at an
+    older generation may be stale, `put` ignores such frames.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_FRAME_CACHE_MAX_SIZE):
+        self._max_size = max_size
+        self._size = 0
+        self._frames: OrderedDict[ChannelName, EncodedPayload] = OrderedDict()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def get(self, ch: ChannelName) -> Optional[EncodedPayload]:
+        frame = self._frames.get(ch)
+        if frame is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._frames.move_to_end(ch)
+        return frame
+
+    def put(self, ch: ChannelName, frame: EncodedPayload, generation: int):
+        """Cache a frame
+
+        Args:
+            ch (ChannelName): channel of the frame
+            frame (EncodedPayload): encoded message
+            generation (int): `generation` before reading the data of the frame
+        """
+        if generation != self.generation or len(frame) > self._max_size:
+            return
+        self.invalidate(ch, bump_generation=False)
+        self._frames[ch] = frame
+        self._size += len(frame)
+        while self._size > self._max_size:
+            _, evicted = self._frames.popitem(last=False)
+            self._size -= len(evicted)
+
+    def invalidate(self, ch: ChannelName, bump_generation: bool = True):
+        if bump_generation:
+            self.generation += 1
+        frame = self._frames.pop(ch, None)
+        if frame is not None:
+            self._size -= len(frame)
+
+    def invalidate_matching(self, match: Callable[[ChannelName], bool]):
+        """invalidate all frames of channels matching a predicate"""
+        self.generation += 1
+        for ch in [ch for ch in self._frames if match(ch)]:
+            self.invalidate(ch, bump_generation=False)
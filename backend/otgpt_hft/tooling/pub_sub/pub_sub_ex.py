@@ -1,27 +1,45 @@
+import asyncio
 import logging
-from typing import Any, Callable, Dict, Literal, Optional, Protocol, Tuple
+from typing import Any, Callable, Dict, List, Literal, Optional, Protocol, Tuple
+
+from otgpt_hft.tooling.ws.connection import EncodedPayload
 
 from .base import (
     ChannelName,
-    Prefix,
     PubSub,
     Subscriber,
     SubscriptionARes,
     UnregisteredChannel,
+    encode_batch,
 )
+from .trie import SegmentTrie, is_pattern
 
 logger = logging.getLogger(__name__)
 
 ChannelType = Literal["base", "cached", "diff"]
 
+# seconds a batch subscription waits for initial messages of new channels
+DEFAULT_BATCH_WAIT_S = 0.5
+
 
 class PChannel(Protocol):
     ch: ChannelName
 
-    def get_initial_msg(self) -> Optional[SubscriptionARes[Any]]:
+    def get_initial_msg(self) -> Optional[SubscriptionARes[Any] | EncodedPayload]:
+        ...
+
+    async def sub(
+        self, sub: Subscriber, version: Optional[int] = None, hold: bool = False
+    ) -> None:
+        ...
+
+    def take_held(self, sub: Subscriber) -> List[EncodedPayload]:
         ...
 
-    async def sub(self, sub: Subscriber) -> None:
+    def release(self, sub: Subscriber) -> None:
+        ...
+
+    async def wait_ready(self) -> None:
         ...
 
     def unsub(self, sub: Subscriber) -> bool:
@@ -32,9 +50,21 @@ Hook = Callable[[ChannelName], PChannel]
 
 
 class ExtensiblePubSub(PubSub):
+    """PubSub whose channels are created on demand by hooks
+
+    A hook is registered for a prefix, and creates the channels whose name starts with it
+    (the longest registered prefix wins). Channels and hooks are stored in segment tries, so
+    resolving a channel takes O(depth).
+
+    A subscription to a pattern (e.g. `entry/<dataset>/<split>/*`, or `entry/<dataset>/**`)
+    receives the messages of all channels matching it, existing or created later.
+    """
+
     def __init__(self):
-        self.ch_s: Dict[ChannelName, PChannel] = {}
-        self.ch_hook_s: Dict[Prefix, Hook] = {}
+        self.ch_s: SegmentTrie[PChannel] = SegmentTrie()
+        self.ch_hook_s: SegmentTrie[Hook] = SegmentTrie()
+        # number of subscriptions of each subscriber to each pattern, as channels count them
+        self.pattern_subs: SegmentTrie[Dict[Subscriber, int]] = SegmentTrie()
 
     def register_channel(self, ch_name: ChannelName, channel: PChannel) -> None:
         if ch_name in self.ch_s:
@@ -59,41 +89,136 @@ class ExtensiblePubSub(PubSub):
     # def get_initial_msg(self, ch: ChannelName) -> Optional[Message]:
     #     return self.ch_s[ch].get_initial_msg()
 
-    async def subscribe(self, ch: ChannelName, sub: Subscriber) -> None:
-        if ch in self.ch_s:
-            # subscribe to existing channels
-            await self.ch_s[ch].sub(sub)
-        else:
-            # find hooks that can provide data to the requested channel
-            hook = self._find_hook(ch)
-            if hook is not None:
-                # create channel with hook
-                channel = hook(ch)
-                self.register_channel(ch, channel)
-                # subscribe to new channel
-                await channel.sub(sub)
-                return
+    def is_followed(self, ch: ChannelName) -> bool:
+        """channel matches a pattern with subscribers"""
+        return any(True for _ in self.pattern_subs.match_patterns(ch))
+
+    async def open_channel(self, ch: ChannelName) -> PChannel:
+        """get the channel, creating it with a hook if it does not exist,
+        subscribers of patterns matching a new channel are subscribed to it"""
+        channel = self.ch_s.get(ch)
+        if channel is not None:
+            return channel
 
+        # find hooks that can provide data to the requested channel
+        hook = self._find_hook(ch)
+        if hook is None:
             raise UnregisteredChannel(
                 "invalid channel",
                 f"cannot subscribe to an unregistered channel",
             )
+        # create channel with hook
+        channel = hook(ch)
+        self.register_channel(ch, channel)
+        for subs in list(self.pattern_subs.match_patterns(ch)):
+            for sub, count in list(subs.items()):
+                for _ in range(count):
+                    await channel.sub(sub)
+        return channel
+
+    async def subscribe(
+        self, ch: ChannelName, sub: Subscriber, version: Optional[int] = None
+    ) -> None:
+        await self._subscribe(ch, sub, version)
+
+    async def _subscribe(
+        self,
+        ch: ChannelName,
+        sub: Subscriber,
+        version: Optional[int] = None,
+        hold: bool = False,
+    ) -> List[PChannel]:
+        """subscribe to a channel or a pattern, returns the channels subscribed to"""
+        if is_pattern(ch):
+            subs = self.pattern_subs.get(ch)
+            if subs is None:
+                subs = self.pattern_subs[ch] = {}
+            subs[sub] = subs.get(sub, 0) + 1
+            # subscribe to existing channels, later channels are subscribed on creation
+            channels = [channel for _, channel in self.ch_s.match(ch)]
+            for channel in channels:
+                await channel.sub(sub, hold=hold)
+            return channels
+
+        channel = await self.open_channel(ch)
+        await channel.sub(sub, version, hold)
+        return [channel]
+
+    async def subscribe_batch(
+        self,
+        chs: List[Tuple[ChannelName, Optional[int]]],
+        sub: Subscriber,
+        wait_s: float = DEFAULT_BATCH_WAIT_S,
+    ) -> None:
+        """Subscribe to channels at once
+
+        The subscriptions are all applied or none: if a channel cannot be subscribed to, the
+        previous subscriptions are undone. Initial messages of the channels are sent in a
+        single "batch" frame, waiting up to `wait_s` seconds for new channels to publish
+        theirs, later ones are sent on their own.
+
+        Args:
+            chs (List[Tuple[ChannelName, Optional[int]]]): channels (or patterns) and the versions last received on them
+            sub (Subscriber): subscriber
+            wait_s (float, optional): seconds to wait for initial messages of new channels. Defaults to DEFAULT_BATCH_WAIT_S.
+        """
+        channels: List[PChannel] = []
+        subscribed: List[ChannelName] = []
+        try:
+            for ch, version in chs:
+                channels.extend(await self._subscribe(ch, sub, version, hold=True))
+                subscribed.append(ch)
+        except Exception:
+            for channel in channels:
+                channel.release(sub)
+            for ch in subscribed:
+                self.unsubscribe(ch, sub)
+            raise
+
+        try:
+            # initial messages of new channels are published by background tasks of hooks
+            waits = [
+                asyncio.ensure_future(channel.wait_ready()) for channel in channels
+            ]
+            if len(waits) > 0:
+                _, pending = await asyncio.wait(waits, timeout=wait_s)
+                for wait in pending:
+                    wait.cancel()
+            frames = [frame for channel in channels for frame in channel.take_held(sub)]
+            if len(frames) > 0:
+                await sub(encode_batch(frames))
+        finally:
+            for channel in channels:
+                channel.release(sub)
 
     def unsubscribe(self, ch: ChannelName, sub: Subscriber) -> None:
+        if is_pattern(ch):
+            subs = self.pattern_subs.get(ch)
+            if subs is None or sub not in subs:
+                raise UnregisteredChannel(
+                    "invalid channel",
+                    f"cannot unsubscribe to an unregistered channel",
+                )
+            subs[sub] -= 1
+            if subs[sub] == 0:
+                del subs[sub]
+            if len(subs) == 0:
+                del self.pattern_subs[ch]
+            for ch_name, _ in list(self.ch_s.match(ch)):
+                self._unsub_channel(ch_name, sub)
+            return
+
         if ch not in self.ch_s:
             raise UnregisteredChannel(
                 "invalid channel",
                 f"cannot unsubscribe to an unregistered channel",
             )
+        self._unsub_channel(ch, sub)
 
+    def _unsub_channel(self, ch: ChannelName, sub: Subscriber):
         keep_ch = self.ch_s[ch].unsub(sub)
         if not keep_ch:
             del self.ch_s[ch]
 
     def _find_hook(self, ch: ChannelName) -> Hook | None:
-        for i in range(len(ch), -1, -1):
-            prefix = ch[:i]
-            if prefix in self.ch_hook_s:
-                return self.ch_hook_s[prefix]
-
-        return None
+        return self.ch_hook_s.longest_prefix(ch)
@@ -0,0 +1,155 @@
+"""Bounded outbound queues of subscribers"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Callable, Deque, List, Literal, Optional
+
+from pydantic import BaseModel
+
+from ..ws.connection import EncodedPayload
+from .base import Subscriber, SubscriptionARes
+
+logger = logging.getLogger(__name__)
+
+# what happens to a message published to a full queue
+# - "drop-oldest": the oldest queued message is dropped
+# - "latest": all queued messages are dropped, only the latest message is kept
+# - "disconnect": the subscriber is removed from the channel, which asks for its connection
+#   to be closed, so the client reconnects and resumes
+OverflowPolicy = Literal["drop-oldest", "latest", "disconnect"]
+
+# maximum number of messages queued per subscriber
+DEFAULT_SUB_QUEUE_SIZE = 16
+DEFAULT_OVERFLOW_POLICY: OverflowPolicy = "drop-oldest"
+
+Frame = SubscriptionARes[Any] | EncodedPayload
+
+
+class ChannelStats(BaseModel):
+    # number of messages dropped from full queues
+    dropped: int = 0
+    # number of subscribers removed because their queue was full
+    disconnected: int = 0
+    # number of subscribers removed because sending failed
+    failed: int = 0
+    # maximum number of messages queued for a subscriber
+    max_queue_depth: int = 0
+
+
+class SubscriberQueue:
+    """Outbound queue of a single subscriber, drained by its own writer task
+
+    Messages are sent to the subscriber in order, without blocking the publisher, so a slow
+    subscriber only delays itself. Once `max_size` messages are queued, new messages are
+    handled according to `policy`.
+    """
+
+    def __init__(
+        self,
+        sub: Subscriber,
+        stats: ChannelStats,
+        on_remove: Callable[[Subscriber], None],
+        max_size: int = DEFAULT_SUB_QUEUE_SIZE,
+        policy: OverflowPolicy = DEFAULT_OVERFLOW_POLICY,
+    ):
+        """
+        Args:
+            sub (Subscriber): subscriber
+            stats (ChannelStats): stats of the channel, updated by the queue
+            on_remove (Callable[[Subscriber], None]): called when the subscriber must be removed from the channel (sending failed, or overflow with "disconnect" policy)
+            max_size (int, optional): maximum number of queued messages. Defaults to DEFAULT_SUB_QUEUE_SIZE.
+            policy (OverflowPolicy, optional): handling of messages published to a full queue. Defaults to DEFAULT_OVERFLOW_POLICY.
+        """
+        self.sub = sub
+        self._stats = stats
+        self._on_remove = on_remove
+        self._max_size = max_size
+        self._policy = policy
+        self._frames: Deque[Frame] = deque()
+        # writer task, running while messages are queued
+        self._writer: Optional[asyncio.Task[None]] = None
+        # queued messages are not sent while held
+        self._held = False
+        self.closed = False
+
+    def __len__(self) -> int:
+        """number of queued messages"""
+        return len(self._frames)
+
+    def put(self, frame: Frame):
+        if self.closed:
+            return
+
+        frames = self._frames
+        if len(frames) >= self._max_size:
+            if self._policy == "disconnect":
+                logger.error(
+                    {"msg": "subscriber queue is full, removing subscriber"}
+                )
+                self._stats.disconnected += 1
+                self.close()
+                self._on_remove(self.sub)
+                return
+            if self._policy == "latest":
+                self._stats.dropped += len(frames)
+                frames.clear()
+            else:
+                assert self._policy == "drop-oldest"
+                self._stats.dropped += 1
+                frames.popleft()
+
+        frames.append(frame)
+        self._stats.max_queue_depth = max(self._stats.max_queue_depth, len(frames))
+        self._start_writer()
+
+    def _start_writer(self):
+        if self._writer is None and not self._held and len(self._frames) > 0:
+            self._writer = asyncio.create_task(self._write())
+
+    def hold(self):
+        """stop sending queued messages until `release`, a message being sent is not interrupted"""
+        self._held = True
+
+    def take(self) -> List[Frame]:
+        """take all queued messages out of the queue, e.g. to send them in a single frame"""
+        frames = list(self._frames)
+        self._frames.clear()
+        return frames
+
+    def release(self):
+        self._held = False
+        if not self.closed:
+            self._start_writer()
+
+    def close(self):
+        """drop queued messages, a message being sent is not interrupted"""
+        self.closed = True
+        self._frames.clear()
+
+    async def drain(self):
+        """wait until queued messages are sent"""
+        while self._writer is not None:
+            await asyncio.shield(self._writer)
+
+    async def _write(self):
+        try:
+            while self._frames and not self._held:
+                frame = self._frames.popleft()
+                try:
+                    await self.sub(frame)
+                except Exception as e:
+                    if isinstance(e, RuntimeError):
+                        logger.error(
+                            f"sub must not raise a RuntimeError, got {e}: there probably dangling with a close WebsocketConnection"
+                        )
+                    else:
+                        logger.error(
+                            f"sub must not raise an exception: got exception: {e}"
+                        )
+                    self._stats.failed += 1
+                    self.close()
+                    self._on_remove(self.sub)
+                    return
+        finally:
+            self._writer = None
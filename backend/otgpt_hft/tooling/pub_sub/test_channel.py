@@ -0,0 +1,195 @@
+import asyncio
+import json
+from typing import Any, List, Tuple
+
+import pytest
+
+from ..ws.connection import EncodedPayload
+from ...utils.json_patch import PatchOp, apply_patch
+from . import channel as channel_module
+from .base import SubscriptionARes, SubscriptionPatchARes
+from .channel import Channel, DeltaChannel
+from .sub_queue import OverflowPolicy
+
+
+def test_channel_publish():
+    async def _run():
+        channel = Channel(("a",), SubscriptionARes[Any])
+        received: List[Any] = []
+        order: List[str] = []
+
+        async def slow_sub(msg: Any):
+            await asyncio.sleep(0.02)
+            received.append(msg)
+            order.append("slow")
+
+        async def fast_sub(msg: Any):
+            received.append(msg)
+            order.append("fast")
+
+        async def broken_sub(msg: Any):
+            raise RuntimeError("closed")
+
+        for sub in (slow_sub, fast_sub, broken_sub):
+            await channel.sub(sub)
+        await channel.publish({"x": 1})
+        await channel.drain()
+
+        # encoded once, and shared by all subscribers
+        assert len(received) == 2
+        assert isinstance(received[0], EncodedPayload)
+        assert received[0] is received[1]
+        # subscribers are sent to concurrently
+        assert order == ["fast", "slow"]
+        # failing subscriber is removed
+        assert list(channel._subs) == [slow_sub, fast_sub]
+        assert channel.stats.failed == 1
+        assert channel.get_initial_msg() is received[0]
+
+    asyncio.run(_run())
+
+
+def test_channel_overflow_policy():
+    async def _run(policy: OverflowPolicy) -> Tuple[List[Any], Channel[Any]]:
+        channel = Channel(
+            ("a",), SubscriptionARes[Any], max_queue_size=2, overflow_policy=policy
+        )
+        received: List[Any] = []
+
+        async def sub(msg: Any):
+            received.append(json.loads(msg.text)["data"])
+
+        await channel.sub(sub)
+        # the writer does not run until the publisher yields
+        for i in range(4):
+            await channel.publish(i)
+        assert channel.queue_depth == (0 if policy == "disconnect" else 2)
+        await channel.drain()
+        return received, channel
+
+    received, channel = asyncio.run(_run("drop-oldest"))
+    assert received == [2, 3]
+    assert channel.stats.dropped == 2 and channel.stats.max_queue_depth == 2
+
+    received, channel = asyncio.run(_run("latest"))
+    assert received == [2, 3]
+    assert channel.stats.dropped == 2
+
+    received, channel = asyncio.run(_run("disconnect"))
+    assert received == []
+    assert channel.stats.disconnected == 1
+    assert len(channel._subs) == 0
+
+
+def test_delta_channel():
+    async def _run():
+        channel = DeltaChannel(
+            ("a",), SubscriptionARes[Any], SubscriptionPatchARes[Any]
+        )
+        received: List[Any] = []
+
+        async def sub(msg: Any):
+            received.append(json.loads(msg.text))
+
+        utts = [{"id": str(i), "text": "x" * 100} for i in range(20)]
+        await channel.sub(sub)
+        await channel.publish({"utts": utts})
+        await channel.publish({"utts": utts})
+        await channel.publish({"utts": [*utts, {"id": "20", "text": "y"}]})
+        await channel.drain()
+
+        # unchanged message is not published
+        assert [msg["type"] for msg in received] == ["sub", "patch"]
+        snapshot, patch = received
+        assert patch["base"] == snapshot["version"] < patch["version"]
+        assert len(json.dumps(patch)) < len(json.dumps(snapshot)) / 10
+        doc = apply_patch(
+            snapshot["data"], [PatchOp.model_validate(op) for op in patch["ops"]]
+        )
+
+        # late subscriber receives a snapshot of the current version
+        late_received: List[Any] = []
+
+        async def late_sub(msg: Any):
+            late_received.append(json.loads(msg.text))
+
+        await channel.sub(late_sub)
+        await channel.drain()
+        assert late_received[0]["type"] == "sub"
+        assert late_received[0]["version"] == patch["version"]
+        assert late_received[0]["data"] == doc
+
+    asyncio.run(_run())
+
+
+def test_delta_channel_publish_encoded(monkeypatch: pytest.MonkeyPatch):
+    async def _run():
+        channel = DeltaChannel(
+            ("a",), SubscriptionARes[Any], SubscriptionPatchARes[Any]
+        )
+        frames = [channel.encode({"x": i}) for i in range(2)]
+        await channel.publish_encoded(frames[0])
+        await channel.publish_encoded(frames[1])
+        # a cached frame published again is unchanged
+        await channel.publish_encoded(frames[1])
+        return channel
+
+    n_diffs = 0
+    make_patch = channel_module.make_patch
+
+    def counting_make_patch(a: Any, b: Any):
+        nonlocal n_diffs
+        n_diffs += 1
+        return make_patch(a, b)
+
+    def fail_loads(*args: Any, **kwargs: Any):
+        raise AssertionError("encoded frames must not be parsed again")
+
+    monkeypatch.setattr(channel_module, "make_patch", counting_make_patch)
+    monkeypatch.setattr(channel_module.json, "loads", fail_loads)
+    channel = asyncio.run(_run())
+    assert n_diffs == 1
+    assert len(channel._patches) == 1
+
+
+def test_channel_resume():
+    async def _run():
+        channel = DeltaChannel(
+            ("a",), SubscriptionARes[Any], SubscriptionPatchARes[Any], replay_size=2
+        )
+        for i in range(4):
+            await channel.publish({"x": i})
+        versions = [base for base, _ in channel._patches] + [channel.version]
+
+        async def resume(version: int) -> List[Any]:
+            received: List[Any] = []
+
+            async def sub(msg: Any):
+                received.append(json.loads(msg.text))
+
+            await channel.sub(sub, version)
+            await channel.drain()
+            channel.unsub(sub)
+            return received
+
+        # up to date
+        assert await resume(versions[-1]) == []
+        # missed patches are replayed
+        received = await resume(versions[0])
+        assert [(msg["base"], msg["version"]) for msg in received] == [
+            (versions[0], versions[1]),
+            (versions[1], versions[2]),
+        ]
+        # a version no longer in the buffer gets a snapshot
+        received = await resume(versions[0] - 1)
+        assert [msg["type"] for msg in received] == ["sub"]
+        assert received[0]["data"] == {"x": 3}
+
+        # channel publishing full messages only resends the current message
+        channel = Channel(("b",), SubscriptionARes[Any])
+        await channel.publish({"x": 0})
+        assert await resume(channel.version) == []
+        received = await resume(channel.version - 1)
+        assert received[0]["data"] == {"x": 0}
+
+    asyncio.run(_run())
@@ -0,0 +1,33 @@
+from ..ws.connection import EncodedPayload
+from .frame_cache import FrameCache
+
+
+def test_frame_cache_eviction():
+    cache = FrameCache(max_size=10)
+    cache.put(("a",), EncodedPayload("12345"), cache.generation)
+    cache.put(("b",), EncodedPayload("12345"), cache.generation)
+    assert cache.get(("a",)) is not None
+    # least recently used frame is evicted
+    cache.put(("c",), EncodedPayload("123"), cache.generation)
+    assert cache.get(("b",)) is None
+    assert cache.get(("a",)) is not None
+    assert cache.get(("c",)) is not None
+
+
+def test_frame_cache_invalidation():
+    cache = FrameCache()
+    cache.put(("a", "x"), EncodedPayload("a"), cache.generation)
+    cache.put(("a", "y"), EncodedPayload("a"), cache.generation)
+    cache.put(("b",), EncodedPayload("b"), cache.generation)
+
+    cache.invalidate(("b",))
+    assert cache.get(("b",)) is None
+
+    cache.invalidate_matching(lambda ch: ch[0] == "a")
+    assert len(cache) == 0
+
+    # frame computed before an invalidation is not cached
+    generation = cache.generation
+    cache.invalidate(("a", "x"))
+    cache.put(("a", "x"), EncodedPayload("stale"), generation)
+    assert cache.get(("a", "x")) is None
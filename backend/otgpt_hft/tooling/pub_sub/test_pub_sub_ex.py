@@ -0,0 +1,142 @@
+import asyncio
+import json
+from typing import Any, List, Tuple
+
+import pytest
+
+from .base import ChannelName, SubscriptionARes, UnregisteredChannel
+from .channel import Channel
+from .pub_sub_ex import ExtensiblePubSub, PChannel
+
+
+def test_pattern_subscription():
+    async def _run():
+        pub_sub = ExtensiblePubSub()
+        channels: List[Channel[Any]] = []
+
+        def _hook(ch: ChannelName) -> PChannel:
+            def _on_empty(channel: PChannel):
+                pass
+
+            channel = Channel(ch, SubscriptionARes[Any], on_empty=_on_empty)
+            channels.append(channel)
+            return channel
+
+        pub_sub.register_hook(("entry",), _hook)
+        received: List[Tuple[str, Any]] = []
+
+        async def dashboard(msg: Any):
+            frame = json.loads(msg.text)
+            received.append((frame["channel"], frame["data"]))
+
+        async def viewer(msg: Any):
+            pass
+
+        # existing channel matching the pattern is followed
+        await pub_sub.subscribe(("entry", "d", "s", "e0"), viewer)
+        await pub_sub.subscribe(("entry", "d", "s", "*"), dashboard)
+        # channel created later is followed
+        await pub_sub.subscribe(("entry", "d", "s", "e1"), viewer)
+        await pub_sub.subscribe(("entry", "d", "t", "e0"), viewer)
+        for channel in channels:
+            await channel.publish(channel.ch[-1])
+            await channel.drain()
+        assert received == [
+            (["entry", "d", "s", "e0"], "e0"),
+            (["entry", "d", "s", "e1"], "e1"),
+        ]
+
+        # subscriptions to a channel and to a pattern matching it are independent
+        e0, e1, _ = channels
+        pub_sub.unsubscribe(("entry", "d", "s", "e1"), viewer)
+        pub_sub.unsubscribe(("entry", "d", "s", "*"), dashboard)
+        assert list(e0._subs) == [viewer]
+        # channel without subscribers is dropped
+        assert ("entry", "d", "s", "e1") not in pub_sub.ch_s
+        assert len(e1._subs) == 0
+
+    asyncio.run(_run())
+
+
+def test_subscribe_batch():
+    async def _run():
+        pub_sub = ExtensiblePubSub()
+
+        def _hook(ch: ChannelName) -> PChannel:
+            def _on_empty(channel: PChannel):
+                pass
+
+            channel = Channel(ch, SubscriptionARes[Any], on_empty=_on_empty)
+            # initial message is published in the background, as DataBridge hooks do
+            asyncio.get_running_loop().call_soon(
+                lambda: asyncio.ensure_future(channel.publish(ch[-1]))
+            )
+            return channel
+
+        pub_sub.register_hook(("entry",), _hook)
+        received: List[Any] = []
+
+        async def viewer(msg: Any):
+            received.append(json.loads(msg.text))
+
+        await pub_sub.subscribe_batch(
+            [(("entry", "e0"), None), (("entry", "e1"), None)], viewer, wait_s=1
+        )
+        # initial messages are coalesced in a single frame
+        assert len(received) == 1
+        assert received[0]["type"] == "batch"
+        assert [msg["data"] for msg in received[0]["msgs"]] == ["e0", "e1"]
+
+        # later messages are sent on their own
+        e0 = pub_sub.ch_s[("entry", "e0")]
+        await e0.publish("e0'")
+        await e0.drain()
+        assert received[1]["data"] == "e0'"
+
+        # nothing is subscribed if a channel cannot be
+        with pytest.raises(UnregisteredChannel):
+            await pub_sub.subscribe_batch(
+                [(("entry", "e2"), None), (("index",), None)], viewer
+            )
+        assert ("entry", "e2") not in pub_sub.ch_s
+        assert len(received) == 2
+
+    asyncio.run(_run())
+
+
+def test_disconnect_subscriber():
+    async def _run():
+        pub_sub = ExtensiblePubSub()
+        emptied: List[PChannel] = []
+        disconnected: List[Any] = []
+
+        def _hook(ch: ChannelName) -> PChannel:
+            return Channel(
+                ch,
+                SubscriptionARes[Any],
+                on_empty=emptied.append,
+                max_queue_size=1,
+                overflow_policy="disconnect",
+                on_disconnect=disconnected.append,
+            )
+
+        pub_sub.register_hook(("entry",), _hook)
+
+        async def viewer(msg: Any):
+            pass
+
+        await pub_sub.subscribe(("entry", "e0"), viewer)
+        channel = pub_sub.ch_s[("entry", "e0")]
+        # the writer does not run until the publisher yields
+        for i in range(3):
+            await channel.publish(i)
+
+        # the subscriber's connection is asked to close, the channel is emptied
+        assert disconnected == [viewer]
+        assert emptied == [channel]
+        # the channel is dropped when the closing session unsubscribes
+        pub_sub.unsubscribe(("entry", "e0"), viewer)
+        assert ("entry", "e0") not in pub_sub.ch_s
+        assert emptied == [channel]
+
+    asyncio.run(_run())
@@ -0,0 +1,64 @@
+from .trie import SegmentTrie, is_pattern
+
+
+def test_segment_trie_mapping():
+    trie: SegmentTrie[int] = SegmentTrie()
+    trie[("a", "b")] = 1
+    trie[("a", "b", 1)] = 2
+    trie[("c",)] = 3
+    assert len(trie) == 3
+    assert trie[("a", "b", 1)] == 2
+    assert ("a",) not in trie
+    assert sorted(trie) == [("a", "b"), ("a", "b", 1), ("c",)]
+
+    del trie[("a", "b", 1)]
+    assert trie.get(("a", "b", 1)) is None
+    assert trie[("a", "b")] == 1
+    assert len(trie) == 2
+
+
+def test_segment_trie_longest_prefix():
+    trie: SegmentTrie[str] = SegmentTrie()
+    trie[("entry",)] = "entry"
+    trie[("entry", "d", "s")] = "split"
+    assert trie.longest_prefix(("entry", "d", "s", "e0")) == "split"
+    assert trie.longest_prefix(("entry", "d", "x", "e0")) == "entry"
+    assert trie.longest_prefix(("index",)) is None
+
+
+def test_segment_trie_match():
+    trie: SegmentTrie[int] = SegmentTrie()
+    channels = [
+        ("entry", "d", "s", "e0"),
+        ("entry", "d", "s", "e1"),
+        ("entry", "d", "t", "e0"),
+    ]
+    for idx, ch in enumerate(channels):
+        trie[ch] = idx
+
+    assert is_pattern(("entry", "d", "s", "*"))
+    assert not is_pattern(("entry", "d", "s", "e0"))
+    assert [idx for _, idx in trie.match(("entry", "d", "s", "*"))] == [0, 1]
+    assert [idx for _, idx in trie.match(("entry", "*", "*", "e0"))] == [0, 2]
+    assert [idx for _, idx in trie.match(("entry", "d", "**"))] == [0, 1, 2]
+    assert list(trie.match(("entry", "d", "s"))) == []
+
+
+def test_segment_trie_match_patterns():
+    trie: SegmentTrie[str] = SegmentTrie()
+    for pattern in [
+        ("entry", "d", "s", "*"),
+        ("entry", "*", "*", "e0"),
+        ("entry", "**"),
+        ("entry", "d", "s", "e1"),
+    ]:
+        trie[pattern] = "/".join(pattern)
+
+    assert sorted(trie.match_patterns(("entry", "d", "s", "e0"))) == [
+        "entry/**",
+        "entry/*/*/e0",
+        "entry/d/s/*",
+    ]
+    assert sorted(trie.match_patterns(("entry", "d", "t", "e1"))) == ["entry/**"]
+    # a tail wildcard matches one or more segments
+    assert list(trie.match_patterns(("entry",))) == []
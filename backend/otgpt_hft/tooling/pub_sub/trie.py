@@ -0,0 +1,164 @@
+"""Segment trie of channel names"""
+
+from typing import (
+    Any,
+    Dict,
+    Generic,
+    Iterator,
+    List,
+    MutableMapping,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+from .base import ChannelName
+
+# in a channel pattern, matches any single segment
+WILDCARD = "*"
+# at the end of a channel pattern, matches one or more segments
+TAIL_WILDCARD = "**"
+
+V = TypeVar("V")
+
+# no value at the node
+_UNSET: Any = object()
+
+
+def is_pattern(ch: ChannelName) -> bool:
+    return any(seg == WILDCARD or seg == TAIL_WILDCARD for seg in ch)
+
+
+class _Node(Generic[V]):
+    __slots__ = ("children", "value")
+
+    def __init__(self):
+        self.children: Dict[str | int, _Node[V]] = {}
+        self.value: V = _UNSET
+
+
+class SegmentTrie(MutableMapping[ChannelName, V]):
+    """Mapping of channel names, stored as a trie of their segments
+
+    Besides exact lookups, the trie finds the longest prefix of a channel name (for hooks),
+    the names matching a pattern, and the patterns matching a name, walking at most one path
+    per wildcard instead of probing every key.
+    """
+
+    def __init__(self):
+        self._root: _Node[V] = _Node()
+        self._len = 0
+
+    def _find(self, key: ChannelName) -> Optional[_Node[V]]:
+        node = self._root
+        for seg in key:
+            child = node.children.get(seg)
+            if child is None:
+                return None
+            node = child
+        return node
+
+    def __getitem__(self, key: ChannelName) -> V:
+        node = self._find(key)
+        if node is None or node.value is _UNSET:
+            raise KeyError(key)
+        return node.value
+
+    def __setitem__(self, key: ChannelName, value: V):
+        node = self._root
+        for seg in key:
+            child = node.children.get(seg)
+            if child is None:
+                child = node.children[seg] = _Node()
+            node = child
+        if node.value is _UNSET:
+            self._len += 1
+        node.value = value
+
+    def __delitem__(self, key: ChannelName):
+        path: List[Tuple[_Node[V], str | int]] = []
+        node = self._root
+        for seg in key:
+            child = node.children.get(seg)
+            if child is None:
+                raise KeyError(key)
+            path.append((node, seg))
+            node = child
+        if node.value is _UNSET:
+            raise KeyError(key)
+        node.value = _UNSET
+        self._len -= 1
+        # prune nodes left without value and children
+        for parent, seg in reversed(path):
+            child = parent.children[seg]
+            if child.value is not _UNSET or len(child.children) > 0:
+                break
+            del parent.children[seg]
+
+    def __iter__(self) -> Iterator[ChannelName]:
+        for key, _ in self._iter_items(self._root, ()):
+            yield key
+
+    def __len__(self) -> int:
+        return self._len
+
+    def _iter_items(
+        self, node: _Node[V], prefix: ChannelName
+    ) -> Iterator[Tuple[ChannelName, V]]:
+        if node.value is not _UNSET:
+            yield prefix, node.value
+        for seg, child in node.children.items():
+            yield from self._iter_items(child, (*prefix, seg))
+
+    def longest_prefix(self, ch: ChannelName) -> Optional[V]:
+        """value of the longest key which is a prefix of `ch` (or `ch` itself)"""
+        node = self._root
+        found: Optional[V] = None if node.value is _UNSET else node.value
+        for seg in ch:
+            child = node.children.get(seg)
+            if child is None:
+                break
+            node = child
+            if node.value is not _UNSET:
+                found = node.value
+        return found
+
+    def match(self, pattern: ChannelName) -> Iterator[Tuple[ChannelName, V]]:
+        """items whose key matches the pattern"""
+        yield from self._match(self._root, pattern, ())
+
+    def _match(
+        self, node: _Node[V], pattern: ChannelName, prefix: ChannelName
+    ) -> Iterator[Tuple[ChannelName, V]]:
+        if len(pattern) == 0:
+            if node.value is not _UNSET:
+                yield prefix, node.value
+            return
+        seg, rest = pattern[0], pattern[1:]
+        if seg == TAIL_WILDCARD:
+            for child_seg, child in node.children.items():
+                yield from self._iter_items(child, (*prefix, child_seg))
+        elif seg == WILDCARD:
+            for child_seg, child in node.children.items():
+                yield from self._match(child, rest, (*prefix, child_seg))
+        else:
+            child = node.children.get(seg)
+            if child is not None:
+                yield from self._match(child, rest, (*prefix, seg))
+
+    def match_patterns(self, ch: ChannelName) -> Iterator[V]:
+        """values of the keys which are patterns matching the channel name `ch`"""
+        yield from self._match_patterns(self._root, ch)
+
+    def _match_patterns(self, node: _Node[V], ch: ChannelName) -> Iterator[V]:
+        if len(ch) == 0:
+            if node.value is not _UNSET:
+                yield node.value
+            return
+        tail = node.children.get(TAIL_WILDCARD)
+        if tail is not None and tail.value is not _UNSET:
+            yield tail.value
+        for seg in (ch[0], WILDCARD):
+            child = node.children.get(seg)
+            if child is not None:
+                yield from self._match_patterns(child, ch[1:])
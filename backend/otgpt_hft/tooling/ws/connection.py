@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import asyncio
+import functools
 import logging
 from abc import ABC, abstractmethod
 from typing import (
@@ -10,9 +12,11 @@ from typing import (
     Callable,
     Dict,
     Generic,
+    Hashable,
     Literal,
     Optional,
     Protocol,
+    Set,
     Type,
     TypeVar,
     Union,
@@ -32,6 +36,9 @@ else:
 
 logger = logging.getLogger(__name__)
 
+# maximum number of fetch requests of a connection handled at once
+DEFAULT_MAX_CONCURRENT_FETCH = 8
+
 P = TypeVar("P", bound=Literal["F", "A"])
 T = TypeVar("T", bound=str)
 
@@ -70,6 +77,20 @@ class AFakePayloadBM(APayloadBM[Literal["fake"]]):
     type: Literal["fake"] = "fake"
 
 
+class EncodedPayload:
+    """Payload which is already encoded as JSON text
+
+    `TypedWebSocket` sends the text as is, so the same payload can be sent to many connections
+    without serializing it again.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+
 FQ = TypeVar("FQ", bound=FPayloadBM[Any])
 FS = TypeVar("FS", bound=FPayloadBM[Any])
 AQ = TypeVar("AQ", bound=APayloadBM[Any])
@@ -81,7 +102,7 @@ class AbsTypedWebSocket(ABC, Generic[FQ, FS, AQ, AS]):
 
     def accept(self) -> Awaitable[None]: ...
 
-    def send(self, msg: FS | AS) -> Awaitable[None]: ...
+    def send(self, msg: FS | AS | EncodedPayload) -> Awaitable[None]: ...
 
     def receive(self) -> Awaitable[FQ | AQ]: ...
 
@@ -99,7 +120,17 @@ class TypedWebSocket(AbsTypedWebSocket[FQ, FS, AQ, AS]):
     async def accept(self) -> None:
         await self.ws.accept()
 
-    async def send(self, msg: FS | AS) -> None:
+    async def send(self, msg: FS | AS | EncodedPayload) -> None:
+        if isinstance(msg, EncodedPayload):
+            logger.info(
+                {
+                    "msg": "ws-snd",
+                    "payload_text": msg.text,
+                }
+            )
+            await self.ws.send_text(msg.text)
+            return
+
         logger.info(
             {
                 "msg": "ws-snd",
@@ -154,12 +185,26 @@ class SessionError(Exception):
 
 class TypedWebSocketHandler(Generic[SSN, FQ, FS, AQ, AS], ABC):
     """Helper class for which provides a WebSocket connection handler `handle_ws`
-    and exposes a Python typehint interface."""
+    and exposes a Python typehint interface.
+
+    Async requests are handled in the order they are received. Fetch requests are handled
+    in background tasks, up to `max_concurrent_fetch` at once per connection, and their
+    responses are correlated by `FPayloadBM.id`. Fetch requests with the same
+    `fetch_order_key` are handled one at a time, in the order they are received.
+    """
 
     ReqType: TypeAdapter[FQ | AQ]
 
-    def __init__(self, logger: Logger) -> None:
+    def __init__(
+        self, logger: Logger, max_concurrent_fetch: int = DEFAULT_MAX_CONCURRENT_FETCH
+    ) -> None:
+        """
+        Args:
+            logger (Logger): handler logger
+            max_concurrent_fetch (int, optional): maximum number of fetch requests of a connection handled at once, further fetch requests wait for a free slot without blocking the reading of requests. Defaults to DEFAULT_MAX_CONCURRENT_FETCH.
+        """
         self.logger = logger
+        self.max_concurrent_fetch = max_concurrent_fetch
 
     @abstractmethod
     async def create_session(self, t_ws: AbsTypedWebSocket[FQ, FS, AQ, AS]) -> SSN: ...
@@ -178,6 +223,11 @@ class TypedWebSocketHandler(Generic[SSN, FQ, FS, AQ, AS], ABC):
         """return if the request is handled"""
         ...
 
+    def fetch_order_key(self, session: SSN, request: FQ) -> Optional[Hashable]:
+        """Fetch requests of a session with the same key are handled one at a time,
+        in the order they are received. None (default) orders the request with no other request."""
+        return None
+
     @final
     async def handle_t_ws(self, t_ws: AbsTypedWebSocket[FQ, FS, AQ, AS]):
         # acknowledge connection
@@ -192,11 +242,26 @@ class TypedWebSocketHandler(Generic[SSN, FQ, FS, AQ, AS], ABC):
             await t_ws.close(e.code, e.reason)
             return
 
+        fetch_slots = asyncio.Semaphore(self.max_concurrent_fetch)
+        fetch_tasks: Set[asyncio.Task[None]] = set()
+        # last fetch task of each order key
+        ordered_fetch_tasks: Dict[Hashable, asyncio.Task[None]] = {}
+        # resolved with the error of the first failed fetch
+        fetch_error: asyncio.Future[Exception] = (
+            asyncio.get_running_loop().create_future()
+        )
         try:
             while True:
                 try:
-                    # wait for a request from client
-                    req = await t_ws.receive()
+                    # wait for a request from client, or a failed fetch
+                    receive = asyncio.ensure_future(t_ws.receive())
+                    await asyncio.wait(
+                        (receive, fetch_error), return_when=asyncio.FIRST_COMPLETED
+                    )
+                    if fetch_error.done():
+                        receive.cancel()
+                        raise fetch_error.result()
+                    req = receive.result()
                 except WebSocketDisconnect as e:
                     t_ws_closed = True
                     # client disconnected
@@ -230,9 +295,32 @@ class TypedWebSocketHandler(Generic[SSN, FQ, FS, AQ, AS], ABC):
                     return
 
                 if req.p == "F":
-                    # TODO handle fetch and connection accept response in background
-                    res = await self.handle_fetch_request(t_ws, session, cast(FQ, req))
-                    await t_ws.send(res)
+                    fetch_req = cast(FQ, req)
+                    order_key = self.fetch_order_key(session, fetch_req)
+                    prev_task = (
+                        ordered_fetch_tasks.get(order_key)
+                        if order_key is not None
+                        else None
+                    )
+                    task = asyncio.create_task(
+                        self._handle_fetch(
+                            t_ws,
+                            session,
+                            fetch_req,
+                            prev_task,
+                            fetch_slots,
+                            fetch_error,
+                        )
+                    )
+                    fetch_tasks.add(task)
+                    task.add_done_callback(fetch_tasks.discard)
+                    if order_key is not None:
+                        ordered_fetch_tasks[order_key] = task
+                        task.add_done_callback(
+                            functools.partial(
+                                _remove_ordered_task, ordered_fetch_tasks, order_key
+                            )
+                        )
                 else:
                     assert req.p == "A"
                     handled = await self.handle_async_request(
@@ -247,14 +335,49 @@ class TypedWebSocketHandler(Generic[SSN, FQ, FS, AQ, AS], ABC):
                         )
                         return
         finally:
+            # fetches in progress are not cancelled, so they are never interrupted mid-write
+            if fetch_tasks:
+                await asyncio.wait(fetch_tasks)
             session.on_close()
             if not t_ws_closed:
                 await t_ws.close(code=1011)
 
+    async def _handle_fetch(
+        self,
+        t_ws: AbsTypedWebSocket[FQ, FS, AQ, AS],
+        session: SSN,
+        request: FQ,
+        prev_task: Optional[asyncio.Task[None]],
+        fetch_slots: asyncio.Semaphore,
+        fetch_error: asyncio.Future[Exception],
+    ):
+        try:
+            if prev_task is not None:
+                # wait for the previous request with the same order key,
+                # without holding a slot
+                await asyncio.wait((prev_task,))
+            async with fetch_slots:
+                res = await self.handle_fetch_request(t_ws, session, request)
+                await t_ws.send(res)
+        except Exception as e:
+            # connection is closed, like when the fetch is not handled in background
+            if not fetch_error.done():
+                fetch_error.set_result(e)
+
     async def handle_ws(self, ws: WebSocket):
         await self.handle_t_ws(TypedWebSocket(ws, self.ReqType))
 
 
+def _remove_ordered_task(
+    ordered_tasks: Dict[Hashable, asyncio.Task[None]],
+    order_key: Hashable,
+    task: asyncio.Task[None],
+):
+    """forget the task, unless a later task with the same key is queued"""
+    if ordered_tasks.get(order_key) is task:
+        del ordered_tasks[order_key]
+
+
 def combine_fa_req(
     FetchReqType: Type[FQ], AsyncReqType: Type[AQ]
 ) -> TypeAdapter[FQ | AQ]:
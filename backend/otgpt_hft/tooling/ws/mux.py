@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import asyncio
+import json
 import logging
 from asyncio import Future
 from typing import (
@@ -30,6 +31,7 @@ from .connection import (
     FS,
     AbsTypedWebSocket,
     APayloadBM,
+    EncodedPayload,
     FPayloadBM,
     PayloadBM,
     PSession,
@@ -132,7 +134,9 @@ class VirtualTypedWebSocket(AbsTypedWebSocket[FQ, FS, AQ, AS]):
     def queue_msg(self, r_msg: Any):
         """Used by creator for supplying the messages"""
         msg = self.ReqType.validate_python(r_msg)
-        if self.pending_receive is None:
+        if self.pending_receive is None or self.pending_receive.done():
+            # the handler may have cancelled a receive it no longer waits for
+            self.pending_receive = None
             self.msg_queue.append(msg)
         else:
             future = self.pending_receive
@@ -149,7 +153,15 @@ class VirtualTypedWebSocket(AbsTypedWebSocket[FQ, FS, AQ, AS]):
             )
         )
 
-    async def send(self, msg: FS | AS) -> None:
+    async def send(self, msg: FS | AS | EncodedPayload) -> None:
+        if isinstance(msg, EncodedPayload):
+            # wrap the encoded text as is, instead of decoding and encoding it again
+            await self.t_ws.send(
+                EncodedPayload(
+                    f'{{"p":"A","type":"msg","session":{json.dumps(self.session_id)},"msg":{msg.text}}}'
+                )
+            )
+            return
         await self.t_ws.send(MultiplexedMsg(session=self.session_id, msg=msg))
 
     def receive(self) -> Awaitable[FQ | AQ]:
@@ -161,7 +173,7 @@ class VirtualTypedWebSocket(AbsTypedWebSocket[FQ, FS, AQ, AS]):
             return future
         else:
             assert (
-                self.pending_receive is None
+                self.pending_receive is None or self.pending_receive.done()
             ), "cannot call receive_msg while future is pending"
             self.pending_receive = Future()
             return self.pending_receive
@@ -176,7 +188,7 @@ class VirtualTypedWebSocket(AbsTypedWebSocket[FQ, FS, AQ, AS]):
         await self.t_ws.send(CloseConnection(session=self.session_id, code=code))
 
     def cleanup(self, code: int = 1000, reason: Optional[str] = None):
-        if self.pending_receive is not None:
+        if self.pending_receive is not None and not self.pending_receive.done():
             self.pending_receive.set_exception(
                 WebSocketDisconnect(
                     code=code,
@@ -0,0 +1,160 @@
+import asyncio
+import logging
+from typing import Any, List, Literal, Optional
+
+from fastapi import WebSocketDisconnect
+from pydantic import TypeAdapter
+
+from .connection import (
+    AbsTypedWebSocket,
+    AFakePayloadBM,
+    FPayloadBM,
+    TypedWebSocketHandler,
+)
+from .mux import VirtualTypedWebSocket
+
+
+class SleepReq(FPayloadBM[Literal["sleep"]]):
+    type: Literal["sleep"] = "sleep"
+    delay_s: float
+    key: Optional[str] = None
+
+
+class SleepRes(FPayloadBM[Literal["sleep"]]):
+    type: Literal["sleep"] = "sleep"
+
+
+class FakeSession:
+    logger = logging.LoggerAdapter(logging.getLogger(__name__))
+
+    def on_close(self):
+        pass
+
+
+class FakeWebSocket(AbsTypedWebSocket[Any, Any, Any, Any]):
+    def __init__(self, requests: List[Any]):
+        self.req_session = {}
+        self.requests: asyncio.Queue[Any] = asyncio.Queue()
+        for request in requests:
+            self.requests.put_nowait(request)
+        self.sent: List[str] = []
+
+    async def accept(self):
+        pass
+
+    async def send(self, msg: Any):
+        self.sent.append(msg.id if isinstance(msg, SleepRes) else msg.type)
+
+    async def receive(self) -> Any:
+        request = await self.requests.get()
+        if request is None:
+            raise WebSocketDisconnect(1000)
+        return request
+
+    async def close(self, code: int = 1000, reason: Optional[str] = None):
+        pass
+
+
+class SleepHandler(TypedWebSocketHandler[Any, Any, Any, Any, Any]):
+    def __init__(self, max_concurrent_fetch: int):
+        super().__init__(
+            logging.LoggerAdapter(logging.getLogger(__name__)), max_concurrent_fetch
+        )
+        self.running = 0
+        self.max_running = 0
+
+    async def create_session(self, t_ws: Any) -> FakeSession:
+        return FakeSession()
+
+    def fetch_order_key(self, session: Any, request: SleepReq) -> Optional[str]:
+        return request.key
+
+    async def handle_fetch_request(
+        self, t_ws: Any, session: Any, request: SleepReq
+    ) -> SleepRes:
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(request.delay_s)
+        self.running -= 1
+        return SleepRes(id=request.id)
+
+    async def handle_async_request(self, t_ws: Any, session: Any, request: Any) -> bool:
+        await t_ws.send(request)
+        return True
+
+
+def run_handler(handler: SleepHandler, requests: List[Any]) -> List[str]:
+    async def _run():
+        t_ws = FakeWebSocket([*requests, None])
+        await handler.handle_t_ws(t_ws)
+        return t_ws.sent
+
+    return asyncio.run(_run())
+
+
+def test_handler_pipelined_fetch():
+    handler = SleepHandler(max_concurrent_fetch=8)
+    sent = run_handler(
+        handler,
+        [
+            SleepReq(id="slow", delay_s=0.05),
+            SleepReq(id="fast", delay_s=0),
+            AFakePayloadBM(),
+        ],
+    )
+    # slow fetch does not block later requests, and finishes before the connection closes
+    assert sorted(sent[:2]) == ["fake", "fast"]
+    assert sent[2] == "slow"
+
+
+def test_handler_fetch_order_key():
+    handler = SleepHandler(max_concurrent_fetch=8)
+    sent = run_handler(
+        handler,
+        [
+            SleepReq(id="a0", delay_s=0.05, key="a"),
+            SleepReq(id="b0", delay_s=0.02),
+            SleepReq(id="a1", delay_s=0, key="a"),
+        ],
+    )
+    assert sent == ["b0", "a0", "a1"]
+
+
+def test_handler_max_concurrent_fetch():
+    handler = SleepHandler(max_concurrent_fetch=2)
+    run_handler(handler, [SleepReq(id=str(i), delay_s=0.01) for i in range(6)])
+    assert handler.max_running == 2
+
+
+def test_handler_ordered_fetch_slots():
+    handler = SleepHandler(max_concurrent_fetch=2)
+    sent = run_handler(
+        handler,
+        [
+            *(SleepReq(id=f"a{i}", delay_s=0.05, key="a") for i in range(4)),
+            AFakePayloadBM(),
+            SleepReq(id="b0", delay_s=0),
+        ],
+    )
+    # fetches queued behind a slow one do not hold slots, nor block later requests
+    assert sent == ["fake", "b0", "a0", "a1", "a2", "a3"]
+
+
+def test_virtual_socket_cancelled_receive():
+    async def _run():
+        v_socket = VirtualTypedWebSocket[Any, Any, Any, Any](
+            t_ws=FakeWebSocket([]),
+            ReqType=TypeAdapter(SleepReq),
+            acceept_fetch_id="open",
+            channel="sleep",
+            logger=FakeSession.logger,
+        )
+        # the handler cancels its receive when a fetch fails
+        v_socket.receive().cancel()
+        v_socket.queue_msg({"p": "F", "id": "a", "delay_s": 0})
+        assert (await v_socket.receive()).id == "a"
+
+        v_socket.receive().cancel()
+        v_socket.cleanup(1001)
+
+    asyncio.run(_run())
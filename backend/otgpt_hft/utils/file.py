@@ -1,35 +1,80 @@
+import logging
+import os
 import pathlib
+from typing import Literal
 
 import aiofiles
 import aiofiles.os
 
+logger = logging.getLogger(__name__)
 
-async def safe_write_file(path: pathlib.Path, content: str):
-    # Create a temporary file path
-    temp_path = path.with_suffix(".tmp")
+_fsync = aiofiles.os.wrap(os.fsync)
+
+
+async def _atomic_write(
+    path: pathlib.Path,
+    content: str | bytes,
+    mode: Literal["w", "wb"],
+    durable: bool = False,
+):
+    """Write the content to a temporary file, then rename it over the file
+
+    Raises on failure, the file is then unchanged. A durable write fsyncs the file and its
+    directory, so the content is on disk once it returns, otherwise the content is verified
+    by reading it back.
+    """
+    # temporary file next to the file, e.g. `chunk_0000.jsonl.tmp` and `chunk_0000.idx.tmp`
+    temp_path = path.with_name(path.name + ".tmp")
+    read_mode = "rb" if mode == "wb" else "r"
 
     try:
-        # Write the content to the temporary file asynchronously
-        async with aiofiles.open(temp_path, mode="w") as temp_file:
+        async with aiofiles.open(temp_path, mode=mode) as temp_file:
             await temp_file.write(content)
+            if durable:
+                await temp_file.flush()
+                await _fsync(temp_file.fileno())
 
-        # Verify the file content by reading it
-        async with aiofiles.open(temp_path, mode="r") as temp_file:
-            new_content = await temp_file.read()
-
-        if new_content != content:
-            raise ValueError("File content verification failed.")
+        if not durable:
+            # Verify the file content by reading it
+            async with aiofiles.open(temp_path, mode=read_mode) as temp_file:
+                new_content = await temp_file.read()
+            if new_content != content:
+                raise ValueError("File content verification failed.")
 
         # Replace the original file with the temporary file asynchronously
         await aiofiles.os.rename(temp_path, path)
-
-    except Exception as e:
-        print(f"Error writing file: {e}")
     finally:
         # Clean up the temporary file if it exists asynchronously
         if await aiofiles.os.path.exists(temp_path):
             await aiofiles.os.remove(temp_path)
 
+    if durable:
+        # make the rename durable
+        dir_fd = os.open(path.parent, os.O_RDONLY)
+        try:
+            await _fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+async def safe_write_file(path: pathlib.Path, content: str):
+    """write the file atomically, a failure is logged and leaves the file unchanged"""
+    try:
+        await _atomic_write(path, content, "w")
+    except Exception as e:
+        logger.error({"msg": "error writing file", "path": path, "error": e})
+
+
+async def atomic_write_bytes(path: pathlib.Path, content: bytes):
+    """write the file atomically, raises on failure"""
+    await _atomic_write(path, content, "wb")
+
+
+async def durable_write_file(path: pathlib.Path, content: str):
+    """write the file atomically, raises on failure, the file and its directory are
+    fsynced, so the content is on disk once it returns"""
+    await _atomic_write(path, content, "w", durable=True)
+
 
 async def create_file_atomically(path: pathlib.Path, content: str):
     async with aiofiles.open(path, "x") as file:
@@ -0,0 +1,103 @@
+"""JSON patch (RFC 6902 subset: add, remove, replace) of JSON-able documents"""
+
+import copy
+from typing import Any, List, Literal
+
+from pydantic import BaseModel
+
+
+class PatchOp(BaseModel):
+    op: Literal["add", "remove", "replace"]
+    # JSON pointer (RFC 6901)
+    path: str
+    value: Any = None
+
+
+def _escape(token: str | int) -> str:
+    return str(token).replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def make_patch(old: Any, new: Any) -> List[PatchOp]:
+    """
+    Computes the operations which turn `old` into `new`.
+
+    Objects are diffed by key and arrays by index, so appending items to an array only adds
+    the new items.
+
+    Args:
+        old: The JSON-able document to patch.
+        new: The JSON-able target document.
+
+    Returns:
+        ops: The patch operations, empty if the documents are equal.
+    """
+    ops: List[PatchOp] = []
+    _diff(old, new, "", ops)
+    return ops
+
+
+def _diff(old: Any, new: Any, path: str, ops: List[PatchOp]):
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in old:
+            if key not in new:
+                ops.append(PatchOp(op="remove", path=f"{path}/{_escape(key)}"))
+        for key, value in new.items():
+            key_path = f"{path}/{_escape(key)}"
+            if key in old:
+                _diff(old[key], value, key_path, ops)
+            else:
+                ops.append(PatchOp(op="add", path=key_path, value=value))
+    elif isinstance(old, list) and isinstance(new, list):
+        common = min(len(old), len(new))
+        for idx in range(common):
+            _diff(old[idx], new[idx], f"{path}/{idx}", ops)
+        # remove from the end, so indices of the remaining items do not shift
+        for idx in range(len(old) - 1, common - 1, -1):
+            ops.append(PatchOp(op="remove", path=f"{path}/{idx}"))
+        for idx in range(common, len(new)):
+            ops.append(PatchOp(op="add", path=f"{path}/{idx}", value=new[idx]))
+    elif type(old) is not type(new) or old != new:
+        ops.append(PatchOp(op="replace", path=path, value=new))
+
+
+def apply_patch(doc: Any, ops: List[PatchOp]) -> Any:
+    """
+    Applies patch operations to a copy of a document.
+
+    Args:
+        doc: The JSON-able document to patch.
+        ops: The patch operations, as computed by `make_patch`.
+
+    Returns:
+        doc: The patched document.
+    """
+    doc = copy.deepcopy(doc)
+    for op in ops:
+        if op.path == "":
+            # whole document
+            doc = copy.deepcopy(op.value)
+            continue
+
+        *parent_tokens, last = [_unescape(token) for token in op.path.split("/")[1:]]
+        parent = doc
+        for token in parent_tokens:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+
+        if isinstance(parent, list):
+            idx = len(parent) if last == "-" else int(last)
+            if op.op == "add":
+                parent.insert(idx, copy.deepcopy(op.value))
+            elif op.op == "remove":
+                del parent[idx]
+            else:
+                parent[idx] = copy.deepcopy(op.value)
+        else:
+            if op.op == "remove":
+                del parent[last]
+            else:
+                parent[last] = copy.deepcopy(op.value)
+    return doc
@@ -0,0 +1,32 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from .file import atomic_write_bytes, safe_write_file
+
+
+def test_atomic_write_temp_files(tmp_path: Path):
+    async def _write():
+        # files differing by suffix are written concurrently
+        await asyncio.gather(
+            safe_write_file(tmp_path / "chunk_0000.jsonl", "entries" * 1000),
+            safe_write_file(tmp_path / "chunk_0000.idx", "index" * 1000),
+        )
+
+    asyncio.run(_write())
+    assert (tmp_path / "chunk_0000.jsonl").read_text() == "entries" * 1000
+    assert (tmp_path / "chunk_0000.idx").read_text() == "index" * 1000
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "chunk_0000.idx",
+        "chunk_0000.jsonl",
+    ]
+
+
+def test_atomic_write_failure(tmp_path: Path):
+    path = tmp_path / "missing" / "snapshot.pkl"
+    with pytest.raises(OSError):
+        asyncio.run(atomic_write_bytes(path, b"snapshot"))
+    # failure is logged
+    asyncio.run(safe_write_file(path, "chunk"))
+    assert not path.exists()
@@ -0,0 +1,31 @@
+from .json_patch import PatchOp, apply_patch, make_patch
+
+
+def test_make_patch():
+    old = {"id": "e0", "utts": [{"a/b": 1}, {"x": "y"}], "meta": {"k": True}}
+    new = {"id": "e0", "utts": [{"a/b": 2}, {"x": "y"}, {"x": "z"}], "meta": {}}
+
+    ops = make_patch(old, new)
+    assert ops == [
+        PatchOp(op="replace", path="/utts/0/a~1b", value=2),
+        PatchOp(op="add", path="/utts/2", value={"x": "z"}),
+        PatchOp(op="remove", path="/meta/k"),
+    ]
+    assert apply_patch(old, ops) == new
+    # the patched document is a copy
+    assert old["utts"][0] == {"a/b": 1}
+
+
+def test_make_patch_roundtrip():
+    docs = [
+        {"a": [1, 2, 3], "b": None},
+        {"a": [1], "b": {"c": [True]}},
+        {"a": [], "b": {"c": [1, "1"]}, "~": 0},
+        [1, 2],
+        "x",
+    ]
+    for old in docs:
+        for new in docs:
+            ops = make_patch(old, new)
+            assert apply_patch(old, ops) == new
+            assert (len(ops) == 0) == (old == new)
@@ -5,7 +5,6 @@ import { appState, pushAppState, routePrefix } from "@/lib/state";
 import { host, wsPtcl } from "@/lib/utils/host";
 import { HotReloader } from "@/lib/utils/reload";
 import { cn } from "@/lib/utils/utils";
-import { TypedWebSocket } from "@/lib/utils/ws/connection";
 import { createRoot } from "react-dom/client";
 
 HotReloader.install(module, function () {
@@ -50,7 +49,7 @@ appState.onChange = render;
 // const wsMux = new WSMultiplexer();
 // wsMux.connectVirtualConnection(G_data_bridge, "data-bridge");
 
-TypedWebSocket.createConnection(G_dataBridge, wsPtcl + host + routePrefix + "/api/ws-connect/data-bridge");
+G_dataBridge.connect(wsPtcl + host + routePrefix + "/api/ws-connect/data-bridge");
 
 if (appState.current.menu === null) {
     console.log(appState);
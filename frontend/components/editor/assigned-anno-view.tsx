@@ -49,11 +49,7 @@ export function AssignedAnno(_: AssignedAnnoProps) {
     useEffect(() => {
         if (entryChannel !== null) {
             const hookId = G_dataBridge.hookSetter(entryChannel, (se: SerializedEntry) => {
-                const dialogueGraph = new DialogueGraph(se);
-                setDialogueGraph(dialogueGraph);
-                // NOTE: currently hard-coded to only displaying root node
-                // TODO: add support for annotating data beyond root node
-                setDialoguePath([dialogueGraph.root.unit.id]);
+                setDialogueGraph(new DialogueGraph(se));
             });
             return () => {
                 G_dataBridge.unhookSetter(hookId);
@@ -63,6 +59,16 @@ export function AssignedAnno(_: AssignedAnnoProps) {
         }
     }, [entryChannel]);
 
+    useEffect(() => {
+        if (dialogueGraph !== null && response !== null) {
+            // path to the annotated node, whose next utterances are compared
+            const nodeId = response.ref.node ?? dialogueGraph.root.unit.id;
+            if (dialogueGraph.nodes[nodeId] !== undefined) {
+                setDialoguePath(dialogueGraph.pathTo(nodeId));
+            }
+        }
+    }, [dialogueGraph, response]);
+
     let topLeftPanel = pleaseWait;
     let topRightPanel = pleaseWait;
     let bottomLeftPanel = pleaseWait;
@@ -46,6 +46,17 @@ export class DialogueGraph {
         }
     }
 
+    pathTo(nodeId: InstanceId): DialoguePath {
+        const path: DialoguePath = [nodeId];
+        let unit = this.nodes[nodeId].unit;
+        while (unit !== this.root.unit) {
+            const prevId = (unit as AnyUtterance).prev_id;
+            path.push(prevId);
+            unit = this.nodes[prevId].unit;
+        }
+        return path.reverse();
+    }
+
     walk(guidePath: DialoguePath | null): DialoguePath {
         const path: DialoguePath = [this.root.unit.id];
         let node = this.root;
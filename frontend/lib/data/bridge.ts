@@ -1,6 +1,14 @@
 import assert from "../utils/assert";
-import { FPayload, ITypedWebSocket, IWebSocketConnection, WSConn } from "../utils/ws/connection";
-import { Channel, PubSub, SubscriptionAReq, SubscriptionARes } from "../utils/ws/pubsub";
+import { FPayload, ITypedWebSocket, IWebSocketConnection, TypedWebSocket, WSConn } from "../utils/ws/connection";
+import {
+    BatchSubscriptionAReq,
+    BatchSubscriptionARes,
+    Channel,
+    PubSub,
+    SubscriptionAReq,
+    SubscriptionARes,
+    SubscriptionPatchARes,
+} from "../utils/ws/pubsub";
 import { DB_ResponseCmp } from "./model/cmp";
 
 
@@ -15,6 +23,8 @@ export type AnnoRef = {
     entry: string
     idx: number
     cmpId: string | null
+    // annotated (branching) node, root node if not given
+    node?: string | null
 }
 export type AssignedAnnoReq = FPayload<"assigned-anno"> & {
     ref: AnnoRef | null
@@ -36,8 +46,8 @@ export type AnnoCmpRes = FPayload<"anno-cmp"> & {
 
 type FetchReqPayload = WhoAmIReq | AssignedAnnoReq | AnnoCmpReq;
 type FetchResPayload = WhoAmIRes | AssignedAnnoRes | AnnoCmpRes;
-type AsyncReqPayload = SubscriptionAReq;
-type AsyncResPayload = SubscriptionARes;
+type AsyncReqPayload = SubscriptionAReq | BatchSubscriptionAReq;
+type AsyncResPayload = SubscriptionARes | SubscriptionPatchARes | BatchSubscriptionARes;
 
 export type DBConn = WSConn<FetchReqPayload, FetchResPayload, AsyncReqPayload, AsyncResPayload>
 
@@ -51,13 +61,22 @@ export type Item = {
     channel: string
 }
 
+// close code of a connection which fell behind its subscriptions, see `SUB_DISCONNECT_CLOSE_CODE`
+const SUB_DISCONNECT_CLOSE_CODE = 4001;
+
 export class DataBridge implements IWebSocketConnection<DBConn> {
     private ws: ITypedWebSocket<DBConn>;
+    private url: string | null = null;
     private ready: boolean = false;
     private onready: (() => Promise<void>)[] = [];
     private pubSub: PubSub<DBConn> = new PubSub();
     public uname: string;
 
+    connect(url: string) {
+        this.url = url;
+        TypedWebSocket.createConnection(this, url);
+    }
+
     oncreate(ws: ITypedWebSocket<DBConn>) {
         this.ws = ws;
     }
@@ -124,6 +143,11 @@ export class DataBridge implements IWebSocketConnection<DBConn> {
             console.log("cannot connect, not logged in");
         }
         console.log("DB closed");
+        if (e.code === SUB_DISCONNECT_CLOSE_CODE && this.url !== null) {
+            // the server dropped a subscription which fell behind, resume from a new connection
+            this.pubSub.ondisconnect();
+            this.connect(this.url);
+        }
     }
 }
 export const G_dataBridge = new DataBridge();
\ No newline at end of file
@@ -0,0 +1,22 @@
+import { applyPatch } from "./json-patch";
+
+describe("applyPatch", () => {
+    test("should apply add, remove and replace", () => {
+        const doc = { id: "e0", utts: [{ "a/b": 1 }, { x: "y" }], meta: { k: true } };
+        const patched = applyPatch(doc, [
+            { op: "replace", path: "/utts/0/a~1b", value: 2 },
+            { op: "add", path: "/utts/2", value: { x: "z" } },
+            { op: "remove", path: "/meta/k" },
+        ]);
+        expect(patched).toEqual({ id: "e0", utts: [{ "a/b": 2 }, { x: "y" }, { x: "z" }], meta: {} });
+    });
+
+    test("should not modify the document", () => {
+        const doc = { utts: [{ x: "y" }, { x: "z" }] };
+        const patched = applyPatch(doc, [{ op: "replace", path: "/utts/0/x", value: "w" }]);
+        expect(doc.utts[0].x).toBe("y");
+        expect(patched.utts[0]).not.toBe(doc.utts[0]);
+        // untouched items are shared
+        expect(patched.utts[1]).toBe(doc.utts[1]);
+    });
+});
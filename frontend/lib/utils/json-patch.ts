@@ -0,0 +1,55 @@
+// JSON patch (RFC 6902 subset: add, remove, replace), as published by the backend's delta channels
+
+export type PatchOp = {
+    op: "add" | "remove" | "replace"
+    // JSON pointer (RFC 6901)
+    path: string
+    value?: any
+};
+
+function unescape(token: string): string {
+    return token.replace(/~1/g, "/").replace(/~0/g, "~");
+}
+
+function applyOp(doc: any, tokens: string[], op: PatchOp): any {
+    if (tokens.length === 0) {
+        // whole document
+        return op.value;
+    }
+    const [token, ...rest] = tokens;
+    if (doc instanceof Array) {
+        const copy = [...doc];
+        const idx = token === "-" ? copy.length : parseInt(token);
+        if (rest.length > 0) {
+            copy[idx] = applyOp(copy[idx], rest, op);
+        } else if (op.op === "add") {
+            copy.splice(idx, 0, op.value);
+        } else if (op.op === "remove") {
+            copy.splice(idx, 1);
+        } else {
+            copy[idx] = op.value;
+        }
+        return copy;
+    }
+    const copy = { ...doc };
+    if (rest.length > 0) {
+        copy[token] = applyOp(copy[token], rest, op);
+    } else if (op.op === "remove") {
+        delete copy[token];
+    } else {
+        copy[token] = op.value;
+    }
+    return copy;
+}
+
+/**
+ * Applies patch operations to a document, the document is not modified.
+ * Objects and arrays along the patched paths are copied, the rest is shared with the document.
+ */
+export function applyPatch(doc: any, ops: PatchOp[]): any {
+    for (const op of ops) {
+        const tokens = op.path === "" ? [] : op.path.split("/").slice(1).map(unescape);
+        doc = applyOp(doc, tokens, op);
+    }
+    return doc;
+}
@@ -1,58 +1,133 @@
 import assert from "../assert";
+import { PatchOp, applyPatch } from "../json-patch";
 import { APayload, ITypedWebSocket, WSConn } from "./connection";
 
 export type Channel = string;
 
 export type SubscriptionAReq = APayload<"sub" | "unsub"> & {
     channel: Channel;
+    // version last received on the channel, to resume from on "sub"
+    version?: number | null;
 }; export type SubscriptionARes = APayload<"sub"> & {
     channel: Channel;
     data: any;
+    // sequence number of the message
+    version?: number | null;
+};
+// patch turning the data of version `base` into version `version`
+export type SubscriptionPatchARes = APayload<"patch"> & {
+    channel: Channel;
+    base: number;
+    version: number;
+    ops: PatchOp[];
+};
+// requests applied at once, initial messages of the subscribed channels come in one "batch"
+export type BatchSubscriptionAReq = APayload<"batch"> & {
+    reqs: SubscriptionAReq[];
+};
+export type BatchSubscriptionARes = APayload<"batch"> & {
+    msgs: APayload<string>[];
 };
 
-type Callback<T> = (data: T) => void
+// `channel` is the channel of the data, which differs from the subscribed channel for patterns
+type Callback<T> = (data: T, channel: Channel) => void
 
+// in a channel pattern, "*" matches any segment, and a trailing "**" the remaining segments
+export function isPattern(channel: Channel): boolean {
+    return channel.split("/").some((seg) => seg === "*" || seg === "**");
+}
 
-type PSConn = WSConn<any, any, SubscriptionAReq, SubscriptionARes>
+export function matchChannel(pattern: Channel, channel: Channel): boolean {
+    const patternSegs = pattern.split("/");
+    const segs = channel.split("/");
+    for (let i = 0; i < patternSegs.length; i++) {
+        if (patternSegs[i] === "**") {
+            return segs.length > i;
+        }
+        if (i >= segs.length || (patternSegs[i] !== "*" && patternSegs[i] !== segs[i])) {
+            return false;
+        }
+    }
+    return segs.length === patternSegs.length;
+}
+
+
+type PSConn = WSConn<
+    any, any,
+    SubscriptionAReq | BatchSubscriptionAReq,
+    SubscriptionARes | SubscriptionPatchARes | BatchSubscriptionARes
+>
 
 export class PubSub<TVWS extends PSConn> {
     private id2Callback = new Map<number, [Channel, Callback<any>]>();
     private ch2Callbacks = new Map<Channel, Callback<any>[]>();
+    // subscribed patterns
+    private patterns = new Set<Channel>();
     private chCache = new Map<Channel, any>();
+    // version of the cached data, null while waiting for a snapshot
+    private chVersion = new Map<Channel, number | null>();
     private pendingSubReq: Channel[] | null = [];
     private vs: ITypedWebSocket<TVWS> | null = null;
     private idCounter: number = 0;
 
     onconnect(vs: ITypedWebSocket<TVWS>) {
-        assert(this.pendingSubReq instanceof Array, "onconnect can only be called once");
+        assert(this.pendingSubReq instanceof Array, "onconnect can only be called once per connection");
         this.vs = vs;
-        for (const channel of this.pendingSubReq) {
-            this.vs.sendAsyncRequest({ p: "A", type: "sub", channel });
+        if (this.pendingSubReq.length > 0) {
+            const reqs = this.pendingSubReq.map((channel) => this.subReq(channel));
+            this.vs.sendAsyncRequest({ p: "A", type: "batch", reqs });
         }
         this.pendingSubReq = null;
     }
 
+    /**
+     * The connection is lost, subscriptions are sent again with the next `onconnect`,
+     * resuming from the versions last received.
+     */
+    ondisconnect() {
+        this.vs = null;
+        this.pendingSubReq = [...this.ch2Callbacks.keys()];
+    }
+
     sub(channel: Channel, callback: Callback<any>): number {
         this.id2Callback.set(this.idCounter, [channel, callback]);
         let callbacks = this.ch2Callbacks.get(channel);
         if (callbacks === undefined) {
             callbacks = [];
             this.ch2Callbacks.set(channel, callbacks);
+            if (isPattern(channel)) {
+                this.patterns.add(channel);
+            }
             if (this.vs === null) {
                 this.pendingSubReq.push(channel);
             } else {
-                this.vs.sendAsyncRequest({ p: "A", type: "sub", channel });
+                this.sendSubReq(channel);
+            }
+            // data of an earlier subscription is brought up to date by the missed patches
+            const data = this.chCache.get(channel);
+            if (data !== undefined && this.chVersion.get(channel) != null) {
+                setImmediate(() => callback(data, channel));
             }
         } else {
             const data = this.chCache.get(channel);
             if (data !== undefined) {
-                setImmediate(() => callback(data));
+                setImmediate(() => callback(data, channel));
             }
         }
         callbacks.push(callback);
         return this.idCounter++;
     }
 
+    private subReq(channel: Channel): SubscriptionAReq {
+        // resume from the cached data, unless waiting for a snapshot
+        const version = this.chVersion.get(channel) ?? null;
+        return { p: "A", type: "sub", channel, version };
+    }
+
+    private sendSubReq(channel: Channel) {
+        this.vs.sendAsyncRequest(this.subReq(channel));
+    }
+
     unsub(subId: number): void {
         const [channel, callback] = this.id2Callback.get(subId);
         this.id2Callback.delete(subId);
@@ -60,6 +135,7 @@ export class PubSub<TVWS extends PSConn> {
         callbacks.splice(callbacks.indexOf(callback), 1);
         if (callbacks.length === 0) {
             this.ch2Callbacks.delete(channel);
+            this.patterns.delete(channel);
             if (this.vs === null) {
                 // NOTE: if this.vs is null, then we have not connected, yet.
                 // TODO: properly handle disconnection, now we assuem that
@@ -75,13 +151,72 @@ export class PubSub<TVWS extends PSConn> {
         }
     }
 
+    private getCallbacks(channel: Channel): Callback<any>[] {
+        const callbacks = [...(this.ch2Callbacks.get(channel) || [])];
+        for (const pattern of this.patterns) {
+            if (matchChannel(pattern, channel)) {
+                callbacks.push(...this.ch2Callbacks.get(pattern));
+            }
+        }
+        return callbacks;
+    }
+
+    private resubscribe(channel: Channel) {
+        this.vs.sendAsyncRequest({
+            p: "A",
+            type: "batch",
+            reqs: [
+                { p: "A", type: "unsub", channel },
+                { p: "A", type: "sub", channel },
+            ],
+        });
+    }
+
     handleReponse(r: APayload<string>): boolean {
         if (r.type === "sub") {
             const res = r as SubscriptionARes;
-            for (const cb of this.ch2Callbacks.get(res.channel) || []) {
-                cb(res.data);
+            for (const cb of this.getCallbacks(res.channel)) {
+                cb(res.data, res.channel);
             }
             this.chCache.set(res.channel, res.data);
+            this.chVersion.set(res.channel, res.version ?? null);
+            return true;
+        }
+        if (r.type === "patch") {
+            const res = r as SubscriptionPatchARes;
+            const version = this.chVersion.get(res.channel);
+            if (version === null || version === undefined) {
+                // waiting for a snapshot
+                return true;
+            }
+            if (version !== res.base) {
+                // a patch was missed, resubscribe for a snapshot
+                this.chVersion.set(res.channel, null);
+                if (this.ch2Callbacks.has(res.channel)) {
+                    this.resubscribe(res.channel);
+                } else {
+                    // followed through patterns, which resend all their channels
+                    for (const pattern of this.patterns) {
+                        if (matchChannel(pattern, res.channel)) {
+                            this.resubscribe(pattern);
+                        }
+                    }
+                }
+                return true;
+            }
+            const data = applyPatch(this.chCache.get(res.channel), res.ops);
+            for (const cb of this.getCallbacks(res.channel)) {
+                cb(data, res.channel);
+            }
+            this.chCache.set(res.channel, data);
+            this.chVersion.set(res.channel, res.version);
+            return true;
+        }
+        if (r.type === "batch") {
+            const res = r as BatchSubscriptionARes;
+            for (const msg of res.msgs) {
+                this.handleReponse(msg);
+            }
             return true;
         }
     }